@@ -1,25 +1,285 @@
-from flask import Flask, jsonify, render_template, request, url_for, redirect
+import hashlib
+import json
+import os
+from collections.abc import Mapping
+from datetime import datetime, timezone
+import click
+from flask import (Flask, Response, abort, jsonify, make_response, render_template,
+                   request, send_file, url_for, redirect)
+from flask.json.provider import DefaultJSONProvider
 from data_manager.json_data_manager import JSONDataManager
+from data_manager.query import check_query
+from data_manager.shared_snapshot import SharedSnapshotDataManager
+from metrics import InstrumentedDataManager, MetricsRegistry, instrument_app
+from movie_importer import MovieImporter, read_rows
+from omdb_cache import OMDbCache
+from omdb_client import OMDbClient
+from page_cache import PageCache
+from poster_cache import SIZES, PosterCache
+from enrichment import PLACEHOLDER_POSTER, EnrichmentQueue
 import requests
 
 API_KEY = "d4ba49c2"
-URL = f"http://www.omdbapi.com/?apikey={API_KEY}&t="
+MOVIES_PER_PAGE = 60
+# The query arguments of a paginated movie list, see movie_query()
+FILTER_ARGS = ('year_min', 'year_max', 'min_rating', 'director')
+
+class JSONProvider(DefaultJSONProvider):
+    """Serializes movies kept as read-only Mappings, such as CompactMovie."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Mapping):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
+
+
+def open_data_manager():
+    """
+    Open the storage of users and movies.
+
+    Set SHARED_SNAPSHOT to a snapshot file to have the worker processes of
+    a server map one shared copy of the data instead of each decoding
+    users.json; the snapshot is created from users.json on first start.
+
+    Returns:
+        DataManagerInterface: The data manager.
+    """
+    snapshot = os.environ.get('SHARED_SNAPSHOT')
+    if snapshot:
+        return SharedSnapshotDataManager(snapshot, source='users.json')
+    return JSONDataManager('users.json', cache=True)
+
 
 app = Flask(__name__)
-data_manager = JSONDataManager('users.json')
+app.json = JSONProvider(app)
+metrics = MetricsRegistry()
+instrument_app(app, metrics)
+data_manager = InstrumentedDataManager(open_data_manager(), metrics)
+omdb_client = OMDbClient(API_KEY, cache=OMDbCache('omdb_cache.sqlite'),
+                         on_attempt=lambda seconds, outcome: metrics.observe(
+                             'moviweb_omdb_request_duration_seconds', seconds,
+                             outcome=outcome))
+enrichment = EnrichmentQueue('enrichment.sqlite', data_manager, omdb_client.find_movie)
+poster_cache = PosterCache('poster_cache')
+# Set PAGE_CACHE_DIR to share rendered pages between worker processes
+page_cache = PageCache(directory=os.environ.get('PAGE_CACHE_DIR'))
+metrics.describe('moviweb_omdb_request_duration_seconds',
+                 'Latency of HTTP requests to OMDb by outcome.')
+metrics.add_collector(lambda: [
+    ('moviweb_omdb_cache_lookups_total', 'counter', 'OMDb cache lookups by result.',
+     [({'result': 'hit'}, omdb_client.cache.hits),
+      ({'result': 'miss'}, omdb_client.cache.misses)]),
+    ('moviweb_page_cache_lookups_total', 'counter', 'Rendered page cache lookups by result.',
+     [({'result': 'hit'}, page_cache.hits),
+      ({'result': 'miss'}, page_cache.misses)]),
+    ('moviweb_page_cache_size', 'gauge', 'Characters of rendered HTML kept in memory.',
+     [({}, page_cache.size)])])
+
+
+@app.before_request
+def start_enrichment():
+    """
+    Start the enrichment workers with the first request rather than on
+    import, so CLI commands such as import-movies don't run them.
+    """
+    enrichment.start()
+
+
+@app.before_request
+def pin_data():
+    """Let each request read one version of the data from start to end."""
+    data_manager.pin()
+
+
+@app.teardown_request
+def unpin_data(error=None):
+    """Release the version pinned for the request."""
+    data_manager.unpin()
+
+
+def page_validators(page, version):
+    """
+    Derive a page's strong ETag and Last-Modified date from a data version.
+
+    Versions are nanosecond timestamps of the last change, so they also
+    give the modification date.
+
+    Args:
+        page (str): A name telling the pages apart, e.g. "home".
+        version (int): The version of the data the page shows.
+
+    Returns:
+        tuple: The ETag value and the Last-Modified datetime.
+    """
+    return f"{page}-{version}", datetime.fromtimestamp(version // 10**9, timezone.utc)
+
+
+def not_modified(etag, last_modified):
+    """
+    Answer a conditional request whose cached copy is still current.
+
+    If-None-Match takes precedence over If-Modified-Since, as in RFC 9110.
+
+    Args:
+        etag (str): The current ETag of the page.
+        last_modified (datetime): The current Last-Modified date of the page.
+
+    Returns:
+        Response: A 304 response, or None if the page must be rendered.
+    """
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif request.if_modified_since:
+        fresh = request.if_modified_since >= last_modified
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return with_validators(Response(status=304), etag, last_modified)
+
+
+def with_validators(response, etag, last_modified):
+    """
+    Add validators to a response, so browsers revalidate their copy.
+
+    Args:
+        response: Anything a view may return.
+        etag (str): The ETag of the page.
+        last_modified (datetime): The Last-Modified date of the page.
+
+    Returns:
+        Response: The response with ETag, Last-Modified and Cache-Control.
+    """
+    response = make_response(response)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def page_name(page, movie_filter, sort, cursor):
+    """
+    Tell apart the pages of a paginated movie list.
+
+    Only the filter, sort and cursor go into the name, converted the way
+    query_movies() converts them, so other query arguments and other
+    spellings of the same values don't add pages to the cache.
+
+    Args:
+        page (str): The name of the route's page, e.g. "home".
+        movie_filter (dict), sort (str), cursor (str): As returned by
+            movie_query().
+
+    Returns:
+        str: The name for the page cache and the ETag.
+    """
+    try:
+        movie_filter = check_query(movie_filter, sort, MOVIES_PER_PAGE)
+    except ValueError:
+        abort(400)
+    if not movie_filter and sort == 'rating' and cursor is None:
+        return page
+    key = json.dumps([sorted(movie_filter.items()), sort, cursor])
+    return f"{page}-{hashlib.sha256(key.encode()).hexdigest()[:16]}"
+
+
+def movie_query():
+    """
+    Read the filter, sort and cursor of a paginated movie list from the
+    query string.
+
+    Query Args:
+        year_min (int), year_max (int): The range of release years.
+        min_rating (float): The lowest rating shown.
+        director (str): Only show the movies of this director.
+        sort (str): "rating", the default, "year" or "name".
+        cursor (str): Where the page starts, from the previous page's link.
+
+    Returns:
+        tuple: The filter, sort and cursor for query_movies().
+    """
+    movie_filter = {name: request.args[name] for name in FILTER_ARGS
+                    if request.args.get(name)}
+    return movie_filter, request.args.get('sort', 'rating'), request.args.get('cursor')
+
+
+def page_links(next_cursor, **values):
+    """
+    Link to the first and next page of a paginated movie list, keeping
+    the filter and sort of the current page.
+
+    Args:
+        next_cursor (str): The next_cursor returned by query_movies().
+        values: The URL values of the current route.
+
+    Returns:
+        tuple: The URL of the first page, or None on the first page, and
+        the URL of the next page, or None on the last page.
+    """
+    args = {name: request.args[name] for name in FILTER_ARGS + ('sort',)
+            if request.args.get(name)}
+    cursor = request.args.get('cursor')
+    first_url = url_for(request.endpoint, **{**args, **values}) if cursor else None
+    next_url = (url_for(request.endpoint, **{**args, **values, 'cursor': next_cursor})
+                if next_cursor else None)
+    return first_url, next_url
+
+
+@app.template_global()
+def poster_src(poster, size='card'):
+    """
+    Point a template at the local copy of a poster.
+
+    Args:
+        poster (str): The poster URL as stored with the movie.
+        size (str): The thumbnail size, a key of poster_cache.SIZES.
+
+    Returns:
+        str: The /posters URL for remote posters, the placeholder for
+        missing ones, else the stored value.
+    """
+    if not poster or poster == 'N/A':
+        return PLACEHOLDER_POSTER
+    if not poster.startswith(('http://', 'https://')):
+        return poster
+    token = poster_cache.register(poster)
+    if token is None:
+        # Only posters on the OMDb image hosts are downloaded
+        return PLACEHOLDER_POSTER
+    return url_for('poster', token=token, size=size)
 
 
 @app.route('/')
 def home():
     """
-    Home page route.
+    Home page route, listing the distinct movies of all users a page at a
+    time. See movie_query() for the query arguments.
 
     Returns:
-        list: List of all movies in the database
+        str: A rendered page of movies.
     """
-    # Create the movie_list
-    movie_list = data_manager.create_movie_list()
-    return render_template('home.html', movies=movie_list)
+    movie_filter, sort, cursor = movie_query()
+    page = page_name('home', movie_filter, sort, cursor)
+    version = data_manager.get_data_version()
+    etag, last_modified = page_validators(page, version)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+
+    def render():
+        movies = data_manager.query_movies({**movie_filter, 'distinct': True}, sort,
+                                           MOVIES_PER_PAGE, cursor)
+        first_url, next_url = page_links(movies['next_cursor'])
+        return render_template('home.html', movies=movies['movies'],
+                               first_url=first_url, next_url=next_url)
+
+    # Query the movies only when the page isn't cached for this version
+    try:
+        html = page_cache.render(page, version, render)
+    except ValueError:
+        abort(400)
+    return with_validators(html, etag, last_modified)
 
 
 @app.route('/users')
@@ -30,14 +290,20 @@ def list_users():
     Returns:
         str: A rendered template with user data.
     """
+    etag, last_modified = page_validators('users', data_manager.get_data_version())
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
     users = data_manager.get_all_users()
-    return render_template('users.html', users=users), 200
+    return with_validators((render_template('users.html', users=users), 200),
+                           etag, last_modified)
 
 
 @app.route('/users/<int:user_id>', methods=['GET'])
 def user_movies(user_id):
     """
-    Route for displaying a user's movies.
+    Route for displaying a user's movies a page at a time. See
+    movie_query() for the query arguments.
 
     Args:
         user_id (int): The ID of the user.
@@ -45,11 +311,28 @@ def user_movies(user_id):
     Returns:
         str: A rendered template with user and movie data.
     """
-    user = data_manager.get_user_by_id(user_id)
-    if user:
-        movies = data_manager.get_user_movies(user_id)
-        return render_template('user_movies.html', user=user, movies=movies, user_id=user_id), 201
-    return "User not found"
+    movie_filter, sort, cursor = movie_query()
+    page = page_name(f'user-{user_id}', movie_filter, sort, cursor)
+    version = data_manager.get_user_version(str(user_id))
+    etag, last_modified = page_validators(page, version)
+    cached = not_modified(etag, last_modified)
+    if cached:
+        return cached
+    html = page_cache.get(page, version)
+    if html is None:
+        user = data_manager.get_user_by_id(user_id)
+        if not user:
+            return "User not found"
+        try:
+            movies = data_manager.query_movies({**movie_filter, 'user_id': str(user_id)},
+                                               sort, MOVIES_PER_PAGE, cursor)
+        except ValueError:
+            abort(400)
+        first_url, next_url = page_links(movies['next_cursor'], user_id=user_id)
+        html = render_template('user_movies.html', user=user, movies=movies['movies'],
+                               user_id=user_id, first_url=first_url, next_url=next_url)
+        page_cache.set(page, version, html)
+    return with_validators((html, 201), etag, last_modified)
 
 
 @app.route('/add_user', methods=['GET', 'POST'])
@@ -86,14 +369,37 @@ def add_movie(user_id):
             director = request.form['director']
             year = int(request.form['year'])
             rating = float(request.form['rating'])
-            poster = find_movie_in_api(name)["Poster"]
-            data_manager.add_user_movie(
-                str(user_id), name, director, year, rating, poster)
+            # Save right away, the poster is looked up in the background
+            movies = data_manager.add_user_movie(
+                str(user_id), name, director, year, rating, PLACEHOLDER_POSTER)
+            movie_id = newest_movie_id(movies)
+            if movie_id is not None:
+                enrichment.enqueue(str(user_id), movie_id, name)
             return redirect(url_for('user_movies', user_id=user_id))
         return render_template('add_movie.html', user=user, user_id=user_id)
     return "User not found"
 
 
+def newest_movie_id(movies):
+    """
+    Find the ID of the movie just added, which is the highest one.
+
+    Args:
+        movies: The user's movies as returned by add_user_movie, a dict
+            keyed by movie ID or a list of movies with an "id".
+
+    Returns:
+        str: The movie ID, or None if adding the movie failed.
+    """
+    if isinstance(movies, dict):
+        movie_ids = movies.keys()
+    elif isinstance(movies, list):
+        movie_ids = [movie["id"] for movie in movies]
+    else:
+        return None
+    return max(movie_ids, key=int, default=None)
+
+
 @app.route('/users/<int:user_id>/update_movie/<int:movie_id>', methods=['GET', 'POST'])
 def update_movie(user_id, movie_id):
     """
@@ -154,10 +460,138 @@ def delete_movie(user_id, movie_id):
     return "User or movie not found"
 
 
+@app.route('/batch', methods=['POST'])
+def batch():
+    """
+    Route for applying many changes at once, for imports and cleanups.
+
+    The JSON body holds an "operations" list, see
+    data_manager.batch.check_operations. The operations are saved with one
+    write, all or none of them.
+
+    Returns:
+        Response: A JSON object with the per-operation "results", or with an
+        "error" and status 400 if nothing was changed.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    try:
+        results = data_manager.apply(body.get("operations"))
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+    return jsonify({"results": results})
+
+
+@app.route('/posters/<token>')
+def poster(token):
+    """
+    Route for a poster, downloaded once and then served from disk.
+
+    Posters never change under a token, so they may be cached for a year.
+    Range and conditional requests are answered by send_file.
+
+    Args:
+        token (str): The token poster_src() registered the poster URL under.
+
+    Query Args:
+        size (str): A thumbnail size, the original poster by default.
+
+    Returns:
+        Response: The image, or a redirect to the placeholder if it
+        couldn't be downloaded.
+    """
+    size = request.args.get('size')
+    try:
+        found = poster_cache.get(token, size if size in SIZES else None)
+    except requests.exceptions.RequestException:
+        return redirect(PLACEHOLDER_POSTER)
+    if found is None:
+        abort(404)
+    path, mimetype, etag = found
+    response = send_file(path, mimetype=mimetype, etag=etag, conditional=True,
+                         max_age=365 * 24 * 3600)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route('/search')
+def search_movies():
+    """
+    Route for searching movies by name and director.
+
+    Query Args:
+        q (str): The words to look for; typos and word prefixes match too.
+        page (int): The page of results, 1 by default.
+        per_page (int): Results per page, 20 by default and at most 100.
+
+    Returns:
+        Response: A JSON object with the total number of matches and the
+        ranked results of the page.
+    """
+    query = request.args.get('q', '')
+    page = request.args.get('page', 1, type=int)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    return jsonify(data_manager.search_movies(query, page, per_page))
+
+
+@app.route('/stats/top_rated')
+def top_rated_movies():
+    """
+    Route for the highest rated movies of all users.
+
+    Query Args:
+        n (int): The number of movies to return, 10 by default.
+
+    Returns:
+        Response: A JSON list of movies.
+    """
+    n = request.args.get('n', 10, type=int)
+    return jsonify(data_manager.get_top_rated_movies(n))
+
+
+@app.route('/stats/years')
+def movie_count_per_year():
+    """
+    Route for the number of movies per release year.
+
+    Returns:
+        Response: A JSON object mapping years to movie counts.
+    """
+    return jsonify(data_manager.get_movie_count_per_year())
+
+
+@app.route('/enrichment')
+def enrichment_status():
+    """
+    Route for the state of the background movie enrichment.
+
+    Returns:
+        Response: A JSON object with job counts per status, the titles being
+        looked up and the latest failures.
+    """
+    return jsonify(enrichment.status())
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Route for the latency histograms and counters in Prometheus format.
+
+    Returns:
+        Response: The metrics as plain text.
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 def find_movie_in_api(title):
     """
     Retrieve movie info from the OMDB API.
 
+    Lookups go through omdb_client, which caches answers, times out, retries
+    transient failures and fails fast while OMDb is down.
+
     Args:
         title (str): The title of the movie to search for.
 
@@ -165,11 +599,7 @@ def find_movie_in_api(title):
         dict: The movie data retrieved from the API as a dictionary.
     """
     try:
-        response = requests.get(URL+title)
-        response.raise_for_status()  # Raises an HTTPError for 4xx and 5xx status codes
-        if response.status_code == requests.codes.ok:
-            data = response.json()
-            return data
+        return omdb_client.find_movie(title)
     except requests.exceptions.HTTPError as errh:
         return f"HTTP Error: {errh}"
     except requests.exceptions.ConnectionError as errc:
@@ -180,6 +610,25 @@ def find_movie_in_api(title):
         return f"Something went wrong: {err}"
 
 
+@app.cli.command('import-movies')
+@click.argument('filename')
+@click.option('--workers', default=8, help='Concurrent OMDb lookups.')
+@click.option('--batch-size', default=500, help='Movies stored per write.')
+def import_movies(filename, workers, batch_size):
+    """
+    Import user movies from a CSV or NDJSON file of user, title and rating.
+    """
+    importer = MovieImporter(data_manager, omdb_client.find_movie,
+                             workers=workers, batch_size=batch_size)
+    report = importer.run(read_rows(filename))
+    for line_number, message in report["failures"]:
+        click.echo(f"Line {line_number}: {message}", err=True)
+    rate = report["rows"] / report["seconds"] if report["seconds"] else 0
+    click.echo(f"Imported {report['imported']} of {report['rows']} rows "
+               f"in {report['seconds']:.1f}s ({rate:.0f} rows/s), "
+               f"{len(report['failures'])} failed.")
+
+
 @app.errorhandler(400)
 def bad_request(e):
     return render_template('400.html'), 400
@@ -0,0 +1,100 @@
+"""
+The data managers the benchmarks can run against.
+
+Each backend names the fixture format it reads and a factory that opens a
+data manager on a fixture file. New data managers only need an entry here.
+"""
+from benchmarks.generate import write_csv, write_json
+
+
+def _json(filename):
+    from data_manager.json_data_manager import JSONDataManager
+    return JSONDataManager(filename)
+
+
+def _json_cached(filename):
+    from data_manager.json_data_manager import JSONDataManager
+    return JSONDataManager(filename, cache=True)
+
+
+def _json_journaled(filename):
+    from data_manager.journaled_json_data_manager import JournaledJSONDataManager
+    return JournaledJSONDataManager(filename)
+
+
+def _write_normalized(users, filename):
+    from data_manager.normalized_json_data_manager import normalize
+    write_json(normalize(users), filename)
+
+
+def _json_normalized(filename):
+    from data_manager.normalized_json_data_manager import NormalizedJSONDataManager
+    return NormalizedJSONDataManager(filename, cache=True)
+
+
+def _json_compact(filename):
+    from data_manager.compact import CompactJSONDataManager
+    return CompactJSONDataManager(filename)
+
+
+def _write_snapshot(users, filename):
+    from data_manager.snapshot import encode_user, write_snapshot
+    write_snapshot(filename, ((user_id, encode_user(user)) for user_id, user in users.items()))
+
+
+def _snapshot(filename):
+    from data_manager.snapshot import SnapshotDataManager
+    return SnapshotDataManager(filename)
+
+
+def _shared_snapshot(filename):
+    from data_manager.shared_snapshot import SharedSnapshotDataManager
+    return SharedSnapshotDataManager(filename)
+
+
+def _write_sharded(users, filename):
+    from data_manager.sharded_json_data_manager import write_shards
+    write_shards(filename, users)
+
+
+def _sharded(filename):
+    from data_manager.sharded_json_data_manager import ShardedJSONDataManager
+    return ShardedJSONDataManager(filename)
+
+
+def _csv(filename):
+    from data_manager.csv_data_manager import CSVDataManager
+    return CSVDataManager(filename)
+
+
+def _csv_cached(filename):
+    from data_manager.csv_data_manager import CSVDataManager
+    return CSVDataManager(filename, cache=True)
+
+
+def _write_sqlite(users, filename):
+    from data_manager.sqlite_data_manager import SQLiteDataManager
+    json_filename = filename + ".json"
+    write_json(users, json_filename)
+    SQLiteDataManager(filename).import_json(json_filename)
+
+
+def _sqlite(filename):
+    from data_manager.sqlite_data_manager import SQLiteDataManager
+    return SQLiteDataManager(filename)
+
+
+# name: (fixture suffix, fixture writer, data manager factory)
+BACKENDS = {
+    "json": (".json", write_json, _json),
+    "json-cached": (".json", write_json, _json_cached),
+    "json-journaled": (".json", write_json, _json_journaled),
+    "json-normalized": (".json", _write_normalized, _json_normalized),
+    "json-compact": (".json", write_json, _json_compact),
+    "snapshot": (".snap", _write_snapshot, _snapshot),
+    "shared-snapshot": (".snap", _write_snapshot, _shared_snapshot),
+    "sharded": (".d", _write_sharded, _sharded),
+    "csv": (".csv", write_csv, _csv),
+    "csv-cached": (".csv", write_csv, _csv_cached),
+    "sqlite": (".sqlite", _write_sqlite, _sqlite),
+}
@@ -0,0 +1,123 @@
+import argparse
+import csv
+import json
+import random
+
+FIRST_NAMES = ["John", "Alice", "Maria", "Wei", "Amara", "Lukas", "Sofia",
+               "Omar", "Priya", "Kenji", "Elena", "Diego", "Fatima", "Noah"]
+WORDS = ["Night", "City", "Dark", "Star", "River", "Ghost", "Last", "Iron",
+         "Silent", "Golden", "Lost", "Blue", "Wild", "Broken", "Secret"]
+DIRECTORS = ["Christopher Nolan", "Alfred Hitchcock", "Greta Gerwig",
+             "Bong Joon Ho", "Agnes Varda", "Akira Kurosawa", "Jordan Peele",
+             "Kathryn Bigelow", "Hayao Miyazaki", "Sofia Coppola"]
+
+
+def make_titles(count, rng):
+    """
+    Make a pool of distinct movies.
+
+    Args:
+        count (int): The number of movies.
+        rng (random.Random): The random number generator.
+
+    Returns:
+        list: Dictionaries with each movie's name, director, year and poster.
+    """
+    titles = []
+    for number in range(count):
+        name = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {number}"
+        titles.append({
+            'name': name,
+            'director': rng.choice(DIRECTORS),
+            'year': rng.randint(1920, 2024),
+            'poster': f"https://posters.example.com/{number}.jpg"
+        })
+    return titles
+
+
+def generate_users(num_users, max_movies, distinct_movies=None, seed=0):
+    """
+    Generate users in the users.json layout.
+
+    The output only depends on the arguments. Each user gets between 0 and
+    ``max_movies`` movies picked from a shared pool with a skewed popularity,
+    so popular movies are favorites of many users like in real data.
+
+    Args:
+        num_users (int): The number of users.
+        max_movies (int): The largest number of movies per user.
+        distinct_movies (int): The size of the movie pool, by default a
+            tenth of the users times the average number of movies.
+        seed (int): The random seed.
+
+    Returns:
+        dict: A dictionary representing the users.
+    """
+    rng = random.Random(seed)
+    if distinct_movies is None:
+        distinct_movies = max(1, num_users * max_movies // 20)
+    titles = make_titles(distinct_movies, rng)
+    users = {}
+    for user_id in range(1, num_users + 1):
+        movies = {}
+        for movie_id in range(1, rng.randint(0, max_movies) + 1):
+            if rng.random() < 0.5:
+                index = min(int(rng.paretovariate(1.2)) - 1, distinct_movies - 1)
+            else:
+                index = rng.randrange(distinct_movies)
+            movies[str(movie_id)] = {
+                **titles[index],
+                'rating': round(rng.uniform(1, 10), 1)
+            }
+        users[str(user_id)] = {
+            "name": f"{rng.choice(FIRST_NAMES)} {user_id % 997}",
+            "movies": movies
+        }
+    return users
+
+
+def write_json(users, filename):
+    """
+    Write users in the JSONDataManager format.
+
+    Args:
+        users (dict): A dictionary representing the users.
+        filename (str): The file to write.
+    """
+    with open(filename, "w") as jfile:
+        json.dump(users, jfile, indent=4)
+
+
+def write_csv(users, filename):
+    """
+    Write users in the CSVDataManager format.
+
+    Args:
+        users (dict): A dictionary representing the users.
+        filename (str): The file to write.
+    """
+    with open(filename, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=["id", "name", "movies"])
+        writer.writeheader()
+        for user_id, user_data in users.items():
+            writer.writerow({
+                "id": user_id,
+                "name": user_data["name"],
+                "movies": json.dumps([{"id": movie_id, **movie} for movie_id, movie
+                                      in user_data["movies"].items()])
+            })
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate benchmark fixtures.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--max-movies", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write users.json-style output here.")
+    parser.add_argument("--csv", help="Write CSV output here.")
+    args = parser.parse_args()
+    users = generate_users(args.users, args.max_movies, seed=args.seed)
+    if args.json:
+        write_json(users, args.json)
+    if args.csv:
+        write_csv(users, args.csv)
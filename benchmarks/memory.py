@@ -0,0 +1,90 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from benchmarks.generate import generate_users, write_json
+
+
+def measure(load):
+    """
+    Measure the memory held by the result of a loader.
+
+    Args:
+        load (callable): Returns the loaded data.
+
+    Returns:
+        dict: The bytes still allocated after loading, the peak while
+            loading and the seconds taken.
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    data = load()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return {"retained_bytes": current, "peak_bytes": peak, "seconds": seconds}
+
+
+def loaders(filename):
+    """
+    Describe the in-memory representations to compare.
+
+    Args:
+        filename (str): A users.json-style fixture.
+
+    Returns:
+        dict: Loader callables by name.
+    """
+    from data_manager.compact import StringPool, compact_users
+
+    def plain():
+        with open(filename) as jfile:
+            return json.load(jfile)
+
+    def compact():
+        return compact_users(plain(), StringPool())
+
+    return {"json.load": plain, "compact": compact}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the memory taken by the in-memory movie representations.")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--max-movies", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON results here.")
+    args = parser.parse_args()
+
+    users = generate_users(args.users, args.max_movies, seed=args.seed)
+    results = {"parameters": {"users": args.users, "max_movies": args.max_movies,
+                              "seed": args.seed,
+                              "movies": sum(len(user["movies"]) for user in users.values())},
+               "representations": {}}
+    del users
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "users.json")
+        write_json(generate_users(args.users, args.max_movies, seed=args.seed), filename)
+        for name, load in loaders(filename).items():
+            results["representations"][name] = stats = measure(load)
+            print(f"{name:10} {stats['retained_bytes'] / 2**20:8.1f} MiB retained"
+                  f" {stats['peak_bytes'] / 2**20:8.1f} MiB peak"
+                  f" {stats['seconds']:6.2f} s", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from benchmarks.backends import BACKENDS
+from benchmarks.generate import generate_users
+
+
+def percentile(samples, fraction):
+    """
+    Pick a percentile from sorted samples by the nearest-rank method.
+
+    Args:
+        samples (list): Sorted latencies.
+        fraction (float): The percentile as a fraction, e.g. 0.99.
+
+    Returns:
+        float: The latency at that percentile.
+    """
+    index = max(0, min(len(samples) - 1, int(round(fraction * len(samples))) - 1))
+    return samples[index]
+
+
+def summarize(samples):
+    """
+    Summarize latencies in microseconds.
+
+    Args:
+        samples (list): Latencies in seconds.
+
+    Returns:
+        dict: The count, mean, p50, p90, p99 and max.
+    """
+    samples = sorted(sample * 1e6 for sample in samples)
+    return {
+        "count": len(samples),
+        "mean_us": statistics.fmean(samples),
+        "p50_us": percentile(samples, 0.50),
+        "p90_us": percentile(samples, 0.90),
+        "p99_us": percentile(samples, 0.99),
+        "max_us": samples[-1],
+    }
+
+
+def operations(users, rng):
+    """
+    Describe the calls to time, as method names with argument factories.
+
+    Every public method of DataManagerInterface is covered. Arguments are
+    drawn from the fixture so lookups mostly hit existing data. A name may
+    carry a label after a colon, e.g. "query_movies:home", to time one
+    method with different arguments. The batch deletions use fixture movies
+    nothing else deletes, so they never fail on a missing movie.
+
+    Args:
+        users (dict): The fixture's users.
+        rng (random.Random): The random number generator.
+
+    Returns:
+        list: (method name, callable returning the positional arguments).
+    """
+    user_ids = list(users)
+    names = [user["name"] for user in users.values()]
+    # Movies beyond the IDs the single deletions pick from
+    deletable = [(user_id, movie_id) for user_id, user in users.items()
+                 for movie_id in user["movies"] if int(movie_id) > 50]
+    deletable += [(user_id, movie_id) for user_id, user in users.items()
+                  for movie_id in user["movies"] if 5 < int(movie_id) <= 50]
+    rng.shuffle(deletable)
+
+    def user_id():
+        return rng.choice(user_ids)
+
+    def movie_id():
+        return str(rng.randint(1, 5))
+
+    def movie_args():
+        return (user_id(), f"Benchmark {rng.random()}", "Director",
+                rng.randint(1920, 2024), round(rng.uniform(1, 10), 1), "poster")
+
+    def movie():
+        _, name, director, year, rating, poster = movie_args()
+        return {"name": name, "director": director, "year": year,
+                "rating": rating, "poster": poster}
+
+    def batch():
+        return ([{"op": "add_user", "name": f"Benchmark {rng.random()}"},
+                 {"op": "add_movie", "user_id": user_id(), "movie": movie()},
+                 {"op": "add_movie", "user_id": user_id(), "movie": movie()}],)
+
+    def movies_to_delete():
+        user_id, movie_id = deletable.pop()
+        return (user_id, [movie_id])
+
+    return [
+        ("get_all_users", lambda: ()),
+        ("get_user_by_id", lambda: (user_id(),)),
+        ("get_user_movies", lambda: (user_id(),)),
+        ("get_movie_details", lambda: (movie_id(),)),
+        ("get_users_with_movie", lambda: (movie_id(),)),
+        ("get_users_by_name", lambda: (rng.choice(names),)),
+        ("get_top_rated_movies", lambda: (10,)),
+        ("search_movies", lambda: (rng.choice(names).split()[0][:4],)),
+        ("get_movie_count_per_year", lambda: ()),
+        ("create_movie_list", lambda: ()),
+        ("query_movies:home", lambda: ({"distinct": True}, "rating", 60)),
+        ("query_movies:user", lambda: ({"user_id": user_id()}, "rating", 60)),
+        ("query_movies:filtered", lambda: ({"year_min": 1990, "min_rating": 7}, "year", 20)),
+        ("get_data_version", lambda: ()),
+        ("get_user_version", lambda: (user_id(),)),
+        ("add_user", lambda: (f"Benchmark {rng.random()}",)),
+        ("add_user_movie", movie_args),
+        ("update_user_movie", lambda: (user_id(), movie_id(), {"rating": 5.0})),
+        ("apply", batch),
+        ("add_user_movies", lambda: (user_id(), [movie() for _ in range(5)])),
+        ("delete_user_movies", movies_to_delete),
+        ("delete_user_movie", lambda: (user_id(), str(rng.randint(1, 50)))),
+    ]
+
+
+def run_backend(backend, users, repeat, seed, directory):
+    """
+    Time every operation against one backend.
+
+    Runs in its own process, so the reported peak RSS belongs to this
+    backend alone.
+
+    Args:
+        backend (str): A key of BACKENDS.
+        users (dict): The fixture's users.
+        repeat (int): The number of calls per operation.
+        seed (int): The random seed for the call arguments.
+        directory (str): Where to write the fixture file.
+
+    Returns:
+        dict: The open time, per-operation latencies and peak RSS.
+    """
+    suffix, write_fixture, factory = BACKENDS[backend]
+    filename = os.path.join(directory, backend + suffix)
+    write_fixture(users, filename)
+    rng = random.Random(seed)
+
+    start = time.perf_counter()
+    data_manager = factory(filename)
+    data_manager.get_user_by_id(next(iter(users), "1"))
+    result = {"open_and_first_lookup_us": (time.perf_counter() - start) * 1e6,
+              "operations": {}}
+
+    for method_name, make_args in operations(users, rng):
+        method = getattr(data_manager, method_name.partition(":")[0])
+        samples = []
+        try:
+            for _ in range(repeat):
+                args = make_args()
+                start = time.perf_counter()
+                method(*args)
+                samples.append(time.perf_counter() - start)
+        except Exception as err:
+            result["operations"][method_name] = {"error": repr(err)}
+            continue
+        result["operations"][method_name] = summarize(samples)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    result["peak_rss_kb"] = peak // 1024 if sys.platform == "darwin" else peak
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the data managers.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--max-movies", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=50,
+                        help="Calls per operation.")
+    parser.add_argument("--backend", action="append", choices=sorted(BACKENDS),
+                        help="Backends to run, all by default.")
+    parser.add_argument("--output", help="Write the JSON results here.")
+    args = parser.parse_args()
+
+    users = generate_users(args.users, args.max_movies, seed=args.seed)
+    results = {
+        "parameters": {"users": args.users, "max_movies": args.max_movies,
+                       "seed": args.seed, "repeat": args.repeat,
+                       "movies": sum(len(user["movies"]) for user in users.values())},
+        "machine": {"python": platform.python_version(),
+                    "platform": platform.platform()},
+        "backends": {},
+    }
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in args.backend or BACKENDS:
+            with context.Pool(1) as pool:
+                results["backends"][backend] = pool.apply(
+                    run_backend, (backend, users, args.repeat, args.seed, directory))
+            print(f"{backend}: peak RSS {results['backends'][backend]['peak_rss_kb']} kB",
+                  file=sys.stderr)
+            for method_name, stats in results["backends"][backend]["operations"].items():
+                if "error" in stats:
+                    print(f"  {method_name:26} {stats['error']}", file=sys.stderr)
+                else:
+                    print(f"  {method_name:26} p50 {stats['p50_us']:10.1f} us"
+                          f"  p99 {stats['p99_us']:10.1f} us", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+from bisect import bisect_left, insort
+from data_manager.views import MovieView
+
+
+def _movie_order(user_id, movie_id, movie):
+    """
+    Sort key placing higher ratings first, ties in users.json order.
+
+    Args:
+        user_id (str): The ID of the user.
+        movie_id (str): The ID of the movie.
+        movie (dict): The movie's data.
+
+    Returns:
+        tuple: The sort key.
+    """
+    return (-float(movie['rating']), int(user_id), int(movie_id))
+
+
+class TopRatedMovies(MovieView):
+    """
+    All user movies ordered by rating.
+
+    The order is kept in a sorted list, so reading the top n movies costs
+    O(n) and every change costs a binary search plus a list insert.
+    """
+
+    def __init__(self):
+        """Initialize an empty TopRatedMovies."""
+        self.clear()
+
+    def clear(self):
+        """Forget all movies."""
+        self._order = []
+        self._movies = {}
+
+    def add_movie(self, user_id, movie_id, movie):
+        """
+        Record a movie added to a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data.
+        """
+        key = _movie_order(user_id, movie_id, movie)
+        insort(self._order, key)
+        self._movies[key] = movie
+
+    def remove_movie(self, user_id, movie_id, movie):
+        """
+        Forget a movie removed from a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data as it was recorded.
+        """
+        key = _movie_order(user_id, movie_id, movie)
+        index = bisect_left(self._order, key)
+        if index < len(self._order) and self._order[index] == key:
+            del self._order[index]
+            del self._movies[key]
+
+    def dump(self):
+        """
+        Describe the view for comparison with a rebuilt one.
+
+        Returns:
+            list: The sort keys in order.
+        """
+        return self._order
+
+    def top(self, n):
+        """
+        List the highest rated movies.
+
+        Args:
+            n (int): The number of movies to retrieve.
+
+        Returns:
+            list: A list of top-rated movies.
+        """
+        return [self._movies[key] for key in self._order[:max(n, 0)]]
+
+
+class YearHistogram(MovieView):
+    """The number of user movies per release year."""
+
+    def __init__(self):
+        """Initialize an empty YearHistogram."""
+        self.clear()
+
+    def clear(self):
+        """Forget all movies."""
+        self._counts = {}
+
+    def add_movie(self, user_id, movie_id, movie):
+        """
+        Record a movie added to a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data.
+        """
+        year = movie.get("year")
+        self._counts[year] = self._counts.get(year, 0) + 1
+
+    def remove_movie(self, user_id, movie_id, movie):
+        """
+        Forget a movie removed from a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data as it was recorded.
+        """
+        year = movie.get("year")
+        self._counts[year] -= 1
+        if not self._counts[year]:
+            del self._counts[year]
+
+    def dump(self):
+        """
+        Describe the view for comparison with a rebuilt one.
+
+        Returns:
+            dict: The movie count per year.
+        """
+        return self._counts
+
+    def counts(self):
+        """
+        Return the movie count per year.
+
+        Returns:
+            dict: A dictionary with movie counts per year.
+        """
+        return dict(self._counts)
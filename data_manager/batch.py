@@ -0,0 +1,103 @@
+import math
+
+MOVIE_FIELDS = ('name', 'director', 'year', 'rating', 'poster')
+
+
+def check_movie_field(field, value):
+    """
+    Convert a movie field to the type it is stored with.
+
+    Args:
+        field (str): One of MOVIE_FIELDS.
+        value (object): The value given for it.
+
+    Returns:
+        object: The year as an int, the rating as a float and the other
+            fields as strings.
+
+    Raises:
+        ValueError: If the value doesn't convert.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid {field}: {value!r}")
+    if field == 'year':
+        try:
+            year = int(value)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"Invalid year: {value!r}") from None
+        if year != value and str(year) != str(value).strip():
+            # Fractions and other lossy conversions
+            raise ValueError(f"Invalid year: {value!r}")
+        return year
+    if field == 'rating':
+        try:
+            rating = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid rating: {value!r}") from None
+        if not math.isfinite(rating):
+            raise ValueError(f"Invalid rating: {value!r}")
+        return rating
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid {field}: {value!r}")
+    return value
+
+
+def check_operations(operations):
+    """
+    Check the shape of a batch of operations for DataManagerInterface.apply.
+
+    Operations are dicts with an ``op`` key and the arguments of the
+    mutation: ``add_user`` (name), ``add_movie`` (user_id, movie with every
+    one of MOVIE_FIELDS), ``update_movie`` (user_id, movie_id, movie with
+    some of MOVIE_FIELDS) and ``delete_movie`` (user_id, movie_id). Movie
+    fields are converted with check_movie_field, so nothing stored can
+    break the views later. Whether the users and movies exist is left to
+    the data manager.
+
+    Args:
+        operations (list): The operations.
+
+    Returns:
+        list: Copies of the operations with their IDs as strings.
+
+    Raises:
+        ValueError: If an operation is malformed.
+    """
+    if not isinstance(operations, (list, tuple)):
+        raise ValueError("Operations must be a list")
+    checked = []
+    for number, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise ValueError(f"Operation {number} is not an object")
+        kind = operation.get("op")
+        if kind == "add_user":
+            if not isinstance(operation.get("name"), str) or not operation["name"].strip():
+                raise ValueError(f"Operation {number}: add_user needs a name")
+            checked.append({"op": kind, "name": operation["name"]})
+            continue
+        if kind not in ("add_movie", "update_movie", "delete_movie"):
+            raise ValueError(f"Operation {number}: unknown op {kind!r}")
+        if operation.get("user_id") is None:
+            raise ValueError(f"Operation {number}: {kind} needs a user_id")
+        checked_operation = {"op": kind, "user_id": str(operation["user_id"])}
+        if kind != "add_movie":
+            if operation.get("movie_id") is None:
+                raise ValueError(f"Operation {number}: {kind} needs a movie_id")
+            checked_operation["movie_id"] = str(operation["movie_id"])
+        if kind != "delete_movie":
+            movie = operation.get("movie")
+            if not isinstance(movie, dict):
+                raise ValueError(f"Operation {number}: {kind} needs a movie")
+            unknown = set(movie) - set(MOVIE_FIELDS)
+            if unknown:
+                raise ValueError(f"Operation {number}: unknown movie fields {sorted(unknown)}")
+            missing = [field for field in MOVIE_FIELDS if field not in movie]
+            if kind == "add_movie" and missing:
+                raise ValueError(f"Operation {number}: the movie lacks {missing}")
+            try:
+                checked_operation["movie"] = {field: check_movie_field(field, value)
+                                              for field, value in movie.items()}
+            except ValueError as err:
+                raise ValueError(f"Operation {number}: {err}") from None
+        checked.append(checked_operation)
+    return checked
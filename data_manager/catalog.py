@@ -0,0 +1,115 @@
+from data_manager.views import MovieView
+
+
+def movie_key(movie):
+    """
+    Identify a movie independently of who added it.
+
+    Args:
+        movie (dict): The movie's data.
+
+    Returns:
+        tuple: The movie's name, director and year.
+    """
+    return (movie['name'], movie['director'], movie['year'])
+
+
+class MovieCatalog(MovieView):
+    """
+    The distinct movies of all users, as shown on the home page.
+
+    Movies are deduplicated by movie_key(). Each entry remembers every user
+    movie it stands for, so it only disappears with the last of them, and
+    is shown with the data of the first one still present.
+    """
+
+    def __init__(self):
+        """Initialize an empty MovieCatalog."""
+        self.clear()
+
+    def clear(self):
+        """Forget all movies."""
+        self._entries = {}
+        self._movie_list = None
+
+    def add_movie(self, user_id, movie_id, movie):
+        """
+        Record a movie added to a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data.
+        """
+        refs = self._entries.setdefault(movie_key(movie), {})
+        refs[(user_id, movie_id)] = movie
+        if len(refs) == 1:
+            self._movie_list = None
+
+    def remove_movie(self, user_id, movie_id, movie):
+        """
+        Forget a movie removed from a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data as it was recorded.
+        """
+        key = movie_key(movie)
+        refs = self._entries.get(key, {})
+        first = next(iter(refs), None)
+        refs.pop((user_id, movie_id), None)
+        if not refs:
+            self._entries.pop(key, None)
+            self._movie_list = None
+        elif first == (user_id, movie_id):
+            self._movie_list = None
+
+    def dump(self):
+        """
+        Describe the catalog for comparison with a rebuilt one.
+
+        Returns:
+            dict: The user movies behind each catalog entry.
+        """
+        return {key: set(refs) for key, refs in self._entries.items()}
+
+    def stands_for(self, user_id, movie_id, movie):
+        """
+        Tell whether a user movie is the one its entry is shown with.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data.
+
+        Returns:
+            bool: True for the first user movie still behind the entry.
+        """
+        refs = self._entries.get(movie_key(movie))
+        return bool(refs) and next(iter(refs)) == (user_id, movie_id)
+
+    def movie_list(self):
+        """
+        List the distinct movies, in the order they were first added.
+
+        The list is built once and then reused until the catalog changes,
+        so it must not be modified.
+
+        Returns:
+            list: A list of dictionaries with each movie's name, director,
+                year, rating and poster.
+        """
+        if self._movie_list is None:
+            movie_list = []
+            for refs in self._entries.values():
+                movie = next(iter(refs.values()))
+                movie_list.append({
+                    'name': movie['name'],
+                    'director': movie['director'],
+                    'year': movie['year'],
+                    'rating': movie['rating'],
+                    'poster': movie['poster']
+                })
+            self._movie_list = movie_list
+        return self._movie_list
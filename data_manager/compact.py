@@ -0,0 +1,174 @@
+import sys
+from collections.abc import Mapping
+from data_manager.json_data_manager import JSONDataManager
+
+
+class CompactMovie(Mapping):
+    """
+    A read-only movie record taking a fraction of the memory of a dict.
+
+    The fields live in slots instead of a per-movie hash table, and the
+    strings are shared between all movies holding the same value. It reads
+    like the dict it replaces: ``movie['name']``, ``movie.get('poster')``,
+    ``{**movie}`` and attribute access from templates all work. Fields
+    beyond the usual five are kept in a dict of their own.
+    """
+
+    __slots__ = ("name", "director", "year", "rating", "poster", "extra")
+    FIELDS = ("name", "director", "year", "rating", "poster")
+
+    def __init__(self, name, director, year, rating, poster, extra=None):
+        """
+        Initialize the CompactMovie.
+
+        Args:
+            name (str): The title of the movie.
+            director (str): The director of the movie.
+            year (int): The release year.
+            rating (float): The user's rating.
+            poster (str): The poster URL.
+            extra (dict): Any other fields, or None.
+        """
+        self.name = name
+        self.director = director
+        self.year = year
+        self.rating = rating
+        self.poster = poster
+        self.extra = extra
+
+    def __getitem__(self, field):
+        if field in CompactMovie.FIELDS:
+            return getattr(self, field)
+        if self.extra is not None and field in self.extra:
+            return self.extra[field]
+        raise KeyError(field)
+
+    def __iter__(self):
+        yield from CompactMovie.FIELDS
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        return len(CompactMovie.FIELDS) + len(self.extra or ())
+
+    def __repr__(self):
+        return f"CompactMovie({dict(self)!r})"
+
+
+class StringPool:
+    """Hands out one shared copy of every distinct string."""
+
+    def __init__(self):
+        """Initialize an empty StringPool."""
+        self._strings = {}
+
+    def get(self, value):
+        """
+        Return the shared copy of a string.
+
+        Args:
+            value (str): The string, or any other hashable value.
+
+        Returns:
+            str: An equal string, the same object for every equal input.
+        """
+        return self._strings.setdefault(value, value)
+
+    def __len__(self):
+        return len(self._strings)
+
+
+def compact_movie(movie, strings):
+    """
+    Convert a movie to a CompactMovie.
+
+    Movies lacking one of the usual fields are returned unchanged, so no
+    field is made up.
+
+    Args:
+        movie (Mapping): The movie's data.
+        strings (StringPool): The pool to share strings from.
+
+    Returns:
+        Mapping: The compact movie, or ``movie`` itself.
+    """
+    if isinstance(movie, CompactMovie):
+        return movie
+    try:
+        name, director, poster = movie["name"], movie["director"], movie["poster"]
+        year, rating = movie["year"], movie["rating"]
+    except KeyError:
+        return movie
+    extra = None
+    if len(movie) > len(CompactMovie.FIELDS):
+        extra = {field: value for field, value in movie.items()
+                 if field not in CompactMovie.FIELDS}
+    return CompactMovie(strings.get(name), strings.get(director), year, rating,
+                        strings.get(poster), extra)
+
+
+def compact_users(users, strings):
+    """
+    Convert every movie of the users to a CompactMovie.
+
+    Args:
+        users (dict): A dictionary representing the users.
+        strings (StringPool): The pool to share strings from.
+
+    Returns:
+        dict: The users with compact movies and shared user names.
+    """
+    return {
+        sys.intern(user_id): {
+            **user,
+            "name": strings.get(user["name"]),
+            "movies": {sys.intern(movie_id): compact_movie(movie, strings)
+                       for movie_id, movie in user.get("movies", {}).items()}
+        }
+        for user_id, user in users.items()
+    }
+
+
+class CompactJSONDataManager(JSONDataManager):
+    """
+    A caching JSONDataManager that keeps movies as CompactMovie records.
+
+    The decoded file is converted once per load, and movies added or
+    updated later are converted as they are stored, so the cached copy
+    takes far less memory than the output of json.load. Movies are
+    read-only Mappings; callers wanting a dict use ``dict(movie)``.
+    """
+
+    def __init__(self, filename) -> None:
+        """
+        Initialize the CompactJSONDataManager.
+
+        Args:
+            filename (str): The filename of the JSON file.
+        """
+        super().__init__(filename, cache=True)
+        self._strings = StringPool()
+
+    def _read_db(self):
+        """
+        Parse the JSON file into compact movies.
+
+        Returns:
+            dict: A dictionary representing the users.
+        """
+        # A fresh pool per load drops the strings no movie uses any more
+        self._strings = StringPool()
+        return compact_users(super()._read_db(), self._strings)
+
+    def _apply_change(self, users, change, views=()):
+        """
+        Apply one change record, storing its movie in compact form.
+
+        Args:
+            users (dict): The users to modify.
+            change (dict): The change record, left unchanged.
+            views (list): MovieViews to update along with ``users``.
+        """
+        if change["op"] == "put_movie":
+            change = {**change, "movie": compact_movie(change["movie"], self._strings)}
+        super()._apply_change(users, change, views)
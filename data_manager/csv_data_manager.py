@@ -1,19 +1,177 @@
 import csv
 import json
+import os
+import tempfile
+from data_manager.aggregates import TopRatedMovies, YearHistogram
+from data_manager.batch import MOVIE_FIELDS, check_operations
+from data_manager.catalog import MovieCatalog
 from data_manager.data_manager_interface import DataManagerInterface
+from data_manager.file_cache import CachedFileMixin
+from data_manager.indexes import DirectorIndex, MovieMembershipIndex, UserNameIndex
+from data_manager.query import MovieQueryIndex, check_query, decode_cursor
+from data_manager.search import SearchIndex
+from data_manager.write_coordinator import WriteCoordinator
 
 
-class CSVDataManager(DataManagerInterface):
-    """A data manager that interacts with a CSV file."""
+class CSVDataManager(CachedFileMixin, DataManagerInterface):
+    """
+    A data manager that interacts with a CSV file.
 
-    def __init__(self, filename):
+    Mutations go through a WriteCoordinator, like in JSONDataManager, so
+    processes sharing the file don't lose each other's changes and
+    concurrent ones are saved together.
+    """
+
+    def __init__(self, filename, cache=False, commit_window=0.0):
         """
         Initialize the CSVDataManager.
 
         Args:
             filename (str): The filename of the CSV file.
+            cache (bool): Keep the decoded file in memory and only parse it
+                again when its mtime, size or inode changes. Data returned
+                by the read methods is then shared and must not be modified.
+            commit_window (float): Seconds a write waits for others to save
+                along with it, see WriteCoordinator.
+        """
+        self._init_cache(filename, cache)
+        self._coordinator = WriteCoordinator(filename + ".lock", self._run_batch,
+                                             commit_window)
+
+    def _read_db(self):
+        """
+        Parse the CSV file. Each user's movies are stored as a JSON list in
+        the ``movies`` column.
+
+        Returns:
+            list: A list of dictionaries representing the users.
+        """
+        with open(self.filename, "r", newline="") as csvfile:
+            reader = csv.DictReader(csvfile)
+            users = [row for row in reader]
+            self.bytes_read += os.fstat(csvfile.fileno()).st_size
+        for user in users:
+            user["movies"] = json.loads(user.get("movies") or "[]")
+        return users
+
+    def _view_users(self, data):
+        """
+        Convert the CSV rows to the users.json layout views expect.
+
+        Args:
+            data (list): A list of dictionaries representing the users.
+
+        Returns:
+            dict: A dictionary representing the users.
+        """
+        return {
+            user["id"]: {
+                "name": user.get("name"),
+                "movies": {movie["id"]: movie for movie in user.get("movies", [])}
+            }
+            for user in data
+        }
+
+    def _saved(self, current, users, saved, events):
+        """
+        Keep the cache and views in step with a write.
+
+        Args:
+            current (list): The users the write started from.
+            users (list): The users that were written.
+            saved (bool): Whether the write succeeded.
+            events (list): The view updates, as tuples of a MovieView method
+                name and its arguments.
+        """
+        if not saved:
+            if self.cache:
+                with self._lock:
+                    self._users = None
+                    self._drop_views()
+            return
+
+        def replay(views):
+            for view in views:
+                for method, *args in events:
+                    getattr(view, method)(*args)
+
+        self._publish(current, users, events, replay)
+        self._bump_versions({args[0] for method, *args in events})
+
+    @staticmethod
+    def _own_user(users, user_id):
+        """
+        Find a user and put a copy in its place that may be changed.
+
+        Operations get their own list of users, but the user dicts in it
+        are shared with the version readers see, so they are copied along
+        with their movie list before a change.
+
+        Args:
+            users (list): The users given to the operation.
+            user_id (str): The ID of the user.
+
+        Returns:
+            dict: The copy of the user, or None if there is no such user.
+        """
+        for index, user in enumerate(users):
+            if user["id"] == user_id:
+                user = users[index] = {**user, "movies": list(user.get("movies", []))}
+                return user
+        return None
+
+    def _submit(self, operation):
         """
-        self.filename = filename
+        Run a mutation through the write coordinator.
+
+        Args:
+            operation (callable): Takes a copy of the current users, changes
+                it in place, using _own_user() before changing a user, and
+                returns the view updates for _saved() and the
+                value to return. If it raises, none of its changes are
+                saved. It may run in another thread, along with the
+                operations of other writes.
+
+        Returns:
+            object: The value returned by ``operation``.
+        """
+        return self._coordinator.submit(operation)
+
+    def _run_batch(self, operations):
+        """
+        Run mutations one after the other and save them together.
+
+        Called by the write coordinator with the file locked, so the loaded
+        users include every write of other processes.
+
+        Args:
+            operations (list): The operations, see _submit.
+
+        Returns:
+            list: The value each operation returned, or the exception it
+                raised.
+        """
+        try:
+            current = self._latest()
+        except FileNotFoundError:
+            current = []
+        users = list(current)
+        events = []
+        results = []
+        for operation in operations:
+            # An operation that fails halfway leaves its changes in its own copy
+            attempt = list(users)
+            try:
+                operation_events, result = operation(attempt)
+            except Exception as error:
+                results.append(error)
+                continue
+            users = attempt
+            events += operation_events
+            results.append(result)
+        if events:
+            self._saved(current, users, self.save_db(users), events)
+        return results
 
     def get_all_users(self):
         """
@@ -23,10 +181,7 @@ class CSVDataManager(DataManagerInterface):
             list: A list of dictionaries representing the users.
         """
         try:
-            with open(self.filename, "r") as csvfile:
-                reader = csv.DictReader(csvfile)
-                users = [row for row in reader]
-            return users
+            return self._load()
         except FileNotFoundError:
             return []  # Return an empty list if the file is not found
         except csv.Error as e:
@@ -44,12 +199,24 @@ class CSVDataManager(DataManagerInterface):
             bool: True if the data was saved successfully, False otherwise.
         """
         try:
-            with open(self.filename, "w", newline="") as csvfile:
-                fieldnames = data[0].keys() if data else []
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(data)
-                return True
+            # Readers always see a complete file thanks to the rename
+            descriptor, temp_filename = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.filename)), suffix=".tmp")
+            try:
+                with os.fdopen(descriptor, "w", newline="") as csvfile:
+                    fieldnames = data[0].keys() if data else []
+                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                    writer.writeheader()
+                    writer.writerows(
+                        {**row, "movies": json.dumps(row.get("movies", []))} for row in data)
+                    csvfile.flush()
+                    os.fsync(csvfile.fileno())
+                    self.bytes_written += os.fstat(csvfile.fileno()).st_size
+                os.replace(temp_filename, self.filename)
+            except BaseException:
+                os.unlink(temp_filename)
+                raise
+            return True
         except IOError:
             return False  # Return False if there is an IO error while saving the data
 
@@ -87,26 +254,26 @@ class CSVDataManager(DataManagerInterface):
         Returns:
             list: The updated list of movies for the user.
         """
+        def operation(users):
+            user = self._own_user(users, user_id)
+            if user is None:
+                return [], []
+            movies = user["movies"]
+            movie_id = max([int(movie["id"])
+                            for movie in movies], default=0) + 1
+            movie = {
+                "id": str(movie_id),
+                "name": name,
+                "director": director,
+                "year": year,
+                "rating": rating,
+                'poster': poster
+            }
+            movies.append(movie)
+            return [("add_movie", user_id, movie["id"], movie)], movies
+
         try:
-            users = self.get_all_users()
-            for user in users:
-                if user["id"] == user_id:
-                    movies = user.get("movies", [])
-                    movie_id = max([int(movie["id"])
-                                    for movie in movies], default=0) + 1
-                    movie = {
-                        "id": str(movie_id),
-                        "name": name,
-                        "director": director,
-                        "year": year,
-                        "rating": rating,
-                        'poster': poster
-                    }
-                    movies.append(movie)
-                    user["movies"] = movies
-                    self.save_db(users)
-                    return movies
-            return []
+            return self._submit(operation)
         except KeyError:
             return f"KeyError: User ID {user_id} not found"
 
@@ -121,17 +288,17 @@ class CSVDataManager(DataManagerInterface):
         Returns:
             bool: True if the movie was deleted successfully, False otherwise.
         """
+        def operation(users):
+            user = self._own_user(users, user_id)
+            movies = user["movies"] if user is not None else []
+            for movie in movies:
+                if movie["id"] == movie_id:
+                    movies.remove(movie)
+                    return [("remove_movie", user_id, movie_id, movie)], True
+            return [], False
+
         try:
-            users = self.get_all_users()
-            for user in users:
-                if user["id"] == user_id:
-                    movies = user.get("movies", [])
-                    for movie in movies:
-                        if movie["id"] == movie_id:
-                            movies.remove(movie)
-                            self.save_db(users)
-                            return True
-            return False
+            return self._submit(operation)
         except KeyError:
             return f"KeyError: User ID {user_id} not found"
 
@@ -147,20 +314,98 @@ class CSVDataManager(DataManagerInterface):
         Returns:
             bool: True if the movie was updated successfully, False otherwise.
         """
+        def operation(users):
+            user = self._own_user(users, user_id)
+            movies = user["movies"] if user is not None else []
+            for index, old_movie in enumerate(movies):
+                if old_movie["id"] == movie_id:
+                    movie = movies[index] = {**old_movie, **updated_movie}
+                    return [("remove_movie", user_id, movie_id, old_movie),
+                            ("add_movie", user_id, movie_id, movie)], True
+            return [], False
+
         try:
-            users = self.get_all_users()
-            for user in users:
-                if user["id"] == user_id:
-                    movies = user.get("movies", [])
-                    for movie in movies:
-                        if movie["id"] == movie_id:
-                            movie.update(updated_movie)
-                            self.save_db(users)
-                            return True
-            return False
+            return self._submit(operation)
         except KeyError:
             return f"KeyError: User ID {user_id} not found"
 
+    def apply(self, operations):
+        """
+        Run a batch of mutations as one transaction.
+
+        The batch runs as one operation, so it is saved with one write, and
+        if any of its operations fails none of them is saved.
+
+        Args:
+            operations (list): The operations, see batch.check_operations.
+
+        Returns:
+            list: Per operation, the ID of the new user or of the movie added,
+                updated or deleted.
+
+        Raises:
+            ValueError: If an operation is malformed or refers to a user or
+                movie that doesn't exist.
+        """
+        operations = check_operations(operations)
+
+        def operation(users):
+            positions = {user["id"]: index for index, user in enumerate(users)}
+            owned = set()
+            next_user_id = None
+            next_movie_ids = {}
+            events = []
+            results = []
+            for number, batch_operation in enumerate(operations):
+                if batch_operation["op"] == "add_user":
+                    if next_user_id is None:
+                        next_user_id = max([int(user["id"]) for user in users], default=0) + 1
+                    user_id = str(next_user_id)
+                    next_user_id += 1
+                    users.append({"id": user_id, "name": batch_operation["name"], "movies": []})
+                    positions[user_id] = len(users) - 1
+                    owned.add(user_id)
+                    events.append(("add_user", user_id,
+                                   {"name": batch_operation["name"], "movies": {}}))
+                    results.append(user_id)
+                    continue
+                user_id = batch_operation["user_id"]
+                if user_id not in positions:
+                    raise ValueError(f"Operation {number}: user {user_id} not found")
+                index = positions[user_id]
+                if user_id not in owned:
+                    users[index] = {**users[index], "movies": list(users[index].get("movies", []))}
+                    owned.add(user_id)
+                movies = users[index]["movies"]
+                if batch_operation["op"] == "add_movie":
+                    if user_id not in next_movie_ids:
+                        next_movie_ids[user_id] = max([int(movie["id"]) for movie in movies],
+                                                      default=0) + 1
+                    movie = {"id": str(next_movie_ids[user_id]),
+                             **{field: batch_operation["movie"][field] for field in MOVIE_FIELDS}}
+                    next_movie_ids[user_id] += 1
+                    movies.append(movie)
+                    events.append(("add_movie", user_id, movie["id"], movie))
+                    results.append(movie["id"])
+                    continue
+                movie_id = batch_operation["movie_id"]
+                position = next((position for position, movie in enumerate(movies)
+                                 if movie["id"] == movie_id), None)
+                if position is None:
+                    raise ValueError(
+                        f"Operation {number}: movie {movie_id} of user {user_id} not found")
+                old_movie = movies[position]
+                events.append(("remove_movie", user_id, movie_id, old_movie))
+                if batch_operation["op"] == "update_movie":
+                    movie = movies[position] = {**old_movie, **batch_operation["movie"]}
+                    events.append(("add_movie", user_id, movie_id, movie))
+                else:
+                    del movies[position]
+                results.append(movie_id)
+            return events, results
+
+        return self._submit(operation)
+
     def get_movie_details(self, movie_id):
         """
         Retrieve the details of a specific movie.
@@ -172,12 +417,13 @@ class CSVDataManager(DataManagerInterface):
             dict: A dictionary representing the movie details.
         """
         try:
-            users = self.get_all_users()
-            for user in users:
-                movies = user.get("movies", [])
-                for movie in movies:
-                    if movie["id"] == movie_id:
-                        return movie
+            with self._lock:
+                user_ids = self._view(MovieMembershipIndex).users_with_movie(movie_id)
+                for user in self.get_all_users():
+                    if user_ids and user["id"] == str(user_ids[0]):
+                        for movie in user.get("movies", []):
+                            if movie["id"] == movie_id:
+                                return movie
             return None
         except KeyError:
             return f"KeyError: Movie ID {movie_id} not found"
@@ -193,17 +439,81 @@ class CSVDataManager(DataManagerInterface):
             list: A list of user IDs.
         """
         try:
-            users = self.get_all_users()
-            user_list = []
-            for user in users:
-                movies = user.get("movies", [])
-                for movie in movies:
-                    if movie["id"] == movie_id:
-                        user_list.append(int(user["id"]))
-            return user_list
+            with self._lock:
+                return self._view(MovieMembershipIndex).users_with_movie(movie_id)
         except KeyError:
             return f"KeyError: Movie ID {movie_id} not found"
 
+    def get_users_with_title(self, title):
+        """
+        Retrieve a list of user IDs that have a movie with a specific title.
+
+        Args:
+            title (str): The name of the movie.
+
+        Returns:
+            list: A list of user IDs.
+        """
+        with self._lock:
+            return self._view(MovieMembershipIndex).users_with_title(title)
+
+    def get_movies_by_director(self, director):
+        """
+        Retrieve the movies of a specific director.
+
+        Args:
+            director (str): The director as stored with the movies.
+
+        Returns:
+            list: The movies, one per user who has them.
+        """
+        with self._lock:
+            return self._view(DirectorIndex).movies_by_director(director)
+
+    def search_movies(self, query, page=1, per_page=20):
+        """
+        Search the distinct movies by name and director.
+
+        Args:
+            query (str): The words to look for, matched exactly, as a
+                prefix or with typos.
+            page (int): The page of results, starting at 1.
+            per_page (int): The number of results per page.
+
+        Returns:
+            dict: The total number of matches, the page, per_page and the
+                ranked results.
+        """
+        with self._lock:
+            return self._view(SearchIndex).search(query, page, per_page)
+
+    def query_movies(self, filter=None, sort="rating", limit=20, cursor=None):
+        """
+        Read one page of user movies, filtered and sorted by the indexes.
+
+        Args:
+            filter (dict): Any of year_min, year_max, min_rating, director,
+                user_id, and distinct to keep one user movie per entry of
+                create_movie_list(), or None.
+            sort (str): "rating", highest first, "year", newest first, or
+                "name".
+            limit (int): The number of movies per page.
+            cursor (str): The next_cursor of the previous page, or None for
+                the first page.
+
+        Returns:
+            dict: The "movies", each with its "user_id" and "movie_id", and
+                the "next_cursor", or None on the last page.
+
+        Raises:
+            ValueError: If an argument or the cursor is invalid.
+        """
+        movie_filter = check_query(filter, sort, limit)
+        after = decode_cursor(sort, cursor)
+        with self._lock:
+            catalog = self._view(MovieCatalog) if movie_filter.get("distinct") else None
+            return self._view(MovieQueryIndex).query(movie_filter, sort, limit, after, catalog)
+
     def get_users_by_name(self, name):
         """
         Retrieve a list of user IDs that have a specific name.
@@ -215,12 +525,8 @@ class CSVDataManager(DataManagerInterface):
             list: A list of user IDs.
         """
         try:
-            users = self.get_all_users()
-            user_list = []
-            for user in users:
-                if user.get("name") == name:
-                    user_list.append(int(user["id"]))
-            return user_list
+            with self._lock:
+                return self._view(UserNameIndex).users_by_name(name)
         except KeyError:
             return f"KeyError: Name {name} not found"
 
@@ -235,15 +541,8 @@ class CSVDataManager(DataManagerInterface):
             list: A list of top-rated movies.
         """
         try:
-            users = self.get_all_users()
-            all_movies = []
-            for user in users:
-                movies = user.get("movies", [])
-                all_movies.extend(movies)
-
-            top_rated_movies = sorted(
-                all_movies, key=lambda x: x["rating"], reverse=True)[:n]
-            return top_rated_movies
+            with self._lock:
+                return self._view(TopRatedMovies).top(n)
         except KeyError:
             return "KeyError: Error retrieving top-rated movies"
 
@@ -255,17 +554,8 @@ class CSVDataManager(DataManagerInterface):
             dict: A dictionary with movie counts per year.
         """
         try:
-            users = self.get_all_users()
-            movie_count_per_year = {}
-            for user in users:
-                movies = user.get("movies", [])
-                for movie in movies:
-                    year = movie.get("year")
-                    if year in movie_count_per_year:
-                        movie_count_per_year[year] += 1
-                    else:
-                        movie_count_per_year[year] = 1
-            return movie_count_per_year
+            with self._lock:
+                return self._view(YearHistogram).counts()
         except KeyError:
             return "KeyError: Error retrieving movie count per year"
 
@@ -298,8 +588,7 @@ class CSVDataManager(DataManagerInterface):
         Returns:
             bool: True if the user was added successfully, False otherwise.
         """
-        try:
-            users = self.get_all_users()
+        def operation(users):
             user_id = max([int(user["id"]) for user in users], default=0) + 1
             new_user = {
                 "id": str(user_id),
@@ -307,37 +596,24 @@ class CSVDataManager(DataManagerInterface):
                 "movies": []
             }
             users.append(new_user)
-            self.save_db(users)
-            return True
+            return [("add_user", new_user["id"], {"name": name, "movies": {}})], True
+
+        try:
+            return self._submit(operation)
         except KeyError:
             return f"KeyError: Error adding user"
 
     def create_movie_list(self):
         """
-        Create a list of movies based on the provided JSON data.
+        Create a list of the distinct movies of all users.
 
+        Movies count as the same when their name, director and year match.
+        The list comes from the MovieCatalog view, which writes keep up to
+        date, and must not be modified.
 
         Returns:
             list: A list of dictionaries representing movies, with each dictionary
-                containing movie details such as ID, name, director, year, rating,
-                and the user's name.
+                containing the movie's name, director, year, rating and poster.
         """
-        movie_list = []
-        users = self.get_all_users()
-        for user in users:
-            user_id = user['id']
-            name = user['name']
-            movies = user.get('movies', [])
-            for movie in movies:
-                movie_id = movie['id']
-                movie = {
-                    'name': movie['name'],
-                    'director': movie['director'],
-                    'year': int(movie['year']),
-                    'rating': float(movie['rating']),
-                    'poster': movie['poster']
-                }
-                if movie not in movie_list:
-                    movie_list.append(movie)
-
-        return movie_list
+        with self._lock:
+            return self._view(MovieCatalog).movie_list()
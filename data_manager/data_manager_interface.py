@@ -35,6 +35,14 @@ class DataManagerInterface(ABC):
     def get_users_by_name(self, name):
         pass
 
+    @abstractmethod
+    def search_movies(self, query, page=1, per_page=20):
+        pass
+
+    @abstractmethod
+    def query_movies(self, filter=None, sort="rating", limit=20, cursor=None):
+        pass
+
     @abstractmethod
     def get_top_rated_movies(self, n):
         pass
@@ -50,3 +58,56 @@ class DataManagerInterface(ABC):
     @abstractmethod
     def add_user(self, name):
         pass
+
+    @abstractmethod
+    def apply(self, operations):
+        pass
+
+    def add_user_movies(self, user_id, movies):
+        """
+        Add movies to a user's list with one write, all or none of them.
+
+        Args:
+            user_id (str): The ID of the user.
+            movies (list): Dicts with each movie's name, director, year,
+                rating and poster.
+
+        Returns:
+            list: The IDs of the new movies, in order.
+
+        Raises:
+            ValueError: If the user doesn't exist or a movie is malformed.
+        """
+        return self.apply([{"op": "add_movie", "user_id": user_id, "movie": movie}
+                           for movie in movies])
+
+    def delete_user_movies(self, user_id, movie_ids):
+        """
+        Delete movies from a user's list with one write, all or none of them.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_ids (list): The IDs of the movies to be deleted.
+
+        Returns:
+            list: The IDs of the deleted movies.
+
+        Raises:
+            ValueError: If the user or one of the movies doesn't exist.
+        """
+        return self.apply([{"op": "delete_movie", "user_id": user_id, "movie_id": movie_id}
+                           for movie_id in movie_ids])
+
+    @abstractmethod
+    def get_data_version(self):
+        pass
+
+    @abstractmethod
+    def get_user_version(self, user_id):
+        pass
+
+    def pin(self):
+        pass
+
+    def unpin(self):
+        pass
@@ -0,0 +1,275 @@
+import os
+import threading
+
+
+class CachedFileMixin:
+    """
+    Keeps the decoded contents of a data file, and views derived from them,
+    in memory for the file-based data managers.
+
+    Subclasses provide _read_db() to parse the file and call _init_cache()
+    from their constructor. They add the bytes they read and write to
+    ``bytes_read`` and ``bytes_written``, and report their own successful
+    writes through _bump_versions(). With the cache disabled every load
+    parses the file again and views are built for each call.
+
+    The decoded data is never modified once loaded: writers build a new
+    version sharing everything they didn't change and publish it by
+    swapping one reference, so readers only wait for that swap, never for
+    a write to disk. A thread can pin() the current version to see the same
+    data across several calls, e.g. for the length of a request; versions
+    no reader holds any more are freed by reference counting.
+
+    Data versions are nanosecond timestamps taken from the file's mtime,
+    so every process reading the same file agrees on them. A change by
+    another process bumps the version of all users, since it is unknown
+    which ones it touched; a write by this data manager only bumps the
+    users it changed.
+    """
+
+    def _init_cache(self, filename, cache):
+        """
+        Set up the cache state.
+
+        Args:
+            filename (str): The filename of the data file.
+            cache (bool): Keep the decoded file in memory and only parse it
+                again when its mtime, size or inode changes. Data returned
+                by the read methods is then shared and must not be modified.
+        """
+        self.filename = filename
+        self.cache = cache
+        self._users = None
+        self._stamp = None
+        self._lock = threading.RLock()
+        self._views = {}
+        self._views_source = None
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self._version = 0
+        self._version_stamp = None
+        self._base_version = 0
+        self._user_versions = {}
+        self._pins = threading.local()
+
+    def _file_stamp(self):
+        """
+        Identify the current version of the data file on disk.
+
+        Returns:
+            tuple: The file's mtime, size and inode, or None if it is missing.
+        """
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _stamp_version(self, stamp):
+        """
+        Turn a file stamp into a data version.
+
+        Args:
+            stamp (tuple): A value returned by _file_stamp().
+
+        Returns:
+            int: The file's mtime in nanoseconds.
+        """
+        return stamp[0] if stamp else 0
+
+    def _refresh_versions(self):
+        """Bump all versions if the file changed since they were last set."""
+        stamp = self._file_stamp()
+        with self._lock:
+            if stamp != self._version_stamp:
+                self._version = max(self._version + 1, self._stamp_version(stamp))
+                self._version_stamp = stamp
+                self._base_version = self._version
+                self._user_versions = {}
+
+    def _bump_versions(self, user_ids):
+        """
+        Bump the versions after a successful write by this data manager.
+
+        Args:
+            user_ids (iterable): The IDs of the users the write changed.
+        """
+        stamp = self._file_stamp()
+        with self._lock:
+            self._version = max(self._version + 1, self._stamp_version(stamp))
+            if self._version_stamp is None:
+                self._base_version = self._version
+            self._version_stamp = stamp
+            for user_id in user_ids:
+                self._user_versions[str(user_id)] = self._version
+
+    def get_data_version(self):
+        """
+        Retrieve the version of all data, which grows with every change.
+
+        Only the file's metadata is checked, the file isn't read.
+
+        Returns:
+            int: The data version.
+        """
+        self._refresh_versions()
+        return self._version
+
+    def get_user_version(self, user_id):
+        """
+        Retrieve the version of one user's data, which grows with every
+        change to that user.
+
+        Args:
+            user_id (str): The ID of the user.
+
+        Returns:
+            int: The user's data version.
+        """
+        self._refresh_versions()
+        with self._lock:
+            return self._user_versions.get(str(user_id), self._base_version)
+
+    def pin(self):
+        """
+        Make this thread's reads see one version of the data until unpin()
+        is called, whatever is written meanwhile.
+
+        The version is the latest one at the first read after the call, so
+        versions checked before reading, e.g. for an ETag, are never newer
+        than the data read. Pins nest; views, and writes, always use the
+        latest version.
+        """
+        self._pins.depth = getattr(self._pins, "depth", 0) + 1
+
+    def unpin(self):
+        """Release the version pinned by the matching pin() call."""
+        self._pins.depth -= 1
+        if self._pins.depth == 0:
+            self._pins.data = None
+
+    def _load(self):
+        """
+        Return the data this thread reads: the version it pinned, if any,
+        else the latest one.
+
+        Returns:
+            object: The decoded file, as returned by _read_db().
+        """
+        if not getattr(self._pins, "depth", 0):
+            return self._latest()
+        if getattr(self._pins, "data", None) is None:
+            self._pins.data = self._latest()
+        return self._pins.data
+
+    def _latest(self):
+        """
+        Return the decoded file, from memory while the cached copy is still
+        current.
+
+        The stamp is taken before the file is read, so a write that lands in
+        between only causes one extra reload later on.
+
+        Returns:
+            object: The decoded file, as returned by _read_db().
+        """
+        if not self.cache:
+            return self._read_db()
+        stamp = self._file_stamp()
+        with self._lock:
+            if self._users is None or stamp != self._stamp:
+                self._users = self._read_db()
+                self._stamp = stamp
+            return self._users
+
+    def _view_users(self, data):
+        """
+        Convert the decoded file to the users.json layout views expect.
+
+        Args:
+            data (object): The decoded file.
+
+        Returns:
+            dict: A dictionary representing the users.
+        """
+        return data
+
+    def _view(self, view_class):
+        """
+        Return a view of the current data, building it if needed.
+
+        Views are kept for as long as the cached data stays current and the
+        mutation methods keep them up to date. Callers must hold the lock
+        while they read from the view.
+
+        Args:
+            view_class (type): A MovieView subclass.
+
+        Returns:
+            MovieView: The view.
+        """
+        data = self._latest()
+        if self._views_source is not data:
+            self._views = {}
+            self._views_source = data
+        view = self._views.get(view_class)
+        if view is None:
+            view = view_class()
+            view.rebuild(self._view_users(data))
+            self._views[view_class] = view
+        return view
+
+    def _publish(self, current, users, changes, replay):
+        """
+        Make a new version of the data the cached copy, after it was saved.
+
+        The views are brought up to date by replaying the changes on the
+        users they touched, if they were built from ``current`` and it is
+        still the cached copy; otherwise they are dropped. The data is
+        saved already, so a view failing to take a change is dropped as
+        well rather than failing the write.
+
+        Args:
+            current (object): The version the changes were applied to.
+            users (object): The new version.
+            changes (list): The changes.
+            replay (callable): Applies the changes to a copy of the touched
+                users of ``current`` and to the views passed along.
+        """
+        if not self.cache:
+            return
+        with self._lock:
+            if self._users is current and self._views_source is current:
+                try:
+                    replay(list(self._views.values()))
+                    self._views_source = users
+                except Exception:
+                    self._drop_views()
+            else:
+                self._drop_views()
+            self._users = users
+            self._stamp = self._file_stamp()
+
+    def _drop_views(self):
+        """Forget all views, e.g. after a failed write."""
+        self._views = {}
+        self._views_source = None
+
+    def check_views(self):
+        """
+        Compare every view built so far with one rebuilt from scratch.
+
+        Meant for tests of the incremental view maintenance.
+
+        Returns:
+            list: The names of the views that differ from a full rebuild.
+        """
+        with self._lock:
+            users = self._view_users(self._latest())
+            inconsistent = []
+            for view_class, view in self._views.items():
+                rebuilt = view_class()
+                rebuilt.rebuild(users)
+                if view.dump() != rebuilt.dump():
+                    inconsistent.append(view_class.__name__)
+            return inconsistent
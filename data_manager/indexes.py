@@ -0,0 +1,206 @@
+from data_manager.views import MovieView
+
+
+def _sorted_ids(user_ids):
+    """
+    Order user IDs the way users.json lists them.
+
+    Args:
+        user_ids (iterable): User IDs as strings.
+
+    Returns:
+        list: The user IDs as integers, in ascending order.
+    """
+    return sorted(int(user_id) for user_id in user_ids)
+
+
+class UserNameIndex(MovieView):
+    """Maps user names to the IDs of the users with that name."""
+
+    def __init__(self):
+        """Initialize an empty UserNameIndex."""
+        self.clear()
+
+    def clear(self):
+        """Forget all users."""
+        self._by_name = {}
+
+    def add_user(self, user_id, user):
+        """
+        Record a new user.
+
+        Args:
+            user_id (str): The ID of the user.
+            user (dict): The user's data.
+        """
+        self._by_name.setdefault(user.get("name"), set()).add(user_id)
+
+    def dump(self):
+        """
+        Describe the index for comparison with a rebuilt one.
+
+        Returns:
+            dict: The index itself.
+        """
+        return self._by_name
+
+    def users_by_name(self, name):
+        """
+        Look up the users with a name.
+
+        Args:
+            name (str): The name of the user.
+
+        Returns:
+            list: A list of user IDs.
+        """
+        return _sorted_ids(self._by_name.get(name, ()))
+
+
+class MovieMembershipIndex(MovieView):
+    """Maps movie IDs and movie titles to the users who have them."""
+
+    def __init__(self):
+        """Initialize an empty MovieMembershipIndex."""
+        self.clear()
+
+    def clear(self):
+        """Forget all movies."""
+        self._by_movie_id = {}
+        self._by_title = {}
+
+    @staticmethod
+    def _discard(index, key, user_id):
+        """
+        Remove one occurrence of a user from an index entry.
+
+        Entries count occurrences, since a user can hold the same title
+        under several movie IDs.
+
+        Args:
+            index (dict): The index to update.
+            key (str): The entry's key.
+            user_id (str): The ID of the user.
+        """
+        users = index.get(key, {})
+        users[user_id] = users.get(user_id, 0) - 1
+        if users[user_id] <= 0:
+            users.pop(user_id, None)
+        if not users:
+            index.pop(key, None)
+
+    def add_movie(self, user_id, movie_id, movie):
+        """
+        Record a movie added to a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data.
+        """
+        for index, key in ((self._by_movie_id, movie_id), (self._by_title, movie['name'])):
+            users = index.setdefault(key, {})
+            users[user_id] = users.get(user_id, 0) + 1
+
+    def remove_movie(self, user_id, movie_id, movie):
+        """
+        Forget a movie removed from a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data as it was recorded.
+        """
+        self._discard(self._by_movie_id, movie_id, user_id)
+        self._discard(self._by_title, movie['name'], user_id)
+
+    def dump(self):
+        """
+        Describe the index for comparison with a rebuilt one.
+
+        Returns:
+            tuple: The movie ID and title indexes.
+        """
+        return (self._by_movie_id, self._by_title)
+
+    def users_with_movie(self, movie_id):
+        """
+        Look up the users who have a movie ID.
+
+        Args:
+            movie_id (str): The ID of the movie.
+
+        Returns:
+            list: A list of user IDs.
+        """
+        return _sorted_ids(self._by_movie_id.get(str(movie_id), ()))
+
+    def users_with_title(self, title):
+        """
+        Look up the users who have a movie with this title.
+
+        Args:
+            title (str): The name of the movie.
+
+        Returns:
+            list: A list of user IDs.
+        """
+        return _sorted_ids(self._by_title.get(title, ()))
+
+
+class DirectorIndex(MovieView):
+    """Maps directors to their movies in all users' lists."""
+
+    def __init__(self):
+        """Initialize an empty DirectorIndex."""
+        self.clear()
+
+    def clear(self):
+        """Forget all movies."""
+        self._by_director = {}
+
+    def add_movie(self, user_id, movie_id, movie):
+        """
+        Record a movie added to a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data.
+        """
+        self._by_director.setdefault(movie['director'], {})[(user_id, movie_id)] = movie
+
+    def remove_movie(self, user_id, movie_id, movie):
+        """
+        Forget a movie removed from a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data as it was recorded.
+        """
+        movies = self._by_director.get(movie['director'], {})
+        movies.pop((user_id, movie_id), None)
+        if not movies:
+            self._by_director.pop(movie['director'], None)
+
+    def dump(self):
+        """
+        Describe the index for comparison with a rebuilt one.
+
+        Returns:
+            dict: The index itself.
+        """
+        return self._by_director
+
+    def movies_by_director(self, director):
+        """
+        Look up the movies of a director.
+
+        Args:
+            director (str): The director's name as stored with the movies.
+
+        Returns:
+            list: The movies, one per user who has them.
+        """
+        return list(self._by_director.get(director, {}).values())
@@ -0,0 +1,351 @@
+import json
+import os
+import tempfile
+import threading
+from data_manager.json_data_manager import JSONDataManager
+
+
+class JournaledJSONDataManager(JSONDataManager):
+    """
+    A JSON data manager that appends changes to a log instead of rewriting
+    the whole file.
+
+    The JSON file is a snapshot. Every mutation appends one line holding its
+    change records to ``<filename>.log`` and fsyncs it, so a write costs the
+    size of the change. Once the log holds ``compact_threshold`` lines it is
+    folded back into the snapshot. Loading parses the snapshot and replays
+    the log on top of it.
+
+    Compaction first renames the log to ``<filename>.log.compacting`` so new
+    writes go to a fresh log, then writes the snapshot to a temporary file
+    and renames it over the old one, and finally removes the renamed log.
+    A crash at any point leaves files that replay to the same users, because
+    change records set values and replaying one twice is harmless. The
+    snapshot is written without the file lock, but only moved into place,
+    and the renamed log removed, while holding it, so writers, which load
+    under the lock, never see one without the other. Loads that race with
+    that step see the snapshot or the renamed log change and read again.
+    Loads skip an unfinished last line, which may be an append in progress in
+    another process; a line torn by a crash is cut off by the next append,
+    which holds the file lock.
+    """
+
+    def __init__(self, filename, compact_threshold=1000, background=True,
+                 fsync=True) -> None:
+        """
+        Initialize the JournaledJSONDataManager.
+
+        Args:
+            filename (str): The filename of the JSON snapshot.
+            compact_threshold (int): The number of log lines that triggers
+                a compaction.
+            background (bool): Write the compacted snapshot in a background
+                thread instead of during the triggering mutation.
+            fsync (bool): Flush every log append to disk before returning.
+        """
+        super().__init__(filename, cache=True)
+        self.log_filename = filename + ".log"
+        self.compacting_filename = self.log_filename + ".compacting"
+        self.compact_threshold = compact_threshold
+        self.background = background
+        self.fsync = fsync
+        self._log_lines = 0
+        self._compaction = None
+
+    def _file_stamp(self):
+        """
+        Identify the current version of the snapshot and both logs.
+
+        Returns:
+            tuple: The stamps of the snapshot, the compacting log and the log.
+        """
+        stamps = []
+        for path in (self.filename, self.compacting_filename, self.log_filename):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stamps.append(None)
+                continue
+            stamps.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        if stamps[0] is None:
+            return None
+        return tuple(stamps)
+
+    def _stamp_version(self, stamp):
+        """
+        Turn a stamp of the snapshot and logs into a data version.
+
+        Args:
+            stamp (tuple): A value returned by _file_stamp().
+
+        Returns:
+            int: The latest mtime of the files, in nanoseconds.
+        """
+        return max((part[0] for part in stamp or () if part), default=0)
+
+    def _read_db(self):
+        """
+        Parse the snapshot and replay the logs on top of it.
+
+        If a compaction replaced the snapshot or rotated the log meanwhile,
+        the files read may not add up, so they are read again.
+
+        Returns:
+            dict: A dictionary representing the users.
+        """
+        while True:
+            before = self._file_stamp()
+            users = super()._read_db()
+            self._replay(users, self.compacting_filename)
+            self._log_lines = self._replay(users, self.log_filename)
+            after = self._file_stamp()
+            if before is None or after is None:
+                return users
+            # Appends to the log are replayed or not, but a rotation isn't
+            log_inodes = [stamp[2] and stamp[2][2] for stamp in (before, after)]
+            if before[:2] == after[:2] and log_inodes[0] == log_inodes[1]:
+                return users
+
+    def _replay(self, users, path):
+        """
+        Apply the change records stored in a log file.
+
+        A last line that doesn't parse is skipped, but left in the file:
+        without the file lock it can't be told from an append still being
+        written. A bad line anywhere else is real corruption.
+
+        Args:
+            users (dict): The users to apply the changes to.
+            path (str): The log file.
+
+        Returns:
+            int: The number of lines replayed.
+        """
+        try:
+            with open(path, "rb") as log:
+                lines = log.readlines()
+        except FileNotFoundError:
+            return 0
+        self.bytes_read += sum(map(len, lines))
+        for number, line in enumerate(lines):
+            try:
+                changes = json.loads(line)
+            except json.JSONDecodeError:
+                if number != len(lines) - 1:
+                    raise
+                return number
+            for change in changes:
+                self._apply_change(users, change)
+        return len(lines)
+
+    def _cut_torn_line(self):
+        """
+        Cut an unfinished last line off the log, so the next append starts
+        on a line of its own.
+
+        Callers hold the file lock, so no append is in progress and an
+        unfinished line was torn by a crash.
+        """
+        try:
+            log = open(self.log_filename, "r+b")
+        except FileNotFoundError:
+            return
+        with log:
+            end = log.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            log.seek(end - 1)
+            if log.read(1) == b"\n":
+                return
+            position = end - 1
+            while position > 0:
+                start = max(position - 65536, 0)
+                log.seek(start)
+                chunk = log.read(position - start)
+                newline = chunk.rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                log.truncate(position)
+
+    def _commit(self, current, users, changes):
+        """
+        Append the change records to the log and make ``users`` the cached
+        copy.
+
+        Args:
+            current (dict): The users the changes were applied to.
+            users (dict): The users after the changes.
+            changes (list): The change records that produced ``users``.
+
+        Returns:
+            bool: True if the changes were logged successfully, False otherwise.
+        """
+        line = json.dumps(changes, separators=(",", ":")) + "\n"
+        try:
+            self._cut_torn_line()
+            with open(self.log_filename, "a") as log:
+                log.write(line)
+                log.flush()
+                if self.fsync:
+                    os.fsync(log.fileno())
+            self.bytes_written += len(line.encode())
+        except IOError:
+            with self._lock:
+                self._users = None
+                self._drop_views()
+            return False
+        self._publish(current, users, changes, self._replayer(current, changes))
+        self._log_lines += 1
+        if self._log_lines >= self.compact_threshold:
+            self.compact(wait=not self.background)
+        return True
+
+    def _write_temp(self, data):
+        """
+        Write a snapshot of ``data`` to a new temporary file next to the
+        snapshot.
+
+        Args:
+            data (dict): The users to write.
+
+        Returns:
+            str: The path of the temporary file.
+        """
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.filename)), suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w") as jfile:
+                json.dump(data, jfile, indent=4)
+                jfile.flush()
+                os.fsync(jfile.fileno())
+                self.bytes_written += os.fstat(jfile.fileno()).st_size
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return temp_path
+
+    def _write_snapshot(self, data):
+        """
+        Atomically replace the snapshot with ``data``.
+
+        Args:
+            data (dict): The users to write.
+        """
+        temp_path = self._write_temp(data)
+        try:
+            os.replace(temp_path, self.filename)
+        except OSError:
+            os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def _inode(path):
+        """
+        Identify a file, or its absence.
+
+        Args:
+            path (str): The file.
+
+        Returns:
+            tuple: The file's device and inode, or None if it doesn't exist.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_dev, stat.st_ino)
+
+    def _finish_compaction(self, users, rotated):
+        """
+        Write the snapshot for a compaction and drop the folded log.
+
+        The snapshot is written first, then moved into place and the log
+        removed under the file lock, unless the log was folded meanwhile,
+        by save_db() or a compaction in another process.
+
+        Args:
+            users (dict): The users as of the log rotation.
+            rotated (tuple): The _inode() of the renamed log.
+        """
+        try:
+            temp_path = self._write_temp(users)
+        except OSError:
+            # The compacting log is kept and replayed on the next load
+            return
+        with self._coordinator.file_lock:
+            try:
+                if self._inode(self.compacting_filename) != rotated:
+                    os.remove(temp_path)
+                    return
+                os.replace(temp_path, self.filename)
+                os.remove(self.compacting_filename)
+            except OSError:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                return
+            with self._lock:
+                if self._users is not None:
+                    self._stamp = self._file_stamp()
+
+    def compact(self, wait=True):
+        """
+        Fold the log into the snapshot.
+
+        A compacting log left behind by a crash is folded in first; the
+        current log is then rotated by the next compaction.
+
+        Args:
+            wait (bool): Write the snapshot before returning instead of in a
+                background thread.
+
+        Returns:
+            bool: True if a compaction was started, False if one is running
+                already or there is nothing to fold.
+        """
+        with self._coordinator.file_lock, self._lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return False
+            users = self._latest()
+            if not os.path.exists(self.compacting_filename):
+                try:
+                    os.replace(self.log_filename, self.compacting_filename)
+                except FileNotFoundError:
+                    return False
+                self._log_lines = 0
+                self._stamp = self._file_stamp()
+            rotated = self._inode(self.compacting_filename)
+            if wait:
+                self._finish_compaction(users, rotated)
+                return True
+            self._compaction = threading.Thread(
+                target=self._finish_compaction, args=(users, rotated), daemon=True)
+            self._compaction.start()
+        return True
+
+    def save_db(self, data):
+        """
+        Replace the snapshot with ``data`` and clear the logs.
+
+        A background compaction still writing its snapshot finds its log
+        gone and drops its snapshot.
+
+        Args:
+            data (dict): The data to be saved.
+
+        Returns:
+            bool: True if the data was saved successfully, False otherwise.
+        """
+        with self._coordinator.file_lock, self._lock:
+            try:
+                self._write_snapshot(data)
+                for path in (self.compacting_filename, self.log_filename):
+                    if os.path.exists(path):
+                        os.remove(path)
+            except IOError:
+                return {"IOError: An error occurred while writing to the file."}
+            self._users = None
+            self._log_lines = 0
+            return True
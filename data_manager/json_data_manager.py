@@ -1,18 +1,212 @@
 import json
+import os
+import tempfile
+from collections import ChainMap
+from data_manager.aggregates import TopRatedMovies, YearHistogram
+from data_manager.batch import MOVIE_FIELDS, check_operations
+from data_manager.catalog import MovieCatalog
 from data_manager.data_manager_interface import DataManagerInterface
+from data_manager.file_cache import CachedFileMixin
+from data_manager.indexes import DirectorIndex, MovieMembershipIndex, UserNameIndex
+from data_manager.query import MovieQueryIndex, check_query, decode_cursor
+from data_manager.search import SearchIndex
+from data_manager.write_coordinator import WriteCoordinator
 
 
-class JSONDataManager(DataManagerInterface):
-    """A data manager that interacts with a JSON file."""
+class JSONDataManager(CachedFileMixin, DataManagerInterface):
+    """
+    A data manager that interacts with a JSON file.
 
-    def __init__(self, filename) -> None:
+    Mutations go through a WriteCoordinator: they are planned against the
+    users on disk with ``<filename>.lock`` held, so processes sharing the
+    file don't overwrite each other's changes, and concurrent ones are
+    saved together in one write.
+    """
+
+    def __init__(self, filename, cache=False, commit_window=0.0) -> None:
         """
         Initialize the JSONDataManager.
 
         Args:
             filename (str): The filename of the JSON file.
+            cache (bool): Keep the decoded file in memory and only parse it
+                again when its mtime, size or inode changes. Data returned
+                by the read methods is then shared and must not be modified.
+            commit_window (float): Seconds a write waits for others to save
+                along with it, see WriteCoordinator.
+        """
+        self._init_cache(filename, cache)
+        self._coordinator = WriteCoordinator(filename + ".lock", self._run_batch,
+                                             commit_window)
+
+    def _read_db(self):
+        """
+        Parse the JSON file.
+
+        Returns:
+            dict: A dictionary representing the users.
         """
-        self.filename = filename
+        with open(self.filename, "r") as jfile:
+            users = json.load(jfile)
+            self.bytes_read += os.fstat(jfile.fileno()).st_size
+        return users
+
+    @staticmethod
+    def _apply_change(users, change, views=()):
+        """
+        Apply one change record to ``users``.
+
+        Change records are small JSON-serializable dicts, one per mutation:
+        ``add_user`` (user_id, name), ``put_movie`` (user_id, movie_id, movie)
+        and ``delete_movie`` (user_id, movie_id). Each one sets a value
+        rather than adjusting it, so replaying a record twice is harmless.
+        The touched user is copied first, so dicts shared with readers of
+        the cached copy are never modified.
+
+        Args:
+            users (dict): The users to modify.
+            change (dict): The change record.
+            views (list): MovieViews to update along with ``users``.
+        """
+        user_id = change["user_id"]
+        if change["op"] == "add_user":
+            users[user_id] = {"name": change["name"], "movies": {}}
+            for view in views:
+                view.add_user(user_id, users[user_id])
+            return
+        new_user = user_id not in users
+        user = dict(users.get(user_id, {}))
+        user["movies"] = dict(user.get("movies", {}))
+        old_movie = user["movies"].get(change.get("movie_id"))
+        if change["op"] == "put_movie":
+            user["movies"][change["movie_id"]] = change["movie"]
+        elif change["op"] == "delete_movie":
+            user["movies"].pop(change["movie_id"], None)
+        else:
+            raise ValueError(f"Unknown change: {change['op']}")
+        users[user_id] = user
+        for view in views:
+            if new_user:
+                view.add_user(user_id, user)
+            if old_movie is not None:
+                view.remove_movie(user_id, change["movie_id"], old_movie)
+            if change["op"] == "put_movie":
+                view.add_movie(user_id, change["movie_id"], change["movie"])
+
+    def _apply(self, changes):
+        """
+        Apply change records to a copy of the users and persist them.
+
+        Only the touched users are copied, everything else is shared with
+        the current version. Callers hold the write coordinator's lock, so
+        no other write runs meanwhile, and readers keep using the current
+        version until the new one is saved and published.
+
+        Args:
+            changes (list): The change records, see _apply_change.
+
+        Returns:
+            dict: The users after the changes.
+        """
+        current = self._latest()
+        users = dict(current)
+        for change in changes:
+            self._apply_change(users, change)
+        if self._commit(current, users, changes):
+            self._bump_versions({change["user_id"] for change in changes})
+        return users
+
+    def _replayer(self, current, changes):
+        """
+        Prepare the view updates of a write for _publish().
+
+        Args:
+            current (dict): The users before the changes.
+            changes (list): The change records.
+
+        Returns:
+            callable: Applies the changes to copies of the touched users
+                and to the views it is given.
+        """
+        def replay(views):
+            touched = {change["user_id"]: current[change["user_id"]]
+                       for change in changes if change["user_id"] in current}
+            for change in changes:
+                self._apply_change(touched, change, views)
+        return replay
+
+    def _submit(self, user_ids, plan):
+        """
+        Run a planned mutation through the write coordinator.
+
+        Every write here locks the whole file, so ``user_ids`` is unused; it
+        is the hook ShardedJSONDataManager uses to lock only the shards a
+        mutation touches, and callers pass it for that subclass.
+
+        Args:
+            user_ids (iterable): Unused here. The IDs of the users the
+                mutation changes, or None when it adds a new user. None
+                among the IDs stands for a new user as well.
+            plan (callable): Takes the current users and returns the change
+                records of the mutation and the value to return. It may run
+                in another thread, along with the plans of other writes.
+
+        Returns:
+            object: The value returned by ``plan``.
+        """
+        return self._coordinator.submit(plan)
+
+    def _run_batch(self, plans):
+        """
+        Run planned mutations one after the other and save them together.
+
+        Called by the write coordinator with the file locked, so the loaded
+        users include every write of other processes.
+
+        Args:
+            plans (list): The plans, see _submit.
+
+        Returns:
+            list: The value each plan returned, or the exception it raised.
+        """
+        # Later plans see the changes of earlier ones in the overlay
+        users = ChainMap({}, self._latest())
+        changes = []
+        results = []
+        for plan in plans:
+            try:
+                plan_changes, result = plan(users)
+            except Exception as error:
+                results.append(error)
+                continue
+            for change in plan_changes:
+                self._apply_change(users, change)
+            changes += plan_changes
+            results.append(result)
+        if changes:
+            self._apply(changes)
+        return results
+
+    def _commit(self, current, users, changes):
+        """
+        Save the users and make them the cached copy.
+
+        Args:
+            current (dict): The users the changes were applied to.
+            users (dict): The data to be saved.
+            changes (list): The change records that produced ``users``.
+
+        Returns:
+            bool: True if the data was saved successfully, False otherwise.
+        """
+        saved = self.save_db(users) is True
+        if saved:
+            self._publish(current, users, changes, self._replayer(current, changes))
+        elif self.cache:
+            with self._lock:
+                self._users = None
+                self._drop_views()
+        return saved
 
     def get_all_users(self):
         """
@@ -22,9 +216,7 @@ class JSONDataManager(DataManagerInterface):
             dict: A dictionary representing the users.
         """
         try:
-            with open(self.filename, "r") as jfile:
-                users = json.load(jfile)
-            return users
+            return self._load()
         except FileNotFoundError:
             # Handle the exception when the file is not found
             return {"Error: File Not Found"}
@@ -43,9 +235,21 @@ class JSONDataManager(DataManagerInterface):
             bool: True if the data was saved successfully, False otherwise.
         """
         try:
-            with open(self.filename, "w") as jfile:
-                json.dump(data, jfile, indent=4)
-                return True
+            # Readers always see a complete file thanks to the rename
+            descriptor, temp_filename = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.filename)), suffix=".tmp")
+            try:
+                with os.fdopen(descriptor, "w") as jfile:
+                    # default=dict writes movies kept as other Mappings, e.g. CompactMovie
+                    json.dump(data, jfile, indent=4, default=dict)
+                    jfile.flush()
+                    os.fsync(jfile.fileno())
+                    self.bytes_written += os.fstat(jfile.fileno()).st_size
+                os.replace(temp_filename, self.filename)
+            except BaseException:
+                os.unlink(temp_filename)
+                raise
+            return True
         except IOError:
             # Handle the exception when there is an IO error while saving the data
             return {"IOError: An error occurred while writing to the file."}
@@ -78,13 +282,12 @@ class JSONDataManager(DataManagerInterface):
         Returns:
             dict: The updated list of movies for the user.
         """
-        try:
-            users = self.get_all_users()
-            user = users.get(str(user_id), {})
-            movies = user.get("movies", {})
+        user_id = str(user_id)
 
-            movie_id = max(
-                map(lambda item: (int(item[0])), movies.keys()), default=0) + 1
+        def plan(users):
+            movies = users.get(user_id, {}).get("movies", {})
+
+            movie_id = max(map(int, movies.keys()), default=0) + 1
             movie = {
                 'name': name,
                 'director': director,
@@ -92,18 +295,86 @@ class JSONDataManager(DataManagerInterface):
                 'rating': rating,
                 'poster': poster
             }
-            movies[movie_id] = movie
-
-            user["movies"] = movies
-            users[str(user_id)] = user
+            return ([{"op": "put_movie", "user_id": user_id,
+                      "movie_id": str(movie_id), "movie": movie}],
+                    {**movies, str(movie_id): movie})
 
-            self.save_db(users)
-
-            return movies
+        try:
+            return self._submit([user_id], plan)
         except KeyError:
             # Handle the exception when the specified key is not found
             return {"KeyError: Key not found in the dictionary."}
 
+    def apply(self, operations):
+        """
+        Run a batch of mutations as one transaction.
+
+        The batch is planned against one load of the users and saved with
+        one write. Every operation is checked before anything is changed,
+        so either all of them are saved or none is.
+
+        Args:
+            operations (list): The operations, see batch.check_operations.
+
+        Returns:
+            list: Per operation, the ID of the new user or of the movie added,
+                updated or deleted.
+
+        Raises:
+            ValueError: If an operation is malformed or refers to a user or
+                movie that doesn't exist.
+        """
+        operations = check_operations(operations)
+        user_ids = [operation["user_id"] for operation in operations if "user_id" in operation]
+        if len(user_ids) < len(operations):
+            # Lock as for add_user
+            user_ids.append(None)
+
+        def plan(users):
+            # Later operations see the changes of earlier ones
+            working = ChainMap({}, users)
+            next_user_id = None
+            next_movie_ids = {}
+            changes = []
+            results = []
+            for number, operation in enumerate(operations):
+                if operation["op"] == "add_user":
+                    if next_user_id is None:
+                        next_user_id = max(map(int, users.keys()), default=0) + 1
+                    change = {"op": "add_user", "user_id": str(next_user_id),
+                              "name": operation["name"]}
+                    next_user_id += 1
+                    results.append(change["user_id"])
+                else:
+                    user_id = operation["user_id"]
+                    if user_id not in working:
+                        raise ValueError(f"Operation {number}: user {user_id} not found")
+                    movies = working[user_id].get("movies", {})
+                    if operation["op"] == "add_movie":
+                        if user_id not in next_movie_ids:
+                            next_movie_ids[user_id] = max(map(int, movies.keys()), default=0) + 1
+                        movie_id = str(next_movie_ids[user_id])
+                        next_movie_ids[user_id] += 1
+                        movie = {field: operation["movie"][field] for field in MOVIE_FIELDS}
+                    else:
+                        movie_id = operation["movie_id"]
+                        if movie_id not in movies:
+                            raise ValueError(
+                                f"Operation {number}: movie {movie_id} of user {user_id} not found")
+                        if operation["op"] == "update_movie":
+                            movie = {**movies[movie_id], **operation["movie"]}
+                    if operation["op"] == "delete_movie":
+                        change = {"op": "delete_movie", "user_id": user_id, "movie_id": movie_id}
+                    else:
+                        change = {"op": "put_movie", "user_id": user_id,
+                                  "movie_id": movie_id, "movie": movie}
+                    results.append(movie_id)
+                self._apply_change(working, change)
+                changes.append(change)
+            return changes, results
+
+        return self._submit(user_ids, plan)
+
     def delete_user_movie(self, user_id, movie_id):
         """
         Delete a movie from a user's list of movies.
@@ -115,19 +386,16 @@ class JSONDataManager(DataManagerInterface):
         Returns:
             bool: True if the movie was deleted successfully, False otherwise.
         """
-        try:
-            users = self.get_all_users()
-            user = users.get(str(user_id), {})
-            movies = user.get("movies", {})
+        user_id, movie_id = str(user_id), str(movie_id)
 
-            if str(movie_id) in movies:
-                del movies[str(movie_id)]
-                user["movies"] = movies
-                users[str(user_id)] = user
-                self.save_db(users)
-                return True
+        def plan(users):
+            if movie_id in users.get(user_id, {}).get("movies", {}):
+                return [{"op": "delete_movie", "user_id": user_id,
+                         "movie_id": movie_id}], True
+            return [], False
 
-            return False
+        try:
+            return self._submit([user_id], plan)
         except KeyError:
             # Handle the exception when the specified key is not found
             print("KeyError: Key not found in the dictionary.")
@@ -145,19 +413,18 @@ class JSONDataManager(DataManagerInterface):
         Returns:
             bool: True if the movie was updated successfully, False otherwise.
         """
-        try:
-            users = self.get_all_users()
-            user = users.get(str(user_id), {})
-            movies = user.get("movies", {})
+        user_id, movie_id = str(user_id), str(movie_id)
 
-            if str(movie_id) in movies:
-                movies[str(movie_id)].update(updated_movie)
-                user["movies"] = movies
-                users[str(user_id)] = user
-                self.save_db(users)
-                return True
+        def plan(users):
+            movies = users.get(user_id, {}).get("movies", {})
+            if movie_id in movies:
+                movie = {**movies[movie_id], **updated_movie}
+                return [{"op": "put_movie", "user_id": user_id,
+                         "movie_id": movie_id, "movie": movie}], True
+            return [], False
 
-            return False
+        try:
+            return self._submit([user_id], plan)
         except KeyError:
             # Handle the exception when the specified key is not found
             print("KeyError: Key not present in the dictionary.")
@@ -173,12 +440,10 @@ class JSONDataManager(DataManagerInterface):
         Returns:
             dict: A dictionary representing the movie details.
         """
-        users = self.get_all_users()
-        for user_data in users.values():
-            movies = user_data.get("movies", {})
-            movie = movies.get(str(movie_id))
-            if movie:
-                return movie
+        with self._lock:
+            user_ids = self._view(MovieMembershipIndex).users_with_movie(movie_id)
+            if user_ids:
+                return self._latest()[str(user_ids[0])]["movies"][str(movie_id)]
         return None
 
     def get_users_with_movie(self, movie_id):
@@ -191,13 +456,78 @@ class JSONDataManager(DataManagerInterface):
         Returns:
             list: A list of user IDs.
         """
-        users = self.get_all_users()
-        user_list = []
-        for user_id, user_data in users.items():
-            movies = user_data.get("movies", {})
-            if str(movie_id) in movies:
-                user_list.append(int(user_id))
-        return user_list
+        with self._lock:
+            return self._view(MovieMembershipIndex).users_with_movie(movie_id)
+
+    def get_users_with_title(self, title):
+        """
+        Retrieve a list of user IDs that have a movie with a specific title.
+
+        Args:
+            title (str): The name of the movie.
+
+        Returns:
+            list: A list of user IDs.
+        """
+        with self._lock:
+            return self._view(MovieMembershipIndex).users_with_title(title)
+
+    def get_movies_by_director(self, director):
+        """
+        Retrieve the movies of a specific director.
+
+        Args:
+            director (str): The director as stored with the movies.
+
+        Returns:
+            list: The movies, one per user who has them.
+        """
+        with self._lock:
+            return self._view(DirectorIndex).movies_by_director(director)
+
+    def search_movies(self, query, page=1, per_page=20):
+        """
+        Search the distinct movies by name and director.
+
+        Args:
+            query (str): The words to look for, matched exactly, as a
+                prefix or with typos.
+            page (int): The page of results, starting at 1.
+            per_page (int): The number of results per page.
+
+        Returns:
+            dict: The total number of matches, the page, per_page and the
+                ranked results.
+        """
+        with self._lock:
+            return self._view(SearchIndex).search(query, page, per_page)
+
+    def query_movies(self, filter=None, sort="rating", limit=20, cursor=None):
+        """
+        Read one page of user movies, filtered and sorted by the indexes.
+
+        Args:
+            filter (dict): Any of year_min, year_max, min_rating, director,
+                user_id, and distinct to keep one user movie per entry of
+                create_movie_list(), or None.
+            sort (str): "rating", highest first, "year", newest first, or
+                "name".
+            limit (int): The number of movies per page.
+            cursor (str): The next_cursor of the previous page, or None for
+                the first page.
+
+        Returns:
+            dict: The "movies", each with its "user_id" and "movie_id", and
+                the "next_cursor", or None on the last page.
+
+        Raises:
+            ValueError: If an argument or the cursor is invalid.
+        """
+        movie_filter = check_query(filter, sort, limit)
+        after = decode_cursor(sort, cursor)
+        with self._lock:
+            catalog = self._view(MovieCatalog) if movie_filter.get("distinct") else None
+            return self._view(MovieQueryIndex).query(movie_filter, sort, limit, after, catalog)
 
     def get_users_by_name(self, name):
         """
@@ -209,12 +539,8 @@ class JSONDataManager(DataManagerInterface):
         Returns:
             list: A list of user IDs.
         """
-        users = self.get_all_users()
-        user_list = []
-        for user_id, user_data in users.items():
-            if user_data.get("name") == name:
-                user_list.append(int(user_id))
-        return user_list
+        with self._lock:
+            return self._view(UserNameIndex).users_by_name(name)
 
     def get_top_rated_movies(self, n):
         """
@@ -226,15 +552,8 @@ class JSONDataManager(DataManagerInterface):
         Returns:
             list: A list of top-rated movies.
         """
-        users = self.get_all_users()
-        all_movies = []
-        for user_data in users.values():
-            movies = user_data.get("movies", {})
-            all_movies.extend(movies.values())
-
-        top_rated_movies = sorted(
-            all_movies, key=lambda x: x["rating"], reverse=True)[:n]
-        return top_rated_movies
+        with self._lock:
+            return self._view(TopRatedMovies).top(n)
 
     def get_movie_count_per_year(self):
         """
@@ -243,17 +562,8 @@ class JSONDataManager(DataManagerInterface):
         Returns:
             dict: A dictionary with movie counts per year.
         """
-        users = self.get_all_users()
-        movie_count_per_year = {}
-        for user_data in users.values():
-            movies = user_data.get("movies", {})
-            for movie in movies.values():
-                year = movie.get("year")
-                if year in movie_count_per_year:
-                    movie_count_per_year[year] += 1
-                else:
-                    movie_count_per_year[year] = 1
-        return movie_count_per_year
+        with self._lock:
+            return self._view(YearHistogram).counts()
 
     def get_user_by_id(self, user_id):
         """
@@ -278,16 +588,13 @@ class JSONDataManager(DataManagerInterface):
         Returns:
             bool: True if the user was added successfully, False otherwise.
         """
-        try:
-            users = self.get_all_users()
+        def plan(users):
             user_id = max(map(lambda item: int(item),
                           users.keys()), default=0) + 1
-            users[str(user_id)] = {
-                "name": name,
-                "movies": {}
-            }
-            self.save_db(users)
-            return True
+            return [{"op": "add_user", "user_id": str(user_id), "name": name}], True
+
+        try:
+            return self._submit(None, plan)
         except KeyError:
             # Handle the exception when the specified key is not found
             print("KeyError: Key not present in the dictionary.")
@@ -295,29 +602,15 @@ class JSONDataManager(DataManagerInterface):
 
     def create_movie_list(self):
         """
-        Create a list of movies based on the provided JSON data.
+        Create a list of the distinct movies of all users.
 
-        Args:
-            json_data (dict): The JSON data containing user and movie information.
+        Movies count as the same when their name, director and year match.
+        With the cache enabled the list is kept up to date by the mutation
+        methods instead of being rebuilt for every call.
 
         Returns:
             list: A list of dictionaries representing movies, with each dictionary
-                containing movie details such as ID, name, director, year, rating,
-                and the user's name.
-        """
-        movie_list = []
-        movies_db = self.get_all_users()
-        for user_id, user_data in movies_db.items():
-            name = user_data['name']
-            movies = user_data['movies']
-            for movie_id, movie_data in movies.items():
-                movie = {
-                    'name': movie_data['name'],
-                    'director': movie_data['director'],
-                    'year': movie_data['year'],
-                    'rating': movie_data['rating'],
-                    'poster': movie_data['poster']
-                }
-                if movie not in movie_list:
-                    movie_list.append(movie)
-        return movie_list
+                containing the movie's name, director, year, rating and poster.
+        """
+        with self._lock:
+            return self._view(MovieCatalog).movie_list()
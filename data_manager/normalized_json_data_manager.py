@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+import sys
+from data_manager.json_data_manager import JSONDataManager
+
+FORMAT = "normalized-v1"
+# Fields a user keeps for themselves rather than taking from the catalog
+PERSONAL_FIELDS = ("rating",)
+
+
+def catalog_key(movie):
+    """
+    Identify a movie in the shared catalog.
+
+    Movies with an ``imdb_id`` are keyed by it, others by their title,
+    lowercased with whitespace collapsed, and year.
+
+    Args:
+        movie (dict): The movie's data.
+
+    Returns:
+        str: The catalog key.
+    """
+    if movie.get("imdb_id"):
+        return movie["imdb_id"]
+    return f"{' '.join(str(movie.get('name', '')).lower().split())}|{movie.get('year')}"
+
+
+def normalize(users):
+    """
+    Convert users in the nested users.json layout to the catalog layout.
+
+    Each distinct movie is stored once in ``movies``. Users hold references
+    with their rating, plus any field in which their copy differs from the
+    catalog entry and, under ``unset``, the catalog fields their copy
+    lacks, so no data is lost.
+
+    Args:
+        users (dict): A dictionary representing the users.
+
+    Returns:
+        dict: The data in the catalog layout.
+    """
+    catalog = {}
+    normalized_users = {}
+    for user_id, user in users.items():
+        refs = {}
+        for movie_id, movie in user.get("movies", {}).items():
+            key = catalog_key(movie)
+            shared = {field: value for field, value in movie.items()
+                      if field not in PERSONAL_FIELDS}
+            entry = catalog.setdefault(key, shared)
+            ref = {"movie": key}
+            for field, value in movie.items():
+                if field in PERSONAL_FIELDS or field not in entry or entry[field] != value:
+                    ref[field] = value
+            unset = [field for field in entry if field not in movie]
+            if unset:
+                ref["unset"] = unset
+            refs[movie_id] = ref
+        normalized_users[user_id] = {**user, "movies": refs}
+    return {"format": FORMAT, "movies": catalog, "users": normalized_users}
+
+
+def denormalize(data):
+    """
+    Expand data in the catalog layout to the nested users.json layout.
+
+    Field values are shared with the catalog entry rather than copied, so
+    a poster URL takes memory once however many users added the movie.
+
+    Args:
+        data (dict): The data in the catalog layout.
+
+    Returns:
+        dict: A dictionary representing the users.
+    """
+    catalog = data["movies"]
+    users = {}
+    for user_id, user in data["users"].items():
+        movies = {}
+        for movie_id, ref in user["movies"].items():
+            movie = dict(catalog[ref["movie"]])
+            if len(ref) == 2 and "rating" in ref:
+                # The common case, a plain reference with a rating
+                movie["rating"] = ref["rating"]
+            else:
+                for field, value in ref.items():
+                    if field not in ("movie", "unset"):
+                        movie[field] = value
+                for field in ref.get("unset", ()):
+                    del movie[field]
+            movies[movie_id] = movie
+        users[user_id] = {**user, "movies": movies}
+    return users
+
+
+class NormalizedJSONDataManager(JSONDataManager):
+    """
+    A JSONDataManager storing each distinct movie once.
+
+    The file holds a catalog of movies keyed by catalog_key() and users
+    whose movies are references to it with their personal rating, see
+    normalize(). It is expanded to the usual nested layout when read, so
+    every method of JSONDataManager works unchanged. A file in the nested
+    layout is read as well and converted by the next write.
+    """
+
+    def _read_db(self):
+        """
+        Parse the JSON file in either layout.
+
+        Returns:
+            dict: A dictionary representing the users.
+        """
+        data = super()._read_db()
+        if data.get("format") == FORMAT:
+            return denormalize(data)
+        return data
+
+    def save_db(self, data):
+        """
+        Save the data to the JSON file in the catalog layout.
+
+        Args:
+            data (dict): The data to be saved, in the nested layout.
+
+        Returns:
+            bool: True if the data was saved successfully, False otherwise.
+        """
+        return super().save_db(normalize(data))
+
+
+def migrate(source, destination, reverse=False):
+    """
+    Convert a users file between the nested and the catalog layout.
+
+    Args:
+        source (str): The file to read.
+        destination (str): The file to write, may be the source itself.
+        reverse (bool): Convert from the catalog to the nested layout.
+
+    Returns:
+        tuple: The number of users and of distinct movies.
+    """
+    with open(source, "r") as jfile:
+        data = json.load(jfile)
+    if data.get("format") == FORMAT:
+        users = denormalize(data)
+    else:
+        users = data
+    converted = users if reverse else normalize(users)
+    temp_filename = destination + ".tmp"
+    with open(temp_filename, "w") as jfile:
+        json.dump(converted, jfile, indent=4)
+    os.replace(temp_filename, destination)
+    distinct = len({catalog_key(movie) for user in users.values()
+                    for movie in user["movies"].values()})
+    return len(users), distinct
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Convert users.json between the nested and the catalog layout.")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("--reverse", action="store_true",
+                        help="Write the nested layout instead.")
+    args = parser.parse_args()
+    user_count, movie_count = migrate(args.source, args.destination, args.reverse)
+    print(f"Converted {user_count} users with {movie_count} distinct movies.",
+          file=sys.stderr)
@@ -0,0 +1,338 @@
+import base64
+import binascii
+import json
+import math
+from bisect import bisect_left, bisect_right, insort
+from data_manager.views import MovieView
+
+# How query_movies() can order movies: highest rating first, newest first
+# or by name. Ties are broken by user ID and movie ID, so every movie has
+# its own place in the order and cursors never skip or repeat one.
+SORTS = ("rating", "year", "name")
+FILTERS = ("year_min", "year_max", "min_rating", "director", "user_id", "distinct")
+
+
+def sort_key(sort, user_id, movie_id, movie):
+    """
+    Place a user movie in one of the SORTS orders.
+
+    Args:
+        sort (str): One of SORTS.
+        user_id (str): The ID of the user.
+        movie_id (str): The ID of the movie.
+        movie (dict): The movie's data.
+
+    Returns:
+        tuple: The sort key.
+    """
+    if sort == "rating":
+        first = -float(movie['rating'])
+    elif sort == "year":
+        first = -int(movie['year'])
+    else:
+        first = movie['name']
+    return (first, int(user_id), int(movie_id))
+
+
+def check_query(movie_filter, sort, limit):
+    """
+    Check the arguments of query_movies().
+
+    Args:
+        movie_filter (dict): The filter, with any of FILTERS, or None.
+        sort (str): One of SORTS.
+        limit (int): The number of movies per page, at least 1.
+
+    Returns:
+        dict: The filter with its values converted, and None values left out.
+
+    Raises:
+        ValueError: If an argument is invalid.
+    """
+    if sort not in SORTS:
+        raise ValueError(f"Unknown sort {sort!r}")
+    if not isinstance(limit, int) or limit < 1:
+        raise ValueError("The limit must be a positive integer")
+    checked = {}
+    for name, value in (movie_filter or {}).items():
+        if name not in FILTERS:
+            raise ValueError(f"Unknown filter {name!r}")
+        if value is None:
+            continue
+        try:
+            if name in ("year_min", "year_max"):
+                value = int(value)
+            elif name == "min_rating":
+                value = float(value)
+            elif name == "distinct":
+                value = bool(value)
+            else:
+                value = str(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for filter {name!r}") from None
+        checked[name] = value
+    return checked
+
+
+def matches(movie_filter, user_id, movie):
+    """
+    Tell whether a user movie passes a filter, except for ``distinct``.
+
+    Args:
+        movie_filter (dict): A filter returned by check_query.
+        user_id (str): The ID of the user.
+        movie (dict): The movie's data.
+
+    Returns:
+        bool: True if the movie passes.
+    """
+    if "user_id" in movie_filter and user_id != movie_filter["user_id"]:
+        return False
+    if "director" in movie_filter and movie['director'] != movie_filter["director"]:
+        return False
+    if "min_rating" in movie_filter and float(movie['rating']) < movie_filter["min_rating"]:
+        return False
+    if "year_min" in movie_filter and int(movie['year']) < movie_filter["year_min"]:
+        return False
+    if "year_max" in movie_filter and int(movie['year']) > movie_filter["year_max"]:
+        return False
+    return True
+
+
+def encode_cursor(sort, key):
+    """
+    Turn the sort key of the last movie of a page into a cursor.
+
+    Args:
+        sort (str): The order of the pages.
+        key (tuple): The sort key, see sort_key.
+
+    Returns:
+        str: An opaque, URL-safe cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps([sort, *key]).encode()).decode()
+
+
+def decode_cursor(sort, cursor):
+    """
+    Recover the sort key from a cursor.
+
+    Args:
+        sort (str): The order of the pages.
+        cursor (str): A cursor from encode_cursor, or None.
+
+    Returns:
+        tuple: The sort key of the last movie of the previous page, or None
+            for the first page.
+
+    Raises:
+        ValueError: If the cursor is malformed or for another order.
+    """
+    if not cursor:
+        return None
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("Invalid cursor") from None
+    if not isinstance(decoded, list) or len(decoded) != 4 or decoded[0] != sort:
+        raise ValueError("Invalid cursor")
+    first, *ids = decoded[1:]
+    if sort == "name":
+        valid_first = isinstance(first, str)
+    else:
+        valid_first = (isinstance(first, (int, float)) and not isinstance(first, bool)
+                       and math.isfinite(first))
+    if not valid_first or not all(isinstance(part, int) and not isinstance(part, bool)
+                                  for part in ids):
+        raise ValueError("Invalid cursor")
+    return tuple(decoded[1:])
+
+
+def movie_page(entries, sort, limit):
+    """
+    Cut a page from the first movies after the cursor.
+
+    Args:
+        entries (list): Up to ``limit + 1`` (sort key, user ID, movie ID,
+            movie) tuples in order; one more than ``limit`` tells that there
+            is a next page.
+        sort (str): The order of the pages.
+        limit (int): The number of movies per page.
+
+    Returns:
+        dict: The "movies", each with its "user_id" and "movie_id", and the
+            "next_cursor", or None on the last page.
+    """
+    page = entries[:limit]
+    return {
+        "movies": [{**movie, "user_id": user_id, "movie_id": movie_id}
+                   for _, user_id, movie_id, movie in page],
+        "next_cursor": encode_cursor(sort, page[-1][0]) if len(entries) > limit else None
+    }
+
+
+class MovieQueryIndex(MovieView):
+    """
+    All user movies in every one of the SORTS orders, for query_movies().
+
+    Each order is a sorted list of sort keys, so a page starts with a
+    binary search for the cursor and reads movies in order until it is
+    full. A year range or minimum rating bounds the search as well, when
+    the movies are ordered by that field. Filters on a user or director
+    only sort that user's or director's movies.
+    """
+
+    def __init__(self):
+        """Initialize an empty MovieQueryIndex."""
+        self.clear()
+
+    def clear(self):
+        """Forget all movies."""
+        self._orders = {sort: [] for sort in SORTS}
+        self._movies = {}
+        self._by_user = {}
+        self._by_director = {}
+
+    def rebuild(self, users):
+        """
+        Build the index from all users, sorting every order once.
+
+        Args:
+            users (dict): A dictionary representing the users.
+        """
+        self.clear()
+        for user_id, user_data in users.items():
+            for movie_id, movie in user_data.get("movies", {}).items():
+                self._add(user_id, movie_id, movie)
+                for sort, order in self._orders.items():
+                    order.append(sort_key(sort, user_id, movie_id, movie))
+        for order in self._orders.values():
+            order.sort()
+
+    def _add(self, user_id, movie_id, movie):
+        """
+        Record a movie in everything but the orders.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data.
+        """
+        ref = (int(user_id), int(movie_id))
+        self._movies[ref] = (user_id, movie_id, movie)
+        self._by_user.setdefault(user_id, set()).add(ref)
+        self._by_director.setdefault(movie['director'], set()).add(ref)
+
+    def add_movie(self, user_id, movie_id, movie):
+        """
+        Record a movie added to a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data.
+        """
+        self._add(user_id, movie_id, movie)
+        for sort, order in self._orders.items():
+            insort(order, sort_key(sort, user_id, movie_id, movie))
+
+    def remove_movie(self, user_id, movie_id, movie):
+        """
+        Forget a movie removed from a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data as it was recorded.
+        """
+        ref = (int(user_id), int(movie_id))
+        if self._movies.pop(ref, None) is None:
+            return
+        for index, key in ((self._by_user, user_id), (self._by_director, movie['director'])):
+            refs = index.get(key, set())
+            refs.discard(ref)
+            if not refs:
+                index.pop(key, None)
+        for sort, order in self._orders.items():
+            key = sort_key(sort, user_id, movie_id, movie)
+            position = bisect_left(order, key)
+            if position < len(order) and order[position] == key:
+                del order[position]
+
+    def dump(self):
+        """
+        Describe the index for comparison with a rebuilt one.
+
+        Returns:
+            tuple: The orders and the movies by user and by director.
+        """
+        return (self._orders, self._by_user, self._by_director)
+
+    def _candidates(self, movie_filter, sort, after):
+        """
+        Yield the sort keys of the movies that may pass the filter, in order.
+
+        Args:
+            movie_filter (dict): A filter returned by check_query.
+            sort (str): One of SORTS.
+            after (tuple): The sort key to start after, or None.
+
+        Yields:
+            tuple: Sort keys.
+        """
+        refs = None
+        if "user_id" in movie_filter:
+            refs = self._by_user.get(movie_filter["user_id"], set())
+        if "director" in movie_filter:
+            director_refs = self._by_director.get(movie_filter["director"], set())
+            refs = director_refs if refs is None else refs & director_refs
+        if refs is not None:
+            keys = sorted(sort_key(sort, *self._movies[ref]) for ref in refs)
+            yield from keys[bisect_right(keys, after):] if after else keys
+            return
+        # The first field of the key bounds the range for its own filters
+        low, high = None, None
+        if sort == "rating" and "min_rating" in movie_filter:
+            high = -movie_filter["min_rating"]
+        elif sort == "year":
+            if "year_max" in movie_filter:
+                low = -movie_filter["year_max"]
+            if "year_min" in movie_filter:
+                high = -movie_filter["year_min"]
+        order = self._orders[sort]
+        start = bisect_right(order, after) if after else 0
+        if low is not None:
+            start = max(start, bisect_left(order, (low,)))
+        for position in range(start, len(order)):
+            key = order[position]
+            if high is not None and key[0] > high:
+                return
+            yield key
+
+    def query(self, movie_filter, sort, limit, after=None, catalog=None):
+        """
+        Read one page of user movies.
+
+        Args:
+            movie_filter (dict): A filter returned by check_query.
+            sort (str): One of SORTS.
+            limit (int): The number of movies per page.
+            after (tuple): The sort key of the last movie of the previous
+                page, or None for the first page.
+            catalog (MovieCatalog): Required for the ``distinct`` filter,
+                which keeps only the user movie each entry stands for.
+
+        Returns:
+            dict: See movie_page.
+        """
+        entries = []
+        for key in self._candidates(movie_filter, sort, after):
+            user_id, movie_id, movie = self._movies[key[-2:]]
+            if not matches(movie_filter, user_id, movie):
+                continue
+            if movie_filter.get("distinct") and not catalog.stands_for(user_id, movie_id, movie):
+                continue
+            entries.append((key, user_id, movie_id, movie))
+            if len(entries) > limit:
+                break
+        return movie_page(entries, sort, limit)
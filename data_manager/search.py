@@ -0,0 +1,308 @@
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+from data_manager.catalog import movie_key
+from data_manager.views import MovieView
+
+# How much a match counts depending on the field it is in
+FIELD_WEIGHTS = (("name", 2.0), ("director", 1.0))
+# How much a match counts depending on how the term matched the word
+EXACT, PREFIX = 1.0, 0.8
+FUZZY = 0.6
+MAX_EXPANSIONS = 50
+FUZZY_CANDIDATES = 200
+
+
+def tokenize(text):
+    """
+    Split text into lowercase words without accents.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        list: The words.
+    """
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r"\w+", text)
+
+
+def trigrams(word):
+    """
+    Split a word into overlapping three-letter pieces, padded at the ends.
+
+    Args:
+        word (str): The word.
+
+    Returns:
+        set: The trigrams.
+    """
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(first, second, limit):
+    """
+    Count the insertions, deletions, substitutions and swaps of adjacent
+    letters between two words.
+
+    Args:
+        first (str): A word.
+        second (str): Another word.
+        limit (int): The largest distance of interest.
+
+    Returns:
+        int: The distance, or ``limit + 1`` if it is larger than ``limit``.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    before = None
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, start=1):
+        current = [i]
+        for j, second_char in enumerate(second, start=1):
+            distance = min(previous[j] + 1, current[j - 1] + 1,
+                           previous[j - 1] + (first_char != second_char))
+            if (before is not None and j > 1 and first_char == second[j - 2]
+                    and first[i - 2] == second_char):
+                distance = min(distance, before[j - 2] + 1)
+            current.append(distance)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def allowed_typos(term):
+    """
+    Decide how many typos a query word may contain.
+
+    Args:
+        term (str): The query word.
+
+    Returns:
+        int: 0 for words under four letters, 1 up to seven, else 2.
+    """
+    if len(term) < 4:
+        return 0
+    return 1 if len(term) < 8 else 2
+
+
+class SearchIndex(MovieView):
+    """
+    An inverted index over the names and directors of the distinct movies.
+
+    Movies are deduplicated by movie_key() like in MovieCatalog. Each word
+    maps to the movies containing it, per field. The vocabulary is kept
+    sorted for prefix matches and indexed by trigrams for fuzzy matches:
+    the words sharing most trigrams with a query word are checked for
+    typos. A query only looks at the words close to its terms, and scores
+    whole sets of movies at once, so it stays fast with many matches.
+    """
+
+    def __init__(self):
+        """Initialize an empty SearchIndex."""
+        self.clear()
+
+    def clear(self):
+        """Forget all movies."""
+        self._entries = {}
+        self._postings = {field: {} for field, _ in FIELD_WEIGHTS}
+        self._counts = {}
+        self._vocabulary = []
+        self._by_trigram = {}
+
+    def _words(self, movie):
+        """
+        Split a movie's searchable fields into words.
+
+        Args:
+            movie (dict): The movie's data.
+
+        Returns:
+            list: (field, word) pairs.
+        """
+        return [(field, word) for field, _ in FIELD_WEIGHTS
+                for word in set(tokenize(movie[field]))]
+
+    def add_movie(self, user_id, movie_id, movie):
+        """
+        Record a movie added to a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data.
+        """
+        key = movie_key(movie)
+        refs = self._entries.setdefault(key, {})
+        refs[(user_id, movie_id)] = movie
+        if len(refs) > 1:
+            return
+        for field, word in self._words(movie):
+            self._postings[field].setdefault(word, set()).add(key)
+            self._counts[word] = self._counts.get(word, 0) + 1
+            if self._counts[word] == 1:
+                insort(self._vocabulary, word)
+                for trigram in trigrams(word):
+                    self._by_trigram.setdefault(trigram, set()).add(word)
+
+    def remove_movie(self, user_id, movie_id, movie):
+        """
+        Forget a movie removed from a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data as it was recorded.
+        """
+        key = movie_key(movie)
+        refs = self._entries.get(key, {})
+        refs.pop((user_id, movie_id), None)
+        if refs:
+            return
+        self._entries.pop(key, None)
+        for field, word in self._words(movie):
+            movies = self._postings[field].get(word, set())
+            movies.discard(key)
+            if not movies:
+                self._postings[field].pop(word, None)
+            self._counts[word] -= 1
+            if not self._counts[word]:
+                del self._counts[word]
+                del self._vocabulary[bisect_left(self._vocabulary, word)]
+                for trigram in trigrams(word):
+                    similar = self._by_trigram.get(trigram, set())
+                    similar.discard(word)
+                    if not similar:
+                        self._by_trigram.pop(trigram, None)
+
+    def dump(self):
+        """
+        Describe the index for comparison with a rebuilt one.
+
+        Returns:
+            tuple: The user movies per entry, the movies per field and word,
+                and the vocabulary.
+        """
+        return ({key: set(refs) for key, refs in self._entries.items()},
+                self._postings, self._vocabulary)
+
+    def _expand(self, term):
+        """
+        Find the indexed words a query term matches, with a match score.
+
+        Args:
+            term (str): A query word.
+
+        Returns:
+            dict: The matching words and how well they match.
+        """
+        expansions = {}
+        if term in self._counts:
+            expansions[term] = EXACT
+        if len(term) >= 2:
+            start = bisect_left(self._vocabulary, term)
+            for word in self._vocabulary[start:start + MAX_EXPANSIONS]:
+                if not word.startswith(term):
+                    break
+                expansions.setdefault(word, PREFIX)
+        limit = allowed_typos(term)
+        if limit:
+            shared = Counter()
+            for trigram in trigrams(term):
+                shared.update(self._by_trigram.get(trigram, ()))
+            for word, _ in shared.most_common(FUZZY_CANDIDATES):
+                if word in expansions:
+                    continue
+                distance = edit_distance(term, word, limit)
+                if distance <= limit:
+                    expansions[word] = FUZZY * (1 - distance / max(len(term), len(word)))
+        return expansions
+
+    def _groups(self, expansions):
+        """
+        Group the movies a query term matches by the score they get.
+
+        Args:
+            expansions (dict): The words the term matches and how well.
+
+        Returns:
+            list: (score, movies) pairs, best first, each movie in the first
+                group whose word and field it contains.
+        """
+        candidates = sorted(
+            ((quality * weight, self._postings[field][word])
+             for word, quality in expansions.items()
+             for field, weight in FIELD_WEIGHTS if word in self._postings[field]),
+            key=lambda candidate: -candidate[0])
+        groups = []
+        seen = set()
+        for score, movies in candidates:
+            movies = movies - seen
+            if movies:
+                groups.append((score, movies))
+                seen |= movies
+        return groups
+
+    def search(self, query, page=1, per_page=20):
+        """
+        Find the movies whose name or director matches every query word.
+
+        Words match exactly, as a prefix or approximately with up to two
+        typos. Movies are ranked by how well and in which field each word
+        matched, then by the number of users who have them.
+
+        Args:
+            query (str): The words to look for.
+            page (int): The page of results, starting at 1.
+            per_page (int): The number of results per page.
+
+        Returns:
+            dict: The total number of matches, the page, per_page and the
+                results, each with the movie's data, score and user count.
+        """
+        page = max(page, 1)
+        buckets = None
+        for term in dict.fromkeys(tokenize(query)):
+            groups = self._groups(self._expand(term))
+            if buckets is None:
+                buckets = groups
+            else:
+                # Movies must match every term, scores add up
+                buckets = [(score + term_score, movies & term_movies)
+                           for score, movies in buckets
+                           for term_score, term_movies in groups
+                           if not movies.isdisjoint(term_movies)]
+            if not buckets:
+                break
+        buckets = sorted(buckets or (), key=lambda bucket: -bucket[0])
+        start = (page - 1) * per_page
+        results = []
+        skipped = 0
+        for score, movies in buckets:
+            if len(results) >= per_page:
+                break
+            if skipped + len(movies) <= start:
+                skipped += len(movies)
+                continue
+            wanted = start - skipped + per_page - len(results)
+            ranked = heapq.nsmallest(
+                wanted, movies, key=lambda key: (-len(self._entries[key]), str(key)))
+            for key in ranked[max(0, start - skipped):]:
+                movie = next(iter(self._entries[key].values()))
+                results.append({
+                    'name': movie['name'],
+                    'director': movie['director'],
+                    'year': movie['year'],
+                    'rating': movie['rating'],
+                    'poster': movie['poster'],
+                    'score': round(score, 3),
+                    'users': len(self._entries[key])
+                })
+            skipped = start
+        return {"total": sum(len(movies) for _, movies in buckets), "page": page,
+                "per_page": per_page, "results": results}
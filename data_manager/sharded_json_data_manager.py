@@ -0,0 +1,511 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import zlib
+from collections.abc import Mapping
+from contextlib import ExitStack
+from data_manager.json_data_manager import JSONDataManager
+from data_manager.write_coordinator import FileLock
+
+FORMAT = "sharded-v1"
+MANIFEST = "manifest.json"
+
+
+def shard_name(user_id, buckets):
+    """
+    Name the shard file holding a user.
+
+    Args:
+        user_id (str): The ID of the user.
+        buckets (int): The number of hash buckets, or 0 for one file per user.
+
+    Returns:
+        str: The file name of the shard, relative to the directory.
+    """
+    if not buckets:
+        return f"user-{int(user_id)}.json"
+    return f"bucket-{zlib.crc32(str(user_id).encode()) % buckets:04d}.json"
+
+
+def write_file(path, data):
+    """
+    Write JSON data to a file atomically.
+
+    The data goes to a temporary file in the same directory, which is
+    flushed to disk and renamed over ``path``, so readers see either the
+    old or the new file, never a partial one.
+
+    Args:
+        path (str): The file to write.
+        data (object): The data to be saved.
+
+    Returns:
+        os.stat_result: The status of the new file.
+    """
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                             prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w") as file:
+            json.dump(data, file, indent=4, default=dict)
+            file.flush()
+            os.fsync(file.fileno())
+            # Renaming keeps the inode and mtime, so this stat describes ``path``
+            stat = os.fstat(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return stat
+
+
+def write_shards(directory, users, buckets=64):
+    """
+    Write users to a sharded directory, replacing the users it holds.
+
+    Args:
+        directory (str): The directory, created if needed.
+        users (Mapping): The users in the users.json layout.
+        buckets (int): The number of hash buckets, or 0 for one file per user.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    shards = {}
+    for user_id, user in users.items():
+        shards.setdefault(shard_name(user_id, buckets), {})[user_id] = user
+    written = 0
+    for name, shard in shards.items():
+        written += write_file(os.path.join(directory, name), shard).st_size
+    manifest = {"format": FORMAT, "buckets": buckets, "users": list(users)}
+    # The manifest goes last, so every user it lists is already in a shard
+    written += write_file(os.path.join(directory, MANIFEST), manifest).st_size
+    return written
+
+
+class ShardedUsers(Mapping):
+    """
+    The users of a sharded directory, read-only.
+
+    It reads like the users dict of JSONDataManager. Only the user list is
+    read up front; a shard is read the first time one of its users is
+    looked up. Writes don't modify it but derive a new ShardedUsers that
+    shares every unchanged shard.
+    """
+
+    def __init__(self, shard_names, shards, read_shard):
+        """
+        Initialize the ShardedUsers.
+
+        Args:
+            shard_names (dict): The shard name of every user ID, in order.
+            shards (dict): The shards read so far, by name.
+            read_shard (callable): Reads a shard given its name.
+        """
+        self._shard_names = shard_names
+        self._shards = shards
+        self._read_shard = read_shard
+
+    def shard(self, name):
+        """
+        Return the users of one shard, reading it on first use.
+
+        Args:
+            name (str): The shard name.
+
+        Returns:
+            dict: The users stored in the shard.
+        """
+        shard = self._shards.get(name)
+        if shard is None:
+            shard = self._shards[name] = self._read_shard(name)
+        return shard
+
+    def updated(self, shards, new_user_ids=()):
+        """
+        Derive the users after a write.
+
+        Args:
+            shards (dict): The rewritten shards, by name.
+            new_user_ids (list): IDs of users added by the write, with the
+                name of their shard.
+
+        Returns:
+            ShardedUsers: The users after the write.
+        """
+        shard_names = self._shard_names
+        if new_user_ids:
+            shard_names = {**shard_names, **dict(new_user_ids)}
+        return ShardedUsers(shard_names, {**self._shards, **shards}, self._read_shard)
+
+    def __getitem__(self, user_id):
+        return self.shard(self._shard_names[user_id])[user_id]
+
+    def __contains__(self, user_id):
+        return user_id in self._shard_names
+
+    def __iter__(self):
+        return iter(self._shard_names)
+
+    def __len__(self):
+        return len(self._shard_names)
+
+
+class ShardedJSONDataManager(JSONDataManager):
+    """
+    A JSON data manager storing users in a directory of small files.
+
+    Users are spread over ``buckets`` JSON files by the hash of their ID,
+    or get a file each with ``buckets=0``. ``manifest.json`` lists the user
+    IDs in order. A write rewrites only the shards of the users it changes,
+    through a temporary file and a rename, and the manifest only when it
+    adds a user, so its cost follows the size of one shard rather than of
+    all users.
+
+    Writers lock the shards they change instead of the whole data manager,
+    so writes to users in different shards run concurrently; adding a user
+    also locks the manifest. The locks are FileLocks on hidden files in the
+    directory, so they hold across processes too, and writes plan their
+    changes on the shards as they are on disk. Files are replaced rather than rewritten in
+    place, so any rename in the directory changes its mtime, and that one
+    stat tells whether another process changed anything. Shards are read
+    again only when their own stat changed.
+    """
+
+    def __init__(self, directory, buckets=64) -> None:
+        """
+        Initialize the ShardedJSONDataManager.
+
+        Args:
+            directory (str): The directory of the shards, created with an
+                empty manifest if it doesn't exist.
+            buckets (int): The number of hash buckets for a new directory,
+                or 0 for one file per user. An existing directory keeps the
+                number in its manifest.
+        """
+        super().__init__(directory, cache=True)
+        self.manifest_filename = os.path.join(directory, MANIFEST)
+        self._manifest_lock = FileLock(os.path.join(directory, ".manifest.lock"))
+        self._shard_locks = {}
+        self._shard_cache = {}
+        self._writers = 0
+        if not os.path.exists(self.manifest_filename):
+            write_shards(directory, {}, buckets)
+        self.buckets = self._read_manifest()["buckets"]
+
+    def _read_manifest(self):
+        """
+        Read the manifest.
+
+        Returns:
+            dict: The format, the number of buckets and the user IDs.
+        """
+        with open(self.manifest_filename, "r") as jfile:
+            manifest = json.load(jfile)
+            self.bytes_read += os.fstat(jfile.fileno()).st_size
+        return manifest
+
+    def _read_shard(self, name):
+        """
+        Read a shard, unless the copy read last is still current.
+
+        Args:
+            name (str): The shard name.
+
+        Returns:
+            dict: The users stored in the shard.
+        """
+        cached = self._shard_cache.get(name)
+        try:
+            with open(os.path.join(self.filename, name), "r") as jfile:
+                stat = os.fstat(jfile.fileno())
+                stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+                if cached is not None and cached[0] == stamp:
+                    return cached[1]
+                shard = json.load(jfile)
+                self.bytes_read += stat.st_size
+        except FileNotFoundError:
+            if cached is not None and cached[0] is None:
+                return cached[1]
+            stamp, shard = None, {}
+        self._shard_cache[name] = (stamp, shard)
+        return shard
+
+    def _read_db(self):
+        """
+        Read the user list; shards are read when first needed.
+
+        Returns:
+            ShardedUsers: The users.
+        """
+        manifest = self._read_manifest()
+        self.buckets = manifest["buckets"]
+        shard_names = {user_id: shard_name(user_id, self.buckets)
+                       for user_id in manifest["users"]}
+        return ShardedUsers(shard_names, {}, self._read_shard)
+
+    def _latest(self):
+        """
+        Return the users, reading the manifest again if the directory
+        changed.
+
+        While writes of this data manager are in flight the directory
+        changes under it, so the users it publishes are trusted until the
+        last of them finished.
+
+        Returns:
+            ShardedUsers: The users.
+        """
+        stamp = self._file_stamp()
+        with self._lock:
+            if self._users is None or (stamp != self._stamp and not self._writers):
+                self._users = self._read_db()
+                self._stamp = stamp
+            return self._users
+
+    def _view_users(self, data):
+        """
+        Read all users for the views.
+
+        Args:
+            data (ShardedUsers): The users.
+
+        Returns:
+            dict: A dictionary representing the users.
+        """
+        return dict(data.items())
+
+    def _shard_lock(self, name):
+        """
+        Return the lock of a shard.
+
+        Args:
+            name (str): The shard name.
+
+        Returns:
+            FileLock: The lock.
+        """
+        with self._lock:
+            lock = self._shard_locks.get(name)
+            if lock is None:
+                lock = self._shard_locks[name] = FileLock(
+                    os.path.join(self.filename, f".{name}.lock"))
+            return lock
+
+    def _writing(self, user_ids):
+        """
+        Lock the shards of the users about to be changed.
+
+        The manifest is locked as well, first, when new users are added.
+
+        Args:
+            user_ids (iterable): The IDs of the users about to be changed,
+                or None when adding a new user. None among the IDs stands
+                for a new user as well.
+
+        Returns:
+            ExitStack: A context manager holding the locks.
+        """
+        stack = ExitStack()
+        users = self._latest()
+        try:
+            if user_ids is None or any(user_id not in users for user_id in user_ids):
+                stack.enter_context(self._manifest_lock)
+            for name in sorted({shard_name(user_id, self.buckets)
+                                for user_id in user_ids or () if user_id is not None}):
+                stack.enter_context(self._shard_lock(name))
+        except BaseException:
+            stack.close()
+            raise
+        return stack
+
+    def _submit(self, user_ids, plan):
+        """
+        Run a planned mutation with only the touched shards locked.
+
+        Writes to different shards don't wait for each other here, so they
+        aren't grouped by a WriteCoordinator either.
+
+        Args:
+            user_ids (iterable): The IDs of the users the mutation changes,
+                or None when it adds a new user. None among the IDs stands
+                for a new user as well.
+            plan (callable): Takes the current users and returns the change
+                records of the mutation and the value to return.
+
+        Returns:
+            object: The value returned by ``plan``.
+        """
+        with self._writing(user_ids):
+            users = self._latest()
+            if user_ids is None or any(user_id not in users for user_id in user_ids):
+                # The manifest is locked, read the user list as it is on disk
+                users = self._read_db()
+            names = {shard_name(user_id, self.buckets)
+                     for user_id in user_ids or () if user_id is not None}
+            users = users.updated({name: self._read_shard(name) for name in names})
+            changes, result = plan(users)
+            if changes:
+                self._apply(changes)
+            return result
+
+    def _apply(self, changes):
+        """
+        Apply change records to the touched shards and write them.
+
+        Args:
+            changes (list): The change records, see _apply_change.
+
+        Returns:
+            ShardedUsers: The users after the changes.
+        """
+        user_ids = list(dict.fromkeys(change["user_id"] for change in changes))
+        with self._writing(user_ids):
+            current = self._latest()
+            with self._lock:
+                self._writers += 1
+            try:
+                return self._write_shards(current, user_ids, changes)
+            finally:
+                with self._lock:
+                    self._writers -= 1
+
+    def _write_shards(self, current, user_ids, changes):
+        """
+        Write the shards changed by a write and publish the new users.
+
+        Args:
+            current (ShardedUsers): The users before the changes.
+            user_ids (list): The IDs of the users the changes touch.
+            changes (list): The change records.
+
+        Returns:
+            ShardedUsers: The users after the changes.
+        """
+        new_user_ids = [(user_id, shard_name(user_id, self.buckets))
+                        for user_id in user_ids if user_id not in current]
+        by_shard = {}
+        for change in changes:
+            by_shard.setdefault(shard_name(change["user_id"], self.buckets), []).append(change)
+        shards = {}
+        # A shard differing from the one loaded was written by another process
+        stale = False
+        try:
+            for name, shard_changes in by_shard.items():
+                shard = self._read_shard(name)
+                stale = stale or shard is not current.shard(name)
+                shard = dict(shard)
+                for change in shard_changes:
+                    self._apply_change(shard, change)
+                stat = write_file(os.path.join(self.filename, name), shard)
+                self.bytes_written += stat.st_size
+                self._shard_cache[name] = ((stat.st_mtime_ns, stat.st_size, stat.st_ino), shard)
+                shards[name] = shard
+            if new_user_ids:
+                manifest = self._read_manifest()
+                manifest["users"] += [user_id for user_id, _ in new_user_ids
+                                      if user_id not in manifest["users"]]
+                self.bytes_written += write_file(self.manifest_filename, manifest).st_size
+        except OSError:
+            with self._lock:
+                self._users = None
+                self._drop_views()
+            return current
+        with self._lock:
+            published = self._users
+            if published is None or stale:
+                self._users = None
+                self._drop_views()
+                users = current.updated(shards, new_user_ids)
+            else:
+                views = []
+                if self._views_source is published:
+                    views = list(self._views.values())
+                    # Replay the changes on the touched users to update the views
+                    touched = {user_id: published[user_id]
+                               for user_id in user_ids if user_id in published}
+                    try:
+                        for change in changes:
+                            self._apply_change(touched, change, views)
+                    except Exception:
+                        # The shards are written, so drop the views instead
+                        views = []
+                users = self._users = published.updated(shards, new_user_ids)
+                self._stamp = self._file_stamp()
+                if views:
+                    self._views_source = users
+                else:
+                    self._drop_views()
+            self._bump_versions(user_ids)
+        return users
+
+    def save_db(self, data):
+        """
+        Save all users to the directory.
+
+        Args:
+            data (Mapping): The users to be saved.
+
+        Returns:
+            bool: True if the data was saved successfully, False otherwise.
+        """
+        try:
+            with self._manifest_lock:
+                self.bytes_written += write_shards(self.filename, data, self.buckets)
+            return True
+        except IOError:
+            return {"IOError: An error occurred while writing to the file."}
+
+
+def json_to_shards(json_filename, directory, buckets=64):
+    """
+    Split a users.json file into a sharded directory.
+
+    Args:
+        json_filename (str): The users.json file to read.
+        directory (str): The directory to write.
+        buckets (int): The number of hash buckets, or 0 for one file per user.
+
+    Returns:
+        int: The number of users.
+    """
+    with open(json_filename, "r") as jfile:
+        users = json.load(jfile)
+    write_shards(directory, users, buckets)
+    return len(users)
+
+
+def shards_to_json(directory, json_filename):
+    """
+    Join a sharded directory back into a users.json file.
+
+    Args:
+        directory (str): The directory to read.
+        json_filename (str): The users.json file to write.
+
+    Returns:
+        int: The number of users.
+    """
+    users = dict(ShardedJSONDataManager(directory).get_all_users().items())
+    with open(json_filename, "w") as jfile:
+        json.dump(users, jfile, indent=4)
+    return len(users)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Split users.json into a sharded directory, or join it back with --reverse.")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("--buckets", type=int, default=64,
+                        help="Hash buckets, 0 for one file per user.")
+    parser.add_argument("--reverse", action="store_true",
+                        help="Join a sharded directory into users.json.")
+    args = parser.parse_args()
+    if args.reverse:
+        count = shards_to_json(args.source, args.destination)
+    else:
+        count = json_to_shards(args.source, args.destination, args.buckets)
+    print(f"Converted {count} users.", file=sys.stderr)
@@ -0,0 +1,288 @@
+import heapq
+import json
+import os
+import tempfile
+from data_manager.catalog import movie_key
+from data_manager.query import check_query, decode_cursor, matches, movie_page, sort_key
+from data_manager.snapshot import SnapshotDataManager, json_to_snapshot
+from data_manager.write_coordinator import FileLock
+
+# Bumped when the layout of the published movie list changes
+CATALOG_FORMAT = 2
+
+
+class SharedSnapshotDataManager(SnapshotDataManager):
+    """
+    A SnapshotDataManager for the worker processes of a server to share.
+
+    Every worker maps the same snapshot file, so the user records are held
+    once, in the page cache, however many workers there are, and decoded
+    one user at a time. A write from any worker holds the file lock,
+    writes a new snapshot and renames it into place; the other workers
+    notice the new file by its stat and map it on their next call, while
+    calls in flight finish on the mapping they started with.
+
+    The list of distinct movies shown on the home page is published next
+    to the snapshot in ``<filename>.catalog``, tagged with the stat of the
+    snapshot it describes. Writers update it from the users they changed,
+    keeping the user movies behind each entry in the order they were added,
+    and every entry shows the data of the first of them, like MovieCatalog.
+    create_movie_list() and the pages of query_movies() for the home page
+    (``distinct``) read it instead of building a MovieCatalog and a
+    MovieQueryIndex in every worker, and the pages of one user only decode
+    that user. Other queries and the views for search and statistics are
+    still built by the workers using them.
+    """
+
+    def __init__(self, filename, source=None) -> None:
+        """
+        Initialize the SharedSnapshotDataManager.
+
+        Args:
+            filename (str): The filename of the snapshot file.
+            source (str): A users.json file to create the snapshot from if
+                it doesn't exist yet, or None.
+        """
+        if source is not None and not os.path.exists(filename):
+            # Workers starting together convert the file once
+            with FileLock(filename + ".lock"):
+                if not os.path.exists(filename):
+                    json_to_snapshot(source, filename)
+        super().__init__(filename)
+        self.catalog_filename = filename + ".catalog"
+
+    def _read_catalog(self):
+        """
+        Read the published movie list.
+
+        Returns:
+            dict: The stat of the snapshot it describes and the movies, as
+                name, director, year, rating, poster and the [user ID, movie
+                ID] of the user movies behind the entry, or None if there is
+                none in the current format.
+        """
+        try:
+            with open(self.catalog_filename, "rb") as file:
+                content = file.read()
+        except FileNotFoundError:
+            return None
+        self.bytes_read += len(content)
+        catalog = json.loads(content)
+        if catalog.get("format") != CATALOG_FORMAT:
+            return None
+        return catalog
+
+    def _write_catalog(self, movies, stamp):
+        """
+        Publish the movie list atomically.
+
+        Args:
+            movies (list): The entries, see _read_catalog.
+            stamp (tuple): The stat of the snapshot they describe.
+
+        Returns:
+            dict: The published catalog.
+        """
+        catalog = {"format": CATALOG_FORMAT, "snapshot": list(stamp), "movies": movies}
+        descriptor, temp_filename = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.catalog_filename)), suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w") as file:
+                json.dump(catalog, file, separators=(",", ":"), default=dict)
+                file.flush()
+                os.fsync(file.fileno())
+                self.bytes_written += os.fstat(file.fileno()).st_size
+            os.replace(temp_filename, self.catalog_filename)
+        except BaseException:
+            os.unlink(temp_filename)
+            raise
+        return catalog
+
+    @staticmethod
+    def _add_movies(entries, user_id, movies):
+        """
+        Add user movies to the catalog entries.
+
+        Args:
+            entries (dict): The entries by movie_key(), changed in place.
+            user_id (str): The ID of the user.
+            movies (iterable): The (movie ID, movie) pairs.
+        """
+        for movie_id, movie in movies:
+            entry = entries.get(movie_key(movie))
+            if entry is None:
+                entry = entries[movie_key(movie)] = [
+                    movie['name'], movie['director'], movie['year'],
+                    movie['rating'], movie['poster'], []]
+            entry[5].append([user_id, movie_id])
+
+    @staticmethod
+    def _remove_movies(entries, user_id, movies):
+        """
+        Take user movies out of the catalog entries.
+
+        Args:
+            entries (dict): The entries by movie_key(), changed in place.
+            user_id (str): The ID of the user.
+            movies (iterable): The (movie ID, movie) pairs.
+
+        Returns:
+            list: The keys of the entries that lost the user movie they were
+                shown with, but not their last one.
+        """
+        stale = []
+        for movie_id, movie in movies:
+            key = movie_key(movie)
+            refs = entries.get(key, [None, None, None, None, None, []])[5]
+            if [user_id, movie_id] not in refs:
+                continue
+            first = refs[0] == [user_id, movie_id]
+            refs.remove([user_id, movie_id])
+            if not refs:
+                del entries[key]
+            elif first:
+                stale.append(key)
+        return stale
+
+    def _build_catalog(self):
+        """
+        Publish the movie list of the current snapshot from scratch.
+
+        Callers hold the file lock.
+
+        Returns:
+            dict: The published catalog.
+        """
+        entries = {}
+        for user_id, user in self._latest().items():
+            self._add_movies(entries, user_id, user.get("movies", {}).items())
+        return self._write_catalog(list(entries.values()), self._file_stamp())
+
+    def _apply(self, changes):
+        """
+        Write a new snapshot and update the movie list along with it.
+
+        Callers hold the file lock.
+
+        Args:
+            changes (list): The change records, see _apply_change.
+
+        Returns:
+            Snapshot: The users after the changes.
+        """
+        current = self._latest()
+        old_stamp = self._file_stamp()
+        user_ids = {change["user_id"] for change in changes}
+        before = {user_id: current[user_id] for user_id in user_ids if user_id in current}
+        users = super()._apply(changes)
+        if users is current:
+            return users
+        catalog = self._read_catalog()
+        if catalog is None or catalog["snapshot"] != list(old_stamp or ()):
+            self._build_catalog()
+            return users
+        entries = {movie_key({'name': entry[0], 'director': entry[1], 'year': entry[2]}): entry
+                   for entry in catalog["movies"]}
+        stale = []
+        for user_id in user_ids:
+            old_movies = before.get(user_id, {}).get("movies", {})
+            new_movies = users[user_id].get("movies", {}) if user_id in users else {}
+            stale += self._remove_movies(entries, user_id, [
+                (movie_id, movie) for movie_id, movie in old_movies.items()
+                if new_movies.get(movie_id) != movie])
+        for user_id in user_ids:
+            old_movies = before.get(user_id, {}).get("movies", {})
+            new_movies = users[user_id].get("movies", {}) if user_id in users else {}
+            self._add_movies(entries, user_id, [
+                (movie_id, movie) for movie_id, movie in new_movies.items()
+                if old_movies.get(movie_id) != movie])
+        for key in stale:
+            # Show the entry with the data of its new first user movie
+            entry = entries.get(key)
+            if entry is not None:
+                user_id, movie_id = entry[5][0]
+                movie = users[user_id]["movies"][movie_id]
+                entry[:5] = [movie['name'], movie['director'], movie['year'],
+                             movie['rating'], movie['poster']]
+        self._write_catalog(list(entries.values()), self._file_stamp())
+        return users
+
+    def create_movie_list(self):
+        """
+        Create a list of the distinct movies of all users from the
+        published movie list.
+
+        Returns:
+            list: A list of dictionaries representing movies, with each dictionary
+                containing the movie's name, director, year, rating and poster.
+        """
+        return [{'name': name, 'director': director, 'year': year,
+                 'rating': rating, 'poster': poster}
+                for name, director, year, rating, poster, _ in self._current_catalog()]
+
+    def _current_catalog(self):
+        """
+        Read the published movie list, publishing it first if it is missing
+        or describes an older snapshot.
+
+        Returns:
+            list: The entries, see _read_catalog.
+        """
+        stamp = self._file_stamp()
+        catalog = self._read_catalog()
+        if catalog is None or catalog["snapshot"] != list(stamp or ()):
+            with self._coordinator.file_lock:
+                catalog = self._read_catalog()
+                if catalog is None or catalog["snapshot"] != list(self._file_stamp() or ()):
+                    catalog = self._build_catalog()
+        return catalog["movies"]
+
+    def query_movies(self, filter=None, sort="rating", limit=20, cursor=None):
+        """
+        Read one page of user movies.
+
+        Pages of the distinct movies are cut from the published movie list
+        and pages of one user's movies from that user's record, so neither
+        builds an index of all movies in the worker. Other queries go to
+        the indexes of JSONDataManager.
+
+        Args:
+            filter (dict): Any of year_min, year_max, min_rating, director,
+                user_id, and distinct to keep one user movie per entry of
+                create_movie_list(), or None.
+            sort (str): "rating", highest first, "year", newest first, or
+                "name".
+            limit (int): The number of movies per page.
+            cursor (str): The next_cursor of the previous page, or None for
+                the first page.
+
+        Returns:
+            dict: The "movies", each with its "user_id" and "movie_id", and
+                the "next_cursor", or None on the last page.
+
+        Raises:
+            ValueError: If an argument or the cursor is invalid.
+        """
+        movie_filter = check_query(filter, sort, limit)
+        after = decode_cursor(sort, cursor)
+        if "user_id" in movie_filter:
+            user = self._load().get(movie_filter["user_id"])
+            candidates = [(movie_filter["user_id"], movie_id, movie)
+                          for movie_id, movie in (user or {}).get("movies", {}).items()]
+            if movie_filter.get("distinct"):
+                shown = {tuple(entry[5][0]) for entry in self._current_catalog()}
+                candidates = [candidate for candidate in candidates
+                              if candidate[:2] in shown]
+        elif movie_filter.get("distinct"):
+            candidates = [(*refs[0], {'name': name, 'director': director, 'year': year,
+                                      'rating': rating, 'poster': poster})
+                          for name, director, year, rating, poster, refs
+                          in self._current_catalog()]
+        else:
+            return super().query_movies(filter, sort, limit, cursor)
+        entries = [(sort_key(sort, user_id, movie_id, movie), user_id, movie_id, movie)
+                   for user_id, movie_id, movie in candidates
+                   if matches(movie_filter, user_id, movie)]
+        if after:
+            entries = [entry for entry in entries if entry[0] > after]
+        return movie_page(heapq.nsmallest(limit + 1, entries), sort, limit)
@@ -0,0 +1,285 @@
+import argparse
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from collections.abc import Mapping
+from data_manager.json_data_manager import JSONDataManager
+
+MAGIC = b"MVSNAP1\0"
+# Magic, offset and length of the index, number of users
+HEADER = struct.Struct("<8sQQI")
+# Per user in the index: length of the user ID, then after the ID the
+# offset and length of the user's record
+INDEX_ID = struct.Struct("<H")
+INDEX_ENTRY = struct.Struct("<QI")
+
+
+def encode_user(user):
+    """
+    Encode a user as a snapshot record.
+
+    Args:
+        user (dict): The user's data in the users.json layout.
+
+    Returns:
+        bytes: The record.
+    """
+    return json.dumps(user, separators=(",", ":"), default=dict).encode()
+
+
+def write_snapshot(filename, records):
+    """
+    Write a snapshot file atomically.
+
+    The file holds a header, the records one after the other and an index
+    of where each record starts. It is written to a temporary file and
+    renamed, so readers always see a complete snapshot.
+
+    Args:
+        filename (str): The file to write.
+        records (iterable): (user ID, record bytes) pairs.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    descriptor, temp_filename = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(filename)), suffix=".tmp")
+    index = []
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(b"\0" * HEADER.size)
+            offset = HEADER.size
+            for user_id, record in records:
+                file.write(record)
+                index.append((user_id.encode(), offset, len(record)))
+                offset += len(record)
+            index_bytes = b"".join(INDEX_ID.pack(len(user_id)) + user_id
+                                   + INDEX_ENTRY.pack(record_offset, length)
+                                   for user_id, record_offset, length in index)
+            file.write(index_bytes)
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, offset, len(index_bytes), len(index)))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, filename)
+    except BaseException:
+        os.unlink(temp_filename)
+        raise
+    return offset + len(index_bytes)
+
+
+class Snapshot(Mapping):
+    """
+    A read-only view of a snapshot file, mapped into memory.
+
+    Opening one only reads the index. Looking up a user decodes that
+    user's record alone, so it costs the same however large the file is.
+    Iteration follows the order the users were written in.
+    """
+
+    def __init__(self, filename):
+        """
+        Map a snapshot file and read its index.
+
+        Args:
+            filename (str): The snapshot file.
+
+        Raises:
+            ValueError: If the file isn't a snapshot.
+        """
+        with open(filename, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, index_length, count = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a snapshot file")
+        self.bytes_read = HEADER.size + index_length
+        self._index = {}
+        position = index_offset
+        for _ in range(count):
+            (id_length,) = INDEX_ID.unpack_from(self._map, position)
+            position += INDEX_ID.size
+            user_id = self._map[position:position + id_length].decode()
+            position += id_length
+            self._index[user_id] = INDEX_ENTRY.unpack_from(self._map, position)
+            position += INDEX_ENTRY.size
+
+    def raw(self, user_id):
+        """
+        Return a user's record without decoding it.
+
+        Args:
+            user_id (str): The ID of the user.
+
+        Returns:
+            bytes: The encoded record.
+        """
+        offset, length = self._index[user_id]
+        return self._map[offset:offset + length]
+
+    def __getitem__(self, user_id):
+        record = self.raw(user_id)
+        self.bytes_read += len(record)
+        return json.loads(record)
+
+    def __contains__(self, user_id):
+        return user_id in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+
+class SnapshotDataManager(JSONDataManager):
+    """
+    A data manager storing users in a memory-mapped snapshot file.
+
+    Users are stored as length-prefixed JSON records with an offset index
+    (see write_snapshot), so reads of one user decode only that user's
+    record and never parse the whole file. The loaded data is a Snapshot,
+    which reads like the users dict of JSONDataManager, so all its methods
+    work unchanged; the views decode every user once when first built.
+
+    A write re-encodes only the users it changes and copies the records
+    of all others byte for byte into a new snapshot.
+    """
+
+    def __init__(self, filename) -> None:
+        """
+        Initialize the SnapshotDataManager.
+
+        Args:
+            filename (str): The filename of the snapshot file.
+        """
+        super().__init__(filename, cache=True)
+
+    def _read_db(self):
+        """
+        Map the snapshot file.
+
+        Returns:
+            Snapshot: The users.
+        """
+        snapshot = Snapshot(self.filename)
+        self.bytes_read += snapshot.bytes_read
+        return snapshot
+
+    def _view_users(self, data):
+        """
+        Decode all users for the views.
+
+        Args:
+            data (Snapshot): The users.
+
+        Returns:
+            dict: A dictionary representing the users.
+        """
+        return dict(data.items())
+
+    def _apply(self, changes):
+        """
+        Apply change records to the touched users and write a new snapshot.
+
+        Args:
+            changes (list): The change records, see _apply_change.
+
+        Returns:
+            Snapshot: The users after the changes.
+        """
+        current = self._latest()
+        touched = {}
+        for change in changes:
+            user_id = change["user_id"]
+            if user_id in current and user_id not in touched:
+                touched[user_id] = current[user_id]
+        for change in changes:
+            self._apply_change(touched, change)
+        # The old file stays mapped while the new one is written next to it
+        records = itertools.chain(
+            ((user_id, encode_user(touched[user_id]) if user_id in touched
+              else current.raw(user_id)) for user_id in current),
+            ((user_id, encode_user(user)) for user_id, user in touched.items()
+             if user_id not in current))
+        try:
+            self.bytes_written += write_snapshot(self.filename, records)
+        except OSError:
+            with self._lock:
+                self._users = None
+                self._drop_views()
+            return current
+        users = self._read_db()
+        self._publish(current, users, changes, self._replayer(current, changes))
+        self._bump_versions({change["user_id"] for change in changes})
+        return users
+
+    def save_db(self, data):
+        """
+        Save users to the snapshot file.
+
+        Args:
+            data (Mapping): The users to be saved.
+
+        Returns:
+            bool: True if the data was saved successfully, False otherwise.
+        """
+        try:
+            self.bytes_written += write_snapshot(
+                self.filename, ((user_id, encode_user(user)) for user_id, user in data.items()))
+            return True
+        except IOError:
+            return {"IOError: An error occurred while writing to the file."}
+
+
+def json_to_snapshot(json_filename, snapshot_filename):
+    """
+    Convert a users.json file to a snapshot.
+
+    Args:
+        json_filename (str): The users.json file to read.
+        snapshot_filename (str): The snapshot file to write.
+
+    Returns:
+        int: The number of users.
+    """
+    with open(json_filename, "r") as jfile:
+        users = json.load(jfile)
+    write_snapshot(snapshot_filename,
+                   ((user_id, encode_user(user)) for user_id, user in users.items()))
+    return len(users)
+
+
+def snapshot_to_json(snapshot_filename, json_filename):
+    """
+    Convert a snapshot back to a users.json file.
+
+    Args:
+        snapshot_filename (str): The snapshot file to read.
+        json_filename (str): The users.json file to write.
+
+    Returns:
+        int: The number of users.
+    """
+    users = dict(Snapshot(snapshot_filename).items())
+    with open(json_filename, "w") as jfile:
+        json.dump(users, jfile, indent=4)
+    return len(users)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Convert users.json to a snapshot file, or back with --reverse.")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("--reverse", action="store_true",
+                        help="Convert a snapshot to users.json.")
+    args = parser.parse_args()
+    if args.reverse:
+        count = snapshot_to_json(args.source, args.destination)
+    else:
+        count = json_to_snapshot(args.source, args.destination)
+    print(f"Converted {count} users.", file=sys.stderr)
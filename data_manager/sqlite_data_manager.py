@@ -0,0 +1,683 @@
+import argparse
+import json
+import threading
+import time
+from sqlalchemy import (Float, ForeignKey, Integer, String, UniqueConstraint,
+                        create_engine, event, func, select, text, tuple_, update)
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+from data_manager.batch import check_operations
+from data_manager.data_manager_interface import DataManagerInterface
+from data_manager.query import check_query, decode_cursor, movie_page, sort_key
+from data_manager.search import SearchIndex
+
+# The latest movie changes kept for the search indexes of all processes.
+# An index further behind is built again from all movies.
+MOVIE_CHANGES_KEPT = 10000
+# Triggers recording every change to a user movie in movie_changes
+MOVIE_CHANGE_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS movies_inserted AFTER INSERT ON movies BEGIN
+        INSERT INTO movie_changes (user_id, movie_id) VALUES (NEW.user_id, NEW.movie_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movies_updated AFTER UPDATE ON movies BEGIN
+        INSERT INTO movie_changes (user_id, movie_id) VALUES (OLD.user_id, OLD.movie_id);
+        INSERT INTO movie_changes (user_id, movie_id) VALUES (NEW.user_id, NEW.movie_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movies_deleted AFTER DELETE ON movies BEGIN
+        INSERT INTO movie_changes (user_id, movie_id) VALUES (OLD.user_id, OLD.movie_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS movie_changes_trimmed AFTER INSERT ON movie_changes BEGIN
+        DELETE FROM movie_changes WHERE seq <= NEW.seq - {MOVIE_CHANGES_KEPT};
+    END""",
+)
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class User(Base):
+    """A user of the app."""
+    __tablename__ = "users"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String, index=True)
+    version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+
+
+class DataVersion(Base):
+    """The single-row version of all data, bumped by every change."""
+    __tablename__ = "data_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer)
+
+
+class MovieChange(Base):
+    """A user movie that was added, updated or deleted, in the order of the changes."""
+    __tablename__ = "movie_changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer)
+    movie_id: Mapped[int] = mapped_column(Integer)
+
+
+class Movie(Base):
+    """A favorite movie of a user, numbered per user like in users.json."""
+    __tablename__ = "movies"
+    __table_args__ = (UniqueConstraint("user_id", "movie_id"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    movie_id: Mapped[int] = mapped_column(Integer, index=True)
+    name: Mapped[str] = mapped_column(String, index=True)
+    director: Mapped[str] = mapped_column(String)
+    year: Mapped[int] = mapped_column(Integer, index=True)
+    rating: Mapped[float] = mapped_column(Float, index=True)
+    poster: Mapped[str] = mapped_column(String)
+
+    def to_dict(self):
+        """
+        Convert the movie to the dictionary used by the JSON data manager.
+
+        Returns:
+            dict: The movie's name, director, year, rating and poster.
+        """
+        return {
+            'name': self.name,
+            'director': self.director,
+            'year': self.year,
+            'rating': self.rating,
+            'poster': self.poster
+        }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL so readers don't block the writer, on every new connection."""
+    # Let _begin() start the transactions instead of the sqlite3 module
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def _begin(connection):
+    """
+    Start a transaction, taking the write lock up front for writers.
+
+    A deferred transaction that reads before it writes, e.g. to pick the
+    next movie ID, can't upgrade to a write lock once another connection
+    has written meanwhile and fails with SQLITE_BUSY at once. BEGIN
+    IMMEDIATE makes concurrent writers wait for the lock instead.
+    """
+    if connection.get_execution_options().get("sqlite_write"):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        connection.exec_driver_sql("BEGIN")
+
+
+class SQLiteDataManager(DataManagerInterface):
+    """A data manager that interacts with a SQLite database."""
+
+    def __init__(self, filename):
+        """
+        Initialize the SQLiteDataManager and create missing tables.
+
+        Args:
+            filename (str): The filename of the SQLite database.
+        """
+        self.filename = filename
+        self._search_index = None
+        self._search_movies = {}
+        self._search_seq = 0
+        self._search_lock = threading.Lock()
+        self.engine = create_engine(f"sqlite:///{filename}")
+        event.listen(self.engine, "connect", _set_sqlite_pragmas)
+        event.listen(self.engine, "begin", _begin)
+        # Sessions of mutations, which start with BEGIN IMMEDIATE
+        self._writer = self.engine.execution_options(sqlite_write=True)
+        Base.metadata.create_all(self.engine)
+        with self.engine.begin() as connection:
+            columns = [row[1] for row in connection.execute(text("PRAGMA table_info(users)"))]
+            if "version" not in columns:
+                connection.execute(text(
+                    "ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+            for trigger in MOVIE_CHANGE_TRIGGERS:
+                connection.execute(text(trigger))
+
+    @staticmethod
+    def _bump_version(session, user_ids=()):
+        """
+        Bump the data version, and that of the given users, in a transaction.
+
+        Versions are nanosecond timestamps, kept increasing even if the
+        clock goes back.
+
+        Args:
+            session (Session): The session of the changing transaction.
+            user_ids (iterable): The IDs of the users that changed.
+        """
+        data_version = session.get(DataVersion, 1)
+        if data_version is None:
+            data_version = DataVersion(id=1, version=0)
+            session.add(data_version)
+        data_version.version = max(data_version.version + 1, time.time_ns())
+        user_ids = [int(user_id) for user_id in user_ids]
+        if user_ids:
+            session.execute(update(User).where(User.id.in_(user_ids))
+                            .values(version=data_version.version))
+
+    def _movies_by_user(self, session, user_ids=None):
+        """
+        Group movies by user, keyed like users.json.
+
+        Args:
+            session (Session): The session to query with.
+            user_ids (list): Only include these users, or all if None.
+
+        Returns:
+            dict: A dictionary mapping user IDs to their movies.
+        """
+        query = select(Movie).order_by(Movie.user_id, Movie.movie_id)
+        if user_ids is not None:
+            query = query.where(Movie.user_id.in_(user_ids))
+        movies_by_user = {}
+        for movie in session.scalars(query):
+            movies = movies_by_user.setdefault(movie.user_id, {})
+            movies[str(movie.movie_id)] = movie.to_dict()
+        return movies_by_user
+
+    def get_all_users(self):
+        """
+        Retrieve all users from the database.
+
+        Returns:
+            dict: A dictionary representing the users.
+        """
+        with Session(self.engine) as session:
+            movies_by_user = self._movies_by_user(session)
+            return {
+                str(user.id): {
+                    "name": user.name,
+                    "movies": movies_by_user.get(user.id, {})
+                }
+                for user in session.scalars(select(User).order_by(User.id))
+            }
+
+    def get_user_movies(self, user_id):
+        """
+        Retrieve the movies of a specific user.
+
+        Args:
+            user_id (str): The ID of the user.
+
+        Returns:
+            dict: A dictionary representing the movies of the user.
+        """
+        with Session(self.engine) as session:
+            return self._movies_by_user(session, [int(user_id)]).get(int(user_id), {})
+
+    def add_user_movie(self, user_id, name, director, year, rating, poster):
+        """
+        Add a movie to a user's list of movies.
+
+        Args:
+            user_id (str): The ID of the user.
+            name (str): The name of the movie.
+            director (str): The director of the movie.
+            year (str): The year of the movie.
+            rating (str): The rating of the movie.
+            poster (str): The url to the movie's poster from OMDB
+
+        Returns:
+            dict: The updated list of movies for the user.
+        """
+        try:
+            with Session(self._writer) as session, session.begin():
+                movie_id = session.scalar(
+                    select(func.coalesce(func.max(Movie.movie_id), 0))
+                    .where(Movie.user_id == int(user_id))) + 1
+                session.add(Movie(user_id=int(user_id), movie_id=movie_id,
+                                  name=name, director=director, year=int(year),
+                                  rating=float(rating), poster=poster))
+                self._bump_version(session, [user_id])
+        except SQLAlchemyError:
+            return {"SQLAlchemyError: An error occurred while adding the movie."}
+        return self.get_user_movies(user_id)
+
+    def delete_user_movie(self, user_id, movie_id):
+        """
+        Delete a movie from a user's list of movies.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie to be deleted.
+
+        Returns:
+            bool: True if the movie was deleted successfully, False otherwise.
+        """
+        try:
+            with Session(self._writer) as session, session.begin():
+                movie = session.scalar(select(Movie).where(
+                    Movie.user_id == int(user_id), Movie.movie_id == int(movie_id)))
+                if movie is None:
+                    return False
+                session.delete(movie)
+                self._bump_version(session, [user_id])
+                return True
+        except SQLAlchemyError:
+            return False
+
+    def update_user_movie(self, user_id, movie_id, updated_movie):
+        """
+        Update a movie in a user's list of movies.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie to be updated.
+            updated_movie (dict): The updated movie information.
+
+        Returns:
+            bool: True if the movie was updated successfully, False otherwise.
+        """
+        try:
+            with Session(self._writer) as session, session.begin():
+                movie = session.scalar(select(Movie).where(
+                    Movie.user_id == int(user_id), Movie.movie_id == int(movie_id)))
+                if movie is None:
+                    return False
+                for field in ('name', 'director', 'year', 'rating', 'poster'):
+                    if field in updated_movie:
+                        setattr(movie, field, updated_movie[field])
+                self._bump_version(session, [user_id])
+                return True
+        except SQLAlchemyError:
+            return False
+
+    def apply(self, operations):
+        """
+        Run a batch of mutations in one transaction.
+
+        Args:
+            operations (list): The operations, see batch.check_operations.
+
+        Returns:
+            list: Per operation, the ID of the new user or of the movie added,
+                updated or deleted.
+
+        Raises:
+            ValueError: If an operation is malformed or refers to a user or
+                movie that doesn't exist. Nothing is changed then.
+        """
+        operations = check_operations(operations)
+        results = []
+        with Session(self._writer) as session, session.begin():
+            user_ids = set()
+            for number, operation in enumerate(operations):
+                if operation["op"] == "add_user":
+                    user = User(name=operation["name"])
+                    session.add(user)
+                    session.flush()
+                    user_ids.add(user.id)
+                    results.append(str(user.id))
+                    continue
+                user_id = operation["user_id"]
+                if not user_id.isdigit() or session.get(User, int(user_id)) is None:
+                    raise ValueError(f"Operation {number}: user {user_id} not found")
+                user_ids.add(int(user_id))
+                if operation["op"] == "add_movie":
+                    movie = operation["movie"]
+                    movie_id = session.scalar(
+                        select(func.coalesce(func.max(Movie.movie_id), 0))
+                        .where(Movie.user_id == int(user_id))) + 1
+                    session.add(Movie(user_id=int(user_id), movie_id=movie_id,
+                                      name=movie['name'], director=movie['director'],
+                                      year=int(movie['year']), rating=float(movie['rating']),
+                                      poster=movie['poster']))
+                    results.append(str(movie_id))
+                    continue
+                movie_id = operation["movie_id"]
+                movie = None
+                if movie_id.isdigit():
+                    movie = session.scalar(select(Movie).where(
+                        Movie.user_id == int(user_id), Movie.movie_id == int(movie_id)))
+                if movie is None:
+                    raise ValueError(
+                        f"Operation {number}: movie {movie_id} of user {user_id} not found")
+                if operation["op"] == "update_movie":
+                    for field, value in operation["movie"].items():
+                        setattr(movie, field, value)
+                else:
+                    session.delete(movie)
+                results.append(movie_id)
+            if user_ids:
+                self._bump_version(session, user_ids)
+        return results
+
+    def get_movie_details(self, movie_id):
+        """
+        Retrieve the details of a specific movie.
+
+        Args:
+            movie_id (str): The ID of the movie.
+
+        Returns:
+            dict: A dictionary representing the movie details.
+        """
+        with Session(self.engine) as session:
+            movie = session.scalar(
+                select(Movie).where(Movie.movie_id == int(movie_id))
+                .order_by(Movie.user_id).limit(1))
+            return movie.to_dict() if movie else None
+
+    def get_users_with_movie(self, movie_id):
+        """
+        Retrieve a list of user IDs that have a specific movie.
+
+        Args:
+            movie_id (str): The ID of the movie.
+
+        Returns:
+            list: A list of user IDs.
+        """
+        with Session(self.engine) as session:
+            return list(session.scalars(
+                select(Movie.user_id).where(Movie.movie_id == int(movie_id))
+                .order_by(Movie.user_id)))
+
+    def get_users_by_name(self, name):
+        """
+        Retrieve a list of user IDs that have a specific name.
+
+        Args:
+            name (str): The name of the user.
+
+        Returns:
+            list: A list of user IDs.
+        """
+        with Session(self.engine) as session:
+            return list(session.scalars(
+                select(User.id).where(User.name == name).order_by(User.id)))
+
+    def get_top_rated_movies(self, n):
+        """
+        Retrieve the top-rated movies.
+
+        Args:
+            n (int): The number of movies to retrieve.
+
+        Returns:
+            list: A list of top-rated movies, empty if n isn't positive.
+        """
+        # SQLite reads LIMIT -1 as no limit at all
+        n = max(int(n), 0)
+        with Session(self.engine) as session:
+            return [movie.to_dict() for movie in session.scalars(
+                select(Movie).order_by(Movie.rating.desc(), Movie.id).limit(n))]
+
+    def get_movie_count_per_year(self):
+        """
+        Retrieve the movie count per year.
+
+        Returns:
+            dict: A dictionary with movie counts per year.
+        """
+        with Session(self.engine) as session:
+            return dict(session.execute(
+                select(Movie.year, func.count()).group_by(Movie.year)).all())
+
+    def get_user_by_id(self, user_id):
+        """
+        Retrieve a user by ID.
+
+        Args:
+            user_id (str): The ID of the user.
+
+        Returns:
+            dict: A dictionary representing the user.
+        """
+        with Session(self.engine) as session:
+            user = session.get(User, int(user_id))
+            if user is None:
+                return None
+            movies = self._movies_by_user(session, [user.id]).get(user.id, {})
+            return {"name": user.name, "movies": movies}
+
+    def add_user(self, name):
+        """
+        Add a new user.
+
+        Args:
+            name (str): The name of the user.
+
+        Returns:
+            bool: True if the user was added successfully, False otherwise.
+        """
+        try:
+            with Session(self._writer) as session, session.begin():
+                user = User(name=name)
+                session.add(user)
+                session.flush()
+                self._bump_version(session, [user.id])
+            return True
+        except SQLAlchemyError:
+            return False
+
+    def create_movie_list(self):
+        """
+        Create a list of the distinct movies of all users.
+
+        Movies count as the same when their name, director and year match;
+        each is shown with the data of the first user who added it.
+
+        Returns:
+            list: A list of dictionaries representing movies, in the order
+                they were first added.
+        """
+        first_ids = select(func.min(Movie.id)).group_by(
+            Movie.name, Movie.director, Movie.year)
+        with Session(self.engine) as session:
+            return [movie.to_dict() for movie in session.scalars(
+                select(Movie).where(Movie.id.in_(first_ids)).order_by(Movie.id))]
+
+    def search_movies(self, query, page=1, per_page=20):
+        """
+        Search the distinct movies by name and director.
+
+        Args:
+            query (str): The words to look for, matched exactly, as a
+                prefix or with typos.
+            page (int): The page of results, starting at 1.
+            per_page (int): The number of results per page.
+
+        Returns:
+            dict: The total number of matches, the page, per_page and the
+                ranked results.
+
+        The search index is kept in memory. Triggers record every changed
+        user movie in movie_changes, so only those are read again when the
+        data changed since; the index is built from all movies the first
+        time, or when more changes were made than the table keeps.
+        """
+        with self._search_lock, Session(self.engine) as session:
+            latest = session.scalar(select(func.max(MovieChange.seq))) or 0
+            if self._search_index is not None and latest != self._search_seq:
+                oldest = session.scalar(select(func.min(MovieChange.seq)))
+                if oldest > self._search_seq + 1:
+                    self._search_index = None
+            if self._search_index is None:
+                self._build_search_index(session)
+            elif latest != self._search_seq:
+                self._update_search_index(session)
+            self._search_seq = latest
+            return self._search_index.search(query, page, per_page)
+
+    def _build_search_index(self, session):
+        """
+        Build the search index from all movies.
+
+        Args:
+            session (Session): The session of the search's transaction.
+        """
+        self._search_index = SearchIndex()
+        self._search_movies = {}
+        for movie in session.scalars(select(Movie).order_by(Movie.id)):
+            ref = (str(movie.user_id), str(movie.movie_id))
+            self._search_movies[ref] = movie.to_dict()
+            self._search_index.add_movie(*ref, self._search_movies[ref])
+
+    def _update_search_index(self, session, chunk_size=500):
+        """
+        Read the user movies changed since the search index was last
+        brought up to date again.
+
+        Args:
+            session (Session): The session of the search's transaction.
+            chunk_size (int): The user movies read per query.
+        """
+        refs = list(dict.fromkeys(session.execute(
+            select(MovieChange.user_id, MovieChange.movie_id)
+            .where(MovieChange.seq > self._search_seq).order_by(MovieChange.seq)).tuples()))
+        for start in range(0, len(refs), chunk_size):
+            chunk = refs[start:start + chunk_size]
+            current = {(movie.user_id, movie.movie_id): movie.to_dict()
+                       for movie in session.scalars(select(Movie).where(
+                           tuple_(Movie.user_id, Movie.movie_id).in_(chunk)))}
+            for user_id, movie_id in chunk:
+                ref = (str(user_id), str(movie_id))
+                old = self._search_movies.pop(ref, None)
+                if old is not None:
+                    self._search_index.remove_movie(*ref, old)
+                movie = current.get((user_id, movie_id))
+                if movie is not None:
+                    self._search_movies[ref] = movie
+                    self._search_index.add_movie(*ref, movie)
+
+    def query_movies(self, filter=None, sort="rating", limit=20, cursor=None):
+        """
+        Read one page of user movies with a keyset query.
+
+        The cursor becomes a condition on the sort columns, so SQLite walks
+        the index of the sort column from there and stops after the page.
+
+        Args:
+            filter (dict): Any of year_min, year_max, min_rating, director,
+                user_id, and distinct to keep one user movie per entry of
+                create_movie_list(), or None.
+            sort (str): "rating", highest first, "year", newest first, or
+                "name".
+            limit (int): The number of movies per page.
+            cursor (str): The next_cursor of the previous page, or None for
+                the first page.
+
+        Returns:
+            dict: The "movies", each with its "user_id" and "movie_id", and
+                the "next_cursor", or None on the last page.
+
+        Raises:
+            ValueError: If an argument or the cursor is invalid.
+        """
+        movie_filter = check_query(filter, sort, limit)
+        after = decode_cursor(sort, cursor)
+        column = {"rating": Movie.rating, "year": Movie.year, "name": Movie.name}[sort]
+        # Keys negate rating and year, so those columns are read descending
+        descending = sort != "name"
+        query = select(Movie)
+        if "user_id" in movie_filter:
+            if not movie_filter["user_id"].isdigit():
+                return movie_page([], sort, limit)
+            query = query.where(Movie.user_id == int(movie_filter["user_id"]))
+        if "director" in movie_filter:
+            query = query.where(Movie.director == movie_filter["director"])
+        if "min_rating" in movie_filter:
+            query = query.where(Movie.rating >= movie_filter["min_rating"])
+        if "year_min" in movie_filter:
+            query = query.where(Movie.year >= movie_filter["year_min"])
+        if "year_max" in movie_filter:
+            query = query.where(Movie.year <= movie_filter["year_max"])
+        if movie_filter.get("distinct"):
+            query = query.where(Movie.id.in_(select(func.min(Movie.id)).group_by(
+                Movie.name, Movie.director, Movie.year)))
+        if after is not None:
+            value = -after[0] if descending else after[0]
+            beyond = column < value if descending else column > value
+            query = query.where(beyond | ((column == value)
+                                          & (tuple_(Movie.user_id, Movie.movie_id) > after[1:])))
+        query = query.order_by(column.desc() if descending else column,
+                               Movie.user_id, Movie.movie_id).limit(limit + 1)
+        with Session(self.engine) as session:
+            entries = []
+            for movie in session.scalars(query):
+                user_id, movie_id, data = str(movie.user_id), str(movie.movie_id), movie.to_dict()
+                entries.append((sort_key(sort, user_id, movie_id, data), user_id, movie_id, data))
+        return movie_page(entries, sort, limit)
+
+    def get_data_version(self):
+        """
+        Retrieve the version of all data, which grows with every change.
+
+        Returns:
+            int: The data version.
+        """
+        with Session(self.engine) as session:
+            data_version = session.get(DataVersion, 1)
+            return data_version.version if data_version else 0
+
+    def get_user_version(self, user_id):
+        """
+        Retrieve the version of one user's data, which grows with every
+        change to that user.
+
+        Args:
+            user_id (str): The ID of the user.
+
+        Returns:
+            int: The user's data version.
+        """
+        with Session(self.engine) as session:
+            return session.scalar(
+                select(User.version).where(User.id == int(user_id))) or 0
+
+    def import_json(self, json_filename):
+        """
+        Copy the users and movies of a users.json file into the database.
+
+        User and movie IDs are kept, so existing links keep working.
+
+        Args:
+            json_filename (str): The filename of the JSON file.
+
+        Returns:
+            tuple: The number of users and movies imported.
+        """
+        with open(json_filename, "r") as jfile:
+            users = json.load(jfile)
+        movie_count = 0
+        with Session(self._writer) as session, session.begin():
+            for user_id, user_data in users.items():
+                session.add(User(id=int(user_id), name=user_data.get("name", "")))
+            session.flush()
+            for user_id, user_data in users.items():
+                for movie_id, movie in user_data.get("movies", {}).items():
+                    session.add(Movie(user_id=int(user_id), movie_id=int(movie_id),
+                                      name=movie['name'], director=movie['director'],
+                                      year=int(movie['year']),
+                                      rating=float(movie['rating']),
+                                      poster=movie['poster']))
+                    movie_count += 1
+            self._bump_version(session, users.keys())
+        return len(users), movie_count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Import a users.json file into a SQLite database.")
+    parser.add_argument("json_filename")
+    parser.add_argument("sqlite_filename")
+    args = parser.parse_args()
+    user_count, movie_count = SQLiteDataManager(
+        args.sqlite_filename).import_json(args.json_filename)
+    print(f"Imported {user_count} users and {movie_count} movies.")
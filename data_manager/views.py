@@ -0,0 +1,65 @@
+class MovieView:
+    """
+    Data derived from the users that a data manager keeps up to date.
+
+    A view is built once from all users with rebuild() and then maintained
+    by the data manager, which reports every change through add_user(),
+    add_movie() and remove_movie(). An updated movie is reported as the
+    removal of the old version followed by the addition of the new one.
+    Users are passed in the users.json layout: user IDs mapping to a name
+    and a dictionary of movies keyed by movie ID.
+    """
+
+    def rebuild(self, users):
+        """
+        Discard the view's state and build it again from all users.
+
+        Args:
+            users (dict): A dictionary representing the users.
+        """
+        self.clear()
+        for user_id, user_data in users.items():
+            self.add_user(user_id, user_data)
+            for movie_id, movie in user_data.get("movies", {}).items():
+                self.add_movie(user_id, movie_id, movie)
+
+    def clear(self):
+        """Discard the view's state."""
+
+    def dump(self):
+        """
+        Describe the view's state for comparison with a rebuilt view.
+
+        Returns:
+            object: A value that is equal for views holding the same data.
+        """
+        raise NotImplementedError
+
+    def add_user(self, user_id, user):
+        """
+        Record a new user.
+
+        Args:
+            user_id (str): The ID of the user.
+            user (dict): The user's data.
+        """
+
+    def add_movie(self, user_id, movie_id, movie):
+        """
+        Record a movie added to a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data.
+        """
+
+    def remove_movie(self, user_id, movie_id, movie):
+        """
+        Forget a movie removed from a user's list.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            movie (dict): The movie's data as it was recorded.
+        """
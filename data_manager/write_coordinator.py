@@ -0,0 +1,140 @@
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows, where only threads are coordinated
+    fcntl = None
+
+
+class FileLock:
+    """
+    An exclusive lock shared by the threads and processes using a file.
+
+    It holds an ``flock`` on a lock file next to the data file, so worker
+    processes writing the same data take turns. Threads of one process
+    take turns on a reentrant lock first, so the lock can be entered again
+    by the thread holding it. Without fcntl only the threads of a process
+    are coordinated.
+    """
+
+    def __init__(self, filename):
+        """
+        Initialize the FileLock.
+
+        Args:
+            filename (str): The lock file, created when first locked.
+        """
+        self.filename = filename
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                self._file = open(self.filename, "a")
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            # Closing the file releases the flock
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+
+class WriteCoordinator:
+    """
+    Serializes the writes of a data manager and commits them in groups.
+
+    Callers submit operations and wait for their result. One of the waiting
+    threads becomes the leader: it takes every operation submitted so far,
+    locks the file and runs them as one batch through ``run_batch``, which
+    reloads the data if another process changed it, applies all operations
+    and saves once. Operations arriving while a batch is written wait for
+    the next one, so under load many mutations share one write and fsync,
+    and since each batch starts from the data on disk none is lost.
+    """
+
+    def __init__(self, lock_filename, run_batch, window=0.0):
+        """
+        Initialize the WriteCoordinator.
+
+        Args:
+            lock_filename (str): The lock file shared with other processes.
+            run_batch (callable): Runs a list of operations with the file
+                locked, returning one result or exception per operation.
+            window (float): Seconds the leader waits for more operations
+                before writing. 0 only groups operations that arrive while
+                the previous batch is written.
+        """
+        self.file_lock = FileLock(lock_filename)
+        self.run_batch = run_batch
+        self.window = window
+        self.batches = 0
+        self.operations = 0
+        self._condition = threading.Condition()
+        self._pending = []
+        self._leading = False
+
+    def submit(self, operation):
+        """
+        Run an operation in the next batch.
+
+        Args:
+            operation (object): An operation understood by ``run_batch``.
+
+        Returns:
+            object: The operation's result.
+
+        Raises:
+            Exception: Whatever the operation raised.
+        """
+        entry = {"operation": operation, "done": False}
+        with self._condition:
+            self._pending.append(entry)
+            while not entry["done"] and self._leading:
+                self._condition.wait()
+            if not entry["done"]:
+                self._leading = True
+        if not entry["done"]:
+            self._lead()
+        if isinstance(entry["result"], Exception):
+            raise entry["result"]
+        return entry["result"]
+
+    def _lead(self):
+        """Run one batch holding the operations submitted so far."""
+        batch = []
+        try:
+            if self.window:
+                time.sleep(self.window)
+            with self._condition:
+                batch, self._pending = self._pending, []
+            try:
+                with self.file_lock:
+                    results = self.run_batch([entry["operation"] for entry in batch])
+            except Exception as error:
+                results = [error] * len(batch)
+            for entry, result in zip(batch, results):
+                entry["result"] = result
+            self.batches += 1
+            self.operations += len(batch)
+        finally:
+            with self._condition:
+                for entry in batch:
+                    entry.setdefault("result", RuntimeError("The write was interrupted"))
+                    entry["done"] = True
+                self._leading = False
+                self._condition.notify_all()
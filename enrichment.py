@@ -0,0 +1,308 @@
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Mapping
+import requests
+
+PLACEHOLDER_POSTER = "/static/poster_placeholder.svg"
+
+logger = logging.getLogger(__name__)
+
+
+class EnrichmentQueue:
+    """
+    Fills in the OMDb data of saved movies in the background.
+
+    Jobs are kept in a SQLite file, so pending work survives restarts and
+    worker processes sharing the file split it between them. Worker threads
+    claim every pending job of one title at once, so a title is only looked
+    up once however many users added it meanwhile. The poster is then
+    patched in through ``update_user_movie``, unless the user changed the
+    movie in the meantime.
+
+    Jobs whose lookup or update raises are retried with exponential
+    backoff up to ``max_attempts`` times, whatever the error. A claimed job
+    is leased for ``lease`` seconds, after which it is handed to another
+    worker, e.g. when its process died. Finished jobs are deleted after
+    ``keep`` seconds. The SQLite file is opened on first use, so creating
+    the queue costs nothing in processes that never use it.
+    """
+
+    def __init__(self, filename, data_manager, lookup, workers=2, max_attempts=5,
+                 backoff=5, lease=60, keep=24 * 3600, clock=time.time):
+        """
+        Initialize the EnrichmentQueue.
+
+        Args:
+            filename (str): The filename of the SQLite database.
+            data_manager (DataManagerInterface): Where the movies are stored.
+            lookup (callable): Returns the OMDb data for a title.
+            workers (int): The number of worker threads start() runs.
+            max_attempts (int): Lookups made before a job fails.
+            backoff (float): Seconds before the first retry, doubled after
+                each further attempt.
+            lease (float): Seconds a worker may hold a job.
+            keep (float): Seconds finished jobs stay in the status.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.filename = filename
+        self.data_manager = data_manager
+        self.lookup = lookup
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.keep = keep
+        self.clock = clock
+        self._threads = []
+        self._stopping = threading.Event()
+        self._wakeup = threading.Condition()
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._connection = None
+
+    @property
+    def _db(self):
+        """
+        The SQLite connection, opened and set up on first use.
+
+        Returns:
+            sqlite3.Connection: The connection.
+        """
+        if self._connection is None:
+            with self._connect_lock:
+                if self._connection is None:
+                    db = sqlite3.connect(self.filename, check_same_thread=False)
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.execute("PRAGMA synchronous=NORMAL")
+                    db.execute(
+                        "CREATE TABLE IF NOT EXISTS jobs ("
+                        "id INTEGER PRIMARY KEY, user_id TEXT, movie_id TEXT, title TEXT, "
+                        "title_key TEXT, status TEXT, attempts INTEGER, run_at REAL, "
+                        "claimed_by TEXT, last_error TEXT, updated_at REAL)")
+                    db.execute(
+                        "CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at)")
+                    db.commit()
+                    self._connection = db
+        return self._connection
+
+    @staticmethod
+    def _key(title):
+        """
+        Normalize a title so different spellings share a lookup.
+
+        Args:
+            title (str): The title of the movie.
+
+        Returns:
+            str: The title key.
+        """
+        return " ".join(title.lower().split())
+
+    def enqueue(self, user_id, movie_id, title):
+        """
+        Queue the enrichment of a saved movie.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            title (str): The title to look up.
+        """
+        now = self.clock()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (user_id, movie_id, title, title_key, status, "
+                "attempts, run_at, updated_at) VALUES (?, ?, ?, ?, 'pending', 0, ?, ?)",
+                (str(user_id), str(movie_id), title, self._key(title), now, now))
+            self._db.commit()
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def _claim(self, title_key=None):
+        """
+        Claim all due jobs of one title.
+
+        Jobs whose lease ran out are due again. Titles another worker is
+        looking up are skipped, as their jobs are handed over afterwards.
+
+        Args:
+            title_key (str): The title to claim, by default the one waiting
+                the longest.
+
+        Returns:
+            list: The claimed jobs as (id, user_id, movie_id, title, attempts)
+            tuples, empty if nothing is due.
+        """
+        now = self.clock()
+        token = uuid.uuid4().hex
+        if title_key is None:
+            title_query = (
+                "(SELECT title_key FROM jobs WHERE status IN ('pending', 'running') "
+                "AND run_at <= :now AND title_key NOT IN (SELECT title_key FROM jobs "
+                "WHERE status = 'running' AND run_at > :now) ORDER BY run_at LIMIT 1)")
+        else:
+            title_query = ":title_key"
+        with self._lock:
+            # A single UPDATE is atomic, so concurrent workers, even in other
+            # processes, never claim the same job
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', claimed_by = :token, "
+                "run_at = :leased_until, updated_at = :now "
+                "WHERE status IN ('pending', 'running') AND run_at <= :now "
+                f"AND title_key = {title_query}",
+                {"token": token, "leased_until": now + self.lease, "now": now,
+                 "title_key": title_key})
+            self._db.commit()
+            return self._db.execute(
+                "SELECT id, user_id, movie_id, title, attempts FROM jobs "
+                "WHERE claimed_by = ? AND status = 'running'", (token,)).fetchall()
+
+    def _finish(self, job_ids, status, error=None):
+        """
+        Record the outcome of claimed jobs and forget old finished ones.
+
+        Args:
+            job_ids (list): The IDs of the jobs.
+            status (str): "done", "not_found" or "failed".
+            error (str): What went wrong, if anything.
+        """
+        now = self.clock()
+        with self._lock:
+            self._db.executemany(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, last_error = ?, "
+                "updated_at = ? WHERE id = ?",
+                [(status, error, now, job_id) for job_id in job_ids])
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'not_found', 'failed') "
+                "AND updated_at < ?", (now - self.keep,))
+            self._db.commit()
+
+    def _retry(self, jobs, error):
+        """
+        Put claimed jobs back in the queue after a failed lookup, or fail
+        the ones that used up their attempts.
+
+        Args:
+            jobs (list): The claimed jobs.
+            error (str): What went wrong.
+        """
+        now = self.clock()
+        retried = []
+        failed = []
+        for job_id, _, _, _, attempts in jobs:
+            if attempts + 1 >= self.max_attempts:
+                failed.append(job_id)
+            else:
+                retried.append((now + self.backoff * 2 ** attempts, error, now, job_id))
+        with self._lock:
+            self._db.executemany(
+                "UPDATE jobs SET status = 'pending', attempts = attempts + 1, "
+                "run_at = ?, last_error = ?, updated_at = ? WHERE id = ?", retried)
+            self._db.commit()
+        if failed:
+            self._finish(failed, "failed", error)
+
+    def _patch(self, user_id, movie_id, title, data):
+        """
+        Store the looked up poster in a movie still waiting for it.
+
+        Args:
+            user_id (str): The ID of the user.
+            movie_id (str): The ID of the movie.
+            title (str): The title the job was queued with.
+            data (dict): The OMDb response.
+        """
+        movies = self.data_manager.get_user_movies(user_id)
+        if isinstance(movies, list):
+            # CSVDataManager lists movies with their ID inside
+            movies = {str(movie.get("id")): movie for movie in movies}
+        movie = movies.get(movie_id) if isinstance(movies, dict) else None
+        # Leave movies alone that were deleted, edited or replaced since
+        if (isinstance(movie, Mapping) and movie.get("name") == title
+                and movie.get("poster") == PLACEHOLDER_POSTER):
+            self.data_manager.update_user_movie(
+                user_id, movie_id, {"poster": data.get("Poster", PLACEHOLDER_POSTER)})
+
+    def run_once(self):
+        """
+        Process the due jobs of one title.
+
+        Returns:
+            bool: False if no job was due.
+        """
+        jobs = self._claim()
+        if not jobs:
+            return False
+        try:
+            data = self.lookup(jobs[0][3])
+            found = isinstance(data, dict) and data.get("Response") != "False"
+            while jobs:
+                if found:
+                    for _, user_id, movie_id, title, _ in jobs:
+                        self._patch(user_id, movie_id, title, data)
+                self._finish([job[0] for job in jobs], "done" if found else "not_found")
+                # Jobs of the same title queued during the lookup share its answer
+                jobs = self._claim(self._key(jobs[0][3]))
+        except Exception as err:
+            # Every failure uses up an attempt, so no job is leased forever
+            if not isinstance(err, requests.exceptions.RequestException):
+                logger.exception("Enrichment of %r failed", jobs[0][3])
+            self._retry(jobs, f"{type(err).__name__}: {err}")
+        return True
+
+    def _work(self):
+        """Process jobs until stop() is called."""
+        while not self._stopping.is_set():
+            try:
+                busy = self.run_once()
+            except Exception:
+                logger.exception("Enrichment worker error")
+                busy = False
+            if not busy:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=1)
+
+    def start(self):
+        """Start the worker threads, unless they are already running."""
+        with self._connect_lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, daemon=True,
+                                          name=f"enrichment-{number}")
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        """Stop the worker threads after their current job."""
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def status(self):
+        """
+        Report the state of the queue.
+
+        Returns:
+            dict: The number of jobs per status, the titles being looked up
+            and the most recent failures.
+        """
+        with self._lock:
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            running = [row[0] for row in self._db.execute(
+                "SELECT DISTINCT title FROM jobs WHERE status = 'running'")]
+            failures = [
+                {"user_id": user_id, "movie_id": movie_id, "title": title,
+                 "attempts": attempts, "error": error}
+                for user_id, movie_id, title, attempts, error in self._db.execute(
+                    "SELECT user_id, movie_id, title, attempts, last_error FROM jobs "
+                    "WHERE status = 'failed' ORDER BY updated_at DESC LIMIT 20")]
+        return {"counts": counts, "running": running, "failures": failures,
+                "workers": len(self._threads)}
@@ -0,0 +1,239 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from flask import g, request
+
+# Upper bounds in seconds, from 50 microseconds (cache hits) to 10 seconds
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(labels):
+    """
+    Render label pairs in the Prometheus text format.
+
+    Args:
+        labels (tuple): (name, value) pairs.
+
+    Returns:
+        str: The labels in braces, or an empty string.
+    """
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Histogram:
+    """Counts observations into cumulative latency buckets."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize an empty Histogram.
+
+        Args:
+            buckets (tuple): The bucket upper bounds in ascending order.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Record one observation. Callers hold the registry lock.
+
+        Args:
+            value (float): The observed value.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """
+    Collects latency histograms and renders them for Prometheus.
+
+    Histograms are created on first use per metric name and label set.
+    Collectors are callables asked for current counter or gauge values at
+    render time, so other components only need to keep plain numbers.
+    """
+
+    def __init__(self):
+        """Initialize an empty MetricsRegistry."""
+        self._help = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        """
+        Set the help text of a metric.
+
+        Args:
+            name (str): The metric name.
+            help_text (str): What the metric measures.
+        """
+        self._help[name] = help_text
+
+    def observe(self, name, value, **labels):
+        """
+        Record an observation in a histogram.
+
+        Args:
+            name (str): The metric name.
+            value (float): The observed value, in seconds for latencies.
+            **labels: The label values.
+        """
+        key = (name, tuple(sorted((label, str(label_value))
+                                  for label, label_value in labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def add_collector(self, collector):
+        """
+        Register a source of counters and gauges.
+
+        Args:
+            collector (callable): Returns (name, type, help, samples) tuples,
+                where samples are (labels dict, value) pairs.
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        lines = []
+        with self._lock:
+            histograms = sorted(
+                (key, list(histogram.counts), histogram.sum, histogram.buckets)
+                for key, histogram in self._histograms.items())
+        current = None
+        for (name, labels), counts, total, buckets in histograms:
+            if name != current:
+                current = name
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{name}_bucket"
+                             f"{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        for collector in self._collectors:
+            for name, metric_type, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentedDataManager:
+    """
+    Wraps a data manager and times every call to its public methods.
+
+    Attribute access is forwarded to the wrapped data manager, so the
+    wrapper can be used wherever the data manager is.
+    """
+
+    def __init__(self, data_manager, registry):
+        """
+        Initialize the InstrumentedDataManager.
+
+        Args:
+            data_manager (DataManagerInterface): The data manager to wrap.
+            registry (MetricsRegistry): Where to record the latencies.
+        """
+        self.data_manager = data_manager
+        self.registry = registry
+        self._wrapped = {}
+        registry.describe("moviweb_data_manager_call_duration_seconds",
+                          "Latency of data manager method calls.")
+        registry.add_collector(self._collect_bytes)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.data_manager, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+        wrapped = self._wrapped.get(name)
+        if wrapped is None:
+            wrapped = self._wrapped[name] = self._timed(name, attribute)
+        return wrapped
+
+    def _timed(self, name, method):
+        """
+        Wrap a method so its latency is recorded.
+
+        Args:
+            name (str): The method name, used as the label.
+            method (callable): The bound method.
+
+        Returns:
+            callable: The wrapper.
+        """
+        observe = self.registry.observe
+
+        @wraps(method)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                observe("moviweb_data_manager_call_duration_seconds",
+                        time.perf_counter() - start, method=name)
+        return timed
+
+    def _collect_bytes(self):
+        """
+        Report the bytes the data manager read from and wrote to disk.
+
+        Returns:
+            list: The metrics, empty if the data manager doesn't count bytes.
+        """
+        if not hasattr(self.data_manager, "bytes_read"):
+            return []
+        return [
+            ("moviweb_data_manager_read_bytes_total", "counter",
+             "Bytes read from the data file.", [({}, self.data_manager.bytes_read)]),
+            ("moviweb_data_manager_written_bytes_total", "counter",
+             "Bytes written to the data file.", [({}, self.data_manager.bytes_written)]),
+        ]
+
+
+def instrument_app(app, registry):
+    """
+    Record the latency of every request by endpoint.
+
+    Args:
+        app (Flask): The application.
+        registry (MetricsRegistry): Where to record the latencies.
+    """
+    registry.describe("moviweb_http_request_duration_seconds",
+                      "Latency of HTTP requests by endpoint.")
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop("request_start", None)
+        if start is not None:
+            registry.observe("moviweb_http_request_duration_seconds",
+                             time.perf_counter() - start,
+                             endpoint=request.endpoint or "none",
+                             method=request.method,
+                             status=response.status_code)
+        return response
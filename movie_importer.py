@@ -0,0 +1,208 @@
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from data_manager.batch import check_movie_field
+
+
+def read_rows(filename):
+    """
+    Read the movies to import from a CSV or NDJSON file.
+
+    CSV files need a header with ``user``, ``title`` and ``rating`` columns;
+    NDJSON files (``.ndjson`` or ``.jsonl``) hold one object per line with
+    the same keys. ``user`` is a user ID or name.
+
+    Args:
+        filename (str): The file to read.
+
+    Yields:
+        tuple: The line number and the row as a dict, or for an NDJSON line
+            that isn't valid JSON, the ValueError raised by decoding it.
+    """
+    with open(filename, "r", newline="", encoding="utf-8") as file:
+        if filename.endswith((".ndjson", ".jsonl")):
+            for line_number, line in enumerate(file, start=1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except ValueError as err:
+                        yield line_number, ValueError(f"Invalid JSON: {err}")
+        else:
+            for line_number, row in enumerate(csv.DictReader(file), start=2):
+                yield line_number, row
+
+
+def movie_from_omdb(row, data):
+    """
+    Build the stored movie from an import row and its OMDb data.
+
+    Args:
+        row (dict): The import row.
+        data (dict): The OMDb response for the row's title.
+
+    Returns:
+        dict: The movie's name, director, year, rating and poster.
+
+    Raises:
+        ValueError: If OMDb didn't find the movie or the row is invalid.
+    """
+    if not isinstance(data, dict) or data.get("Response") == "False":
+        raise ValueError(f"Movie not found: {row['title']}")
+    return {
+        'name': data.get("Title", row['title']),
+        'director': data.get("Director", ""),
+        'year': int(data.get("Year", "0")[:4]),
+        'rating': check_movie_field('rating', row.get('rating')),
+        'poster': data.get("Poster", "")
+    }
+
+
+class MovieImporter:
+    """
+    Imports many user movies at once.
+
+    Rows are processed in batches. The distinct titles of a batch are looked
+    up on OMDb in a thread pool, the users of the batch that don't exist yet
+    are added with one write through ``apply``, and the movies are then
+    stored with another. A row that can't be imported is reported as a
+    failure of its line and the import goes on.
+    """
+
+    def __init__(self, data_manager, lookup, workers=8, batch_size=500):
+        """
+        Initialize the MovieImporter.
+
+        Args:
+            data_manager (DataManagerInterface): Where to store the movies.
+            lookup (callable): Returns the OMDb data for a title.
+            workers (int): The number of concurrent OMDb lookups.
+            batch_size (int): The number of rows stored per write.
+        """
+        self.data_manager = data_manager
+        self.lookup = lookup
+        self.workers = workers
+        self.batch_size = batch_size
+        self._user_ids = {}
+        self._lookups = {}
+
+    @staticmethod
+    def _check_row(row):
+        """
+        Check the shape of an import row.
+
+        Args:
+            row (object): The row as produced by read_rows.
+
+        Returns:
+            tuple: The row's user and title, stripped.
+
+        Raises:
+            ValueError: If the row isn't an object or lacks a user or title.
+        """
+        if isinstance(row, Exception):
+            raise row
+        if not isinstance(row, dict):
+            raise ValueError("The line is not an object")
+        user, title = row.get('user'), row.get('title')
+        if not isinstance(user, (str, int)) or not str(user).strip():
+            raise ValueError("Missing user")
+        if not isinstance(title, str) or not title.strip():
+            raise ValueError("Missing title")
+        return str(user).strip(), title.strip()
+
+    def _add_users(self, users):
+        """
+        Resolve user IDs or names, adding the users that don't exist yet
+        with one write.
+
+        Args:
+            users (iterable): The users' IDs or names.
+        """
+        new_users = []
+        for user in dict.fromkeys(users):
+            if user in self._user_ids:
+                continue
+            if user.isdigit() and self.data_manager.get_user_by_id(user):
+                self._user_ids[user] = user
+                continue
+            user_ids = self.data_manager.get_users_by_name(user)
+            if user_ids:
+                self._user_ids[user] = str(user_ids[0])
+            else:
+                new_users.append(user)
+        if new_users:
+            user_ids = self.data_manager.apply([{"op": "add_user", "name": user}
+                                                for user in new_users])
+            self._user_ids.update(zip(new_users, map(str, user_ids)))
+
+    def _lookup(self, title):
+        """
+        Look up a title, keeping the error instead of raising it.
+
+        Args:
+            title (str): The title of the movie.
+
+        Returns:
+            object: The OMDb data, or the exception raised by the lookup.
+        """
+        try:
+            return self.lookup(title)
+        except Exception as err:
+            return err
+
+    def _store(self, movies):
+        """
+        Store a batch of movies.
+
+        Args:
+            movies (list): (user_id, movie) pairs.
+        """
+        self.data_manager.apply([{"op": "add_movie", "user_id": user_id, "movie": movie}
+                                 for user_id, movie in movies])
+
+    def run(self, rows):
+        """
+        Import rows.
+
+        Args:
+            rows (iterable): (line number, row) pairs as produced by read_rows.
+
+        Returns:
+            dict: The number of rows read and imported, the failures as
+                (line number, message) pairs and the elapsed seconds.
+        """
+        start = time.perf_counter()
+        report = {"rows": 0, "imported": 0, "failures": []}
+        rows = iter(rows)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                report["rows"] += len(batch)
+                checked = []
+                for line_number, row in batch:
+                    try:
+                        checked.append((line_number, row, *self._check_row(row)))
+                    except ValueError as err:
+                        report["failures"].append((line_number, str(err)))
+                titles = {title for _, _, _, title in checked}
+                titles = [title for title in titles if title not in self._lookups]
+                for title, data in zip(titles, executor.map(self._lookup, titles)):
+                    self._lookups[title] = data
+                movies = []
+                for line_number, row, user, title in checked:
+                    try:
+                        data = self._lookups[title]
+                        if isinstance(data, Exception):
+                            raise data
+                        movies.append((user, movie_from_omdb({**row, 'title': title}, data)))
+                    except Exception as err:
+                        report["failures"].append((line_number, str(err)))
+                self._add_users(user for user, _ in movies)
+                self._store([(self._user_ids[user], movie) for user, movie in movies])
+                report["imported"] += len(movies)
+        report["seconds"] = time.perf_counter() - start
+        return report
@@ -0,0 +1,169 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Memory hits collected before their last_used times are written
+TOUCH_BATCH = 100
+
+
+class OMDbCache:
+    """
+    A persistent cache of OMDb responses keyed by movie title.
+
+    Responses are stored in a SQLite file so they survive restarts, with the
+    most recently used ones also kept in memory. Entries expire after ``ttl``
+    seconds, or ``negative_ttl`` seconds for "Movie not found!" answers, and
+    the least recently used ones are evicted beyond ``max_entries``. Hits
+    served from memory are written to the ``last_used`` column in batches,
+    at the latest before an eviction, so titles read often stay on disk.
+    """
+
+    def __init__(self, filename, ttl=7 * 24 * 3600, negative_ttl=600,
+                 max_entries=10000, memory_entries=1000, clock=time.time):
+        """
+        Initialize the OMDbCache and create its table if needed.
+
+        Args:
+            filename (str): The filename of the SQLite database.
+            ttl (float): Seconds a found movie stays cached.
+            negative_ttl (float): Seconds a not-found answer stays cached.
+            max_entries (int): The number of responses kept on disk.
+            memory_entries (int): The number of responses kept in memory.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.filename = filename
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        # Keys hit in memory and when, not yet written to last_used
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT, expires_at REAL, last_used REAL)")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses (last_used)")
+        self._db.commit()
+        self._entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def _key(title):
+        """
+        Normalize a title so different spellings share an entry.
+
+        Args:
+            title (str): The title of the movie.
+
+        Returns:
+            str: The cache key.
+        """
+        return " ".join(title.lower().split())
+
+    def get(self, title):
+        """
+        Look up the cached response for a title.
+
+        Args:
+            title (str): The title of the movie.
+
+        Returns:
+            dict: The cached response, or None if there is no fresh entry.
+        """
+        key = self._key(title)
+        now = self.clock()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self._db.execute(
+                    "SELECT response, expires_at FROM responses WHERE key = ?",
+                    (key,)).fetchone()
+                if row is not None:
+                    entry = (json.loads(row[0]), row[1])
+                    self._db.execute(
+                        "UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, entry)
+            else:
+                self._memory.move_to_end(key)
+                self._touched[key] = now
+                if len(self._touched) >= TOUCH_BATCH:
+                    self._write_touched()
+                    self._db.commit()
+            if entry is None or entry[1] <= now:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def set(self, title, response):
+        """
+        Cache the response for a title.
+
+        Args:
+            title (str): The title of the movie.
+            response (dict): The decoded OMDb response.
+        """
+        key = self._key(title)
+        now = self.clock()
+        found = response.get("Response") != "False"
+        entry = (response, now + (self.ttl if found else self.negative_ttl))
+        with self._lock:
+            exists = self._db.execute(
+                "SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, json.dumps(response), entry[1], now))
+            if exists is None:
+                self._entries += 1
+            if self._entries > self.max_entries:
+                self._write_touched()
+                evicted = [row[0] for row in self._db.execute(
+                    "SELECT key FROM responses ORDER BY last_used LIMIT ?",
+                    (self._entries - self.max_entries,))]
+                self._db.executemany(
+                    "DELETE FROM responses WHERE key = ?", [(old,) for old in evicted])
+                self._entries -= len(evicted)
+                for old in evicted:
+                    self._memory.pop(old, None)
+            self._db.commit()
+            self._remember(key, entry)
+
+    def _write_touched(self):
+        """Write the times of the hits served from memory to last_used."""
+        if self._touched:
+            self._db.executemany(
+                "UPDATE responses SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def _remember(self, key, entry):
+        """
+        Keep an entry in memory, evicting the least recently used one.
+
+        Args:
+            key (str): The cache key.
+            entry (tuple): The response and its expiry time.
+        """
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        """
+        Report how well the cache is doing.
+
+        Returns:
+            dict: The number of hits, misses and entries on disk.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": self._entries}
@@ -0,0 +1,220 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+OMDB_URL = "http://www.omdbapi.com/"
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling OMDb while it is considered unhealthy."""
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing service for a while.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast for ``reset_timeout`` seconds. Then a single trial call
+    is let through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        """
+        Initialize a closed CircuitBreaker.
+
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit.
+            reset_timeout (float): Seconds to fail fast before a trial call.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """str: "closed", "open" or "half-open"."""
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self):
+        """
+        Check whether a call may be made now.
+
+        Returns:
+            bool: False while the circuit is open or a trial call is running.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        """Close the circuit after a successful call."""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        """Count a failed call, opening the circuit at the threshold."""
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+
+class OMDbClient:
+    """
+    A client for the OMDb API that reuses connections and bounds every call.
+
+    Requests go through one shared session with a connection pool, carry
+    connect and read timeouts, are retried with jittered exponential backoff
+    on connection errors, timeouts and 429/5xx answers, and are refused by a
+    circuit breaker while OMDb keeps failing. Found and not-found answers
+    are stored in an optional OMDbCache.
+    """
+
+    def __init__(self, api_key, base_url=OMDB_URL, cache=None, connect_timeout=3.05,
+                 read_timeout=5, retries=2, backoff=0.2, max_backoff=2,
+                 pool_size=10, breaker=None, on_attempt=None):
+        """
+        Initialize the OMDbClient.
+
+        Args:
+            api_key (str): The OMDb API key.
+            base_url (str): The URL of the API, e.g. a local stub in tests.
+            cache (OMDbCache): Where to cache responses, or None.
+            connect_timeout (float): Seconds to wait for a connection.
+            read_timeout (float): Seconds to wait between bytes of a response.
+            retries (int): Attempts made after the first one fails.
+            backoff (float): Base delay in seconds before the first retry.
+            max_backoff (float): Upper bound of the delay between attempts.
+            pool_size (int): Connections kept open to OMDb.
+            breaker (CircuitBreaker): The circuit breaker, or a default one.
+            on_attempt (callable): Called with the seconds taken and the
+                outcome ("ok", an HTTP status code or an exception name) of
+                every HTTP attempt, e.g. to record metrics.
+        """
+        self.api_key = api_key
+        self.base_url = base_url
+        self.cache = cache
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.on_attempt = on_attempt
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _delay(self, attempt):
+        """
+        Compute the jittered backoff before a retry.
+
+        Args:
+            attempt (int): The number of attempts made so far.
+
+        Returns:
+            float: Seconds to sleep.
+        """
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+
+    def _record_attempt(self, start, outcome):
+        """
+        Report an HTTP attempt to the on_attempt callback.
+
+        Args:
+            start (float): The perf_counter() value when the attempt began.
+            outcome (object): "ok", the HTTP status code or the exception name.
+        """
+        if self.on_attempt is not None:
+            self.on_attempt(time.perf_counter() - start, outcome)
+
+    def _get(self, params):
+        """
+        Call the API, retrying transient failures.
+
+        Args:
+            params (dict): The query parameters besides the API key.
+
+        Returns:
+            dict: The decoded response.
+
+        Raises:
+            requests.exceptions.RequestException: If every attempt failed or
+                the circuit is open.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("OMDb is unavailable, not calling it for now")
+        params = {"apikey": self.api_key, **params}
+        attempt = 0
+        while True:
+            attempt += 1
+            start = time.perf_counter()
+            try:
+                response = self.session.get(self.base_url, params=params,
+                                            timeout=self.timeout)
+                self._record_attempt(start, "ok" if response.ok else response.status_code)
+                if response.status_code in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                break
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.HTTPError) as err:
+                if not isinstance(err, requests.exceptions.HTTPError):
+                    self._record_attempt(start, type(err).__name__)
+                if attempt > self.retries:
+                    self.breaker.record_failure()
+                    raise
+                time.sleep(self._delay(attempt))
+            except Exception as err:
+                # Not worth retrying (TooManyRedirects, InvalidURL, ...), but
+                # still a failure, which also ends a half-open trial
+                if isinstance(err, requests.exceptions.RequestException):
+                    self._record_attempt(start, type(err).__name__)
+                self.breaker.record_failure()
+                raise
+        self.breaker.record_success()
+        response.raise_for_status()  # Raises an HTTPError for other 4xx codes
+        return response.json()
+
+    def find_movie(self, title):
+        """
+        Retrieve movie info by title.
+
+        Args:
+            title (str): The title of the movie to search for.
+
+        Returns:
+            dict: The movie data retrieved from the API as a dictionary.
+
+        Raises:
+            requests.exceptions.RequestException: If OMDb could not be reached.
+        """
+        if self.cache is not None:
+            data = self.cache.get(title)
+            if data is not None:
+                return data
+        data = self._get({"t": title})
+        if self.cache is not None:
+            self.cache.set(title, data)
+        return data
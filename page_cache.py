@@ -0,0 +1,203 @@
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class PageCache:
+    """
+    A cache of rendered pages keyed by page name and data version.
+
+    Each page, such as "home" or "user-1", keeps only the HTML rendered for
+    its latest data version: storing a newer version replaces the older one,
+    and asking for a version that isn't stored is a miss. Pages keyed by a
+    user's version are therefore invalidated exactly when that user changes.
+
+    Pages are kept in memory up to ``max_chars`` characters of HTML,
+    evicting the least recently used ones. With a ``directory`` they are also written there,
+    so worker processes sharing the directory reuse each other's renders.
+    The directory keeps up to ``max_files`` pages, dropping the ones
+    written longest ago.
+    """
+
+    def __init__(self, max_chars=32 * 1024 * 1024, directory=None, max_files=1000):
+        """
+        Initialize an empty PageCache.
+
+        Args:
+            max_chars (int): The characters of HTML kept in memory.
+            directory (str): Where to share rendered pages between
+                processes, or None to keep them in memory only.
+            max_files (int): The pages kept in the directory.
+        """
+        self.max_chars = max_chars
+        self.directory = directory
+        self.max_files = max_files
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, page, version):
+        """
+        Name the file holding a page in the shared directory.
+
+        Args:
+            page (str): The page name.
+            version (int): The data version the page was rendered from.
+
+        Returns:
+            str: The path of the file.
+        """
+        digest = hashlib.sha256(page.encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}-{version}.html")
+
+    def get(self, page, version):
+        """
+        Look up a page rendered from a given data version.
+
+        Args:
+            page (str): The page name.
+            version (int): The current data version of the page.
+
+        Returns:
+            str: The rendered HTML, or None if it isn't cached.
+        """
+        with self._lock:
+            entry = self._memory.get(page)
+            if entry is not None and entry[0] == version:
+                self._memory.move_to_end(page)
+                self.hits += 1
+                return entry[1]
+        html = None
+        if self.directory is not None:
+            try:
+                with open(self._path(page, version), encoding="utf-8") as file:
+                    html = file.read()
+            except OSError:
+                pass
+        with self._lock:
+            if html is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._remember(page, version, html)
+        return html
+
+    def set(self, page, version, html):
+        """
+        Cache a rendered page, replacing the ones of older versions.
+
+        Args:
+            page (str): The page name.
+            version (int): The data version the page was rendered from.
+            html (str): The rendered HTML.
+        """
+        with self._lock:
+            self._remember(page, version, html)
+        if self.directory is None:
+            return
+        path = self._path(page, version)
+        try:
+            descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+                file.write(html)
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        self._remove_stale(path)
+        self._trim()
+
+    def _remove_stale(self, path):
+        """
+        Delete the shared files of other versions of the same page.
+
+        Args:
+            path (str): The file of the version to keep.
+        """
+        prefix = path.rsplit("-", 1)[0]
+        for stale in glob.glob(glob.escape(prefix) + "-*.html"):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def _trim(self):
+        """Delete the oldest shared files beyond ``max_files``."""
+        files = []
+        for path in glob.glob(os.path.join(glob.escape(self.directory), "*.html")):
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        files.sort()
+        for _, path in files[:max(len(files) - self.max_files, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _remember(self, page, version, html):
+        """
+        Keep a page in memory, evicting the least recently used ones.
+
+        Callers hold the lock.
+
+        Args:
+            page (str): The page name.
+            version (int): The data version the page was rendered from.
+            html (str): The rendered HTML.
+        """
+        old = self._memory.pop(page, None)
+        if old is not None:
+            self.size -= len(old[1])
+        if len(html) > self.max_chars:
+            return
+        self._memory[page] = (version, html)
+        self.size += len(html)
+        while self.size > self.max_chars:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self.size -= len(evicted)
+
+    def render(self, page, version, render):
+        """
+        Return a cached page, rendering and caching it on a miss.
+
+        Args:
+            page (str): The page name.
+            version (int): The current data version of the page.
+            render (callable): Renders the page's HTML.
+
+        Returns:
+            str: The rendered HTML.
+        """
+        html = self.get(page, version)
+        if html is None:
+            html = render()
+            self.set(page, version, html)
+        return html
+
+    def clear(self):
+        """Forget every cached page, in memory and in the shared directory."""
+        with self._lock:
+            self._memory.clear()
+            self.size = 0
+        if self.directory is not None:
+            for path in glob.glob(os.path.join(glob.escape(self.directory), "*.html")):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,320 @@
+import hashlib
+import io
+import ipaddress
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are optional, originals are served without Pillow
+    Image = None
+
+# Thumbnail widths in pixels by size name
+SIZES = {"small": 100, "card": 300}
+# The hosts OMDb poster URLs point to; no other URL is ever downloaded
+POSTER_HOSTS = ("m.media-amazon.com", "ia.media-imdb.com",
+                "images-na.ssl-images-amazon.com", "img.omdbapi.com")
+MAX_POSTER_BYTES = 5 * 1024 * 1024
+# Seconds before a failed download is tried again
+RETRY_AFTER = 3600
+
+
+def allowed_url(url):
+    """
+    Tell whether a poster URL points to one of the POSTER_HOSTS.
+
+    Args:
+        url (str): The poster URL.
+
+    Returns:
+        bool: True for http(s) URLs on an allowed host and default port.
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return False
+    return (parts.scheme in ("http", "https") and parts.hostname in POSTER_HOSTS
+            and port is None and not parts.username and not parts.password)
+
+
+def check_public_host(host):
+    """
+    Make sure a host only resolves to public addresses.
+
+    Args:
+        host (str): The host name.
+
+    Raises:
+        requests.exceptions.InvalidURL: If it resolves to a private,
+            loopback, link-local or otherwise reserved address.
+        requests.exceptions.ConnectionError: If it doesn't resolve.
+    """
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror as err:
+        raise requests.exceptions.ConnectionError(f"Can't resolve {host}: {err}") from None
+    for address in addresses:
+        if not ipaddress.ip_address(address.split("%")[0]).is_global:
+            raise requests.exceptions.InvalidURL(f"{host} resolves to {address}")
+
+
+def fetch_url(url, timeout=(3.05, 10), max_bytes=MAX_POSTER_BYTES):
+    """
+    Download a poster from one of the POSTER_HOSTS.
+
+    Redirects aren't followed and the body is read in chunks up to
+    ``max_bytes``, so a poster URL can't make the server fetch anything
+    but a bounded image from the allowed hosts.
+
+    Args:
+        url (str): The poster URL.
+        timeout (tuple): The connect and read timeouts in seconds.
+        max_bytes (int): The largest poster accepted.
+
+    Returns:
+        tuple: The content as bytes and its content type.
+
+    Raises:
+        requests.exceptions.RequestException: If the URL isn't allowed, the
+            download failed or the response isn't an image of at most
+            ``max_bytes``.
+    """
+    if not allowed_url(url):
+        raise requests.exceptions.InvalidURL(f"Not a poster host: {url}")
+    check_public_host(urlsplit(url).hostname)
+    with requests.get(url, timeout=timeout, stream=True, allow_redirects=False) as response:
+        response.raise_for_status()
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(
+                f"Unexpected status {response.status_code}", response=response)
+        content_type = response.headers.get("Content-Type", "image/jpeg")
+        if not content_type.startswith("image/"):
+            raise requests.exceptions.RequestException(f"Not an image: {content_type}")
+        if int(response.headers.get("Content-Length") or 0) > max_bytes:
+            raise requests.exceptions.RequestException("The poster is too large")
+        content = bytearray()
+        for chunk in response.iter_content(65536):
+            content += chunk
+            if len(content) > max_bytes:
+                raise requests.exceptions.RequestException("The poster is too large")
+    return bytes(content), content_type
+
+
+class PosterCache:
+    """
+    A content-addressed on-disk cache of poster images and their thumbnails.
+
+    Poster URLs on the POSTER_HOSTS are registered under a token, the hash
+    of the URL, which is all the /posters route accepts. Other URLs aren't
+    registered, and fetch_url checks the host again before downloading, so
+    stored movie data can't make the server fetch other addresses. The
+    first request for a token downloads the poster through the ``fetcher``
+    and stores it under the hash of its content, along with thumbnails in
+    every size of SIZES when Pillow is installed. A failed download is
+    remembered and only tried again after RETRY_AFTER seconds. Files are
+    written to a temporary name and renamed, so worker processes sharing
+    the directory never see partial files.
+    """
+
+    def __init__(self, directory, fetcher=fetch_url):
+        """
+        Initialize the PosterCache and create its directories.
+
+        Args:
+            directory (str): Where to store posters.
+            fetcher (callable): Downloads a URL, returning the content and
+                its content type. Tests can pass a local stub.
+        """
+        self.directory = os.path.abspath(directory)
+        self.fetcher = fetcher
+        self.fetches = 0
+        self._registered = set()
+        self._fetching = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.directory, "sources"), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, "objects"), exist_ok=True)
+
+    def _write(self, path, content):
+        """
+        Write a file atomically.
+
+        Args:
+            path (str): The file to write.
+            content (bytes): Its content.
+        """
+        descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(content)
+            os.replace(temp_path, path)
+        except OSError:
+            os.unlink(temp_path)
+            raise
+
+    def _source_path(self, token):
+        """
+        Name the file describing a registered URL.
+
+        Args:
+            token (str): The token of the URL.
+
+        Returns:
+            str: The path of the file.
+        """
+        return os.path.join(self.directory, "sources", token + ".json")
+
+    def object_path(self, digest, size=None):
+        """
+        Name the file holding a poster or one of its thumbnails.
+
+        Args:
+            digest (str): The hash of the original poster.
+            size (str): A key of SIZES, or None for the original.
+
+        Returns:
+            str: The path of the file.
+        """
+        name = digest if size is None else f"{digest}-{SIZES[size]}.jpg"
+        return os.path.join(self.directory, "objects", name)
+
+    def register(self, url):
+        """
+        Allow a poster URL to be served, and name its token.
+
+        Args:
+            url (str): The poster URL.
+
+        Returns:
+            str: The token to request the poster with, or None if the URL
+                isn't on one of the POSTER_HOSTS.
+        """
+        if not allowed_url(url):
+            return None
+        token = hashlib.sha256(url.encode()).hexdigest()[:32]
+        if token not in self._registered:
+            path = self._source_path(token)
+            if not os.path.exists(path):
+                self._write(path, json.dumps({"url": url}).encode())
+            self._registered.add(token)
+        return token
+
+    def _source(self, token):
+        """
+        Read what is known about a registered URL.
+
+        Args:
+            token (str): The token of the URL.
+
+        Returns:
+            dict: The URL and, once fetched, the digest and content type, or
+                None if the token isn't registered.
+        """
+        try:
+            with open(self._source_path(token), "rb") as file:
+                return json.loads(file.read())
+        except (OSError, ValueError):
+            return None
+
+    def _thumbnail(self, content, width):
+        """
+        Scale a poster down to a width.
+
+        Args:
+            content (bytes): The original image.
+            width (int): The width in pixels.
+
+        Returns:
+            bytes: The thumbnail as JPEG.
+        """
+        image = Image.open(io.BytesIO(content)).convert("RGB")
+        image.thumbnail((width, width * 4))
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=85, optimize=True)
+        return output.getvalue()
+
+    def _fetch(self, token, source):
+        """
+        Download a poster and store it with its thumbnails.
+
+        Args:
+            token (str): The token of the URL.
+            source (dict): The registered source.
+
+        Returns:
+            dict: The source with its digest and content type.
+
+        Raises:
+            requests.exceptions.RequestException: If the download failed,
+                which is recorded in the source.
+        """
+        self.fetches += 1
+        try:
+            content, content_type = self.fetcher(source["url"])
+        except requests.exceptions.RequestException as err:
+            self._write(self._source_path(token), json.dumps(
+                {"url": source["url"], "failed": time.time(), "error": str(err)}).encode())
+            raise
+        digest = hashlib.sha256(content).hexdigest()
+        if not os.path.exists(self.object_path(digest)):
+            self._write(self.object_path(digest), content)
+        thumbnails = []
+        if Image is not None:
+            for size, width in SIZES.items():
+                try:
+                    self._write(self.object_path(digest, size),
+                                self._thumbnail(content, width))
+                    thumbnails.append(size)
+                except (OSError, ValueError):
+                    # Not an image Pillow can read, the original is served
+                    break
+        source = {**source, "digest": digest, "type": content_type,
+                  "thumbnails": thumbnails}
+        self._write(self._source_path(token), json.dumps(source).encode())
+        return source
+
+    def get(self, token, size=None):
+        """
+        Locate a poster, downloading it on first use.
+
+        Concurrent requests for the same poster wait for one download.
+
+        Args:
+            token (str): The token of the URL.
+            size (str): A key of SIZES, or None for the original.
+
+        Returns:
+            tuple: The path, content type and digest of the file to serve,
+                or None if the token isn't registered.
+
+        Raises:
+            requests.exceptions.RequestException: If the download failed,
+                now or less than RETRY_AFTER seconds ago.
+        """
+        source = self._source(token)
+        if source is None:
+            return None
+        if "digest" not in source:
+            with self._lock:
+                lock = self._fetching.setdefault(token, threading.Lock())
+            try:
+                with lock:
+                    source = self._source(token)
+                    if "digest" not in source:
+                        if time.time() - source.get("failed", 0) < RETRY_AFTER:
+                            raise requests.exceptions.RequestException(
+                                f"The download failed recently: {source.get('error')}")
+                        source = self._fetch(token, source)
+            finally:
+                with self._lock:
+                    self._fetching.pop(token, None)
+        if size in source.get("thumbnails", ()):
+            return (self.object_path(source["digest"], size), "image/jpeg",
+                    f"{source['digest']}-{SIZES[size]}")
+        return self.object_path(source["digest"]), source["type"], source["digest"]
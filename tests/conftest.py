@@ -0,0 +1,80 @@
+import importlib
+import sys
+import pytest
+from benchmarks.backends import BACKENDS
+from benchmarks.generate import generate_users, write_json
+
+# The backends that keep their views up to date between writes
+CACHED_BACKENDS = ["json-cached", "json-journaled", "json-normalized", "json-compact",
+                   "snapshot", "shared-snapshot", "sharded", "csv-cached"]
+
+
+def open_backend(backend, directory, users):
+    """
+    Write a fixture for a backend and open a data manager on it.
+
+    Args:
+        backend (str): A key of BACKENDS.
+        directory (pathlib.Path): Where to write the fixture.
+        users (dict): The users in the users.json layout.
+
+    Returns:
+        tuple: The data manager and the filename of its fixture.
+    """
+    suffix, write_fixture, factory = BACKENDS[backend]
+    filename = str(directory / (backend + suffix))
+    write_fixture(users, filename)
+    return factory(filename), filename
+
+
+def user_movies(data_manager, user_id):
+    """
+    Read a user's movies the same way from every backend.
+
+    Args:
+        data_manager (DataManagerInterface): The data manager.
+        user_id (str): The ID of the user.
+
+    Returns:
+        dict: The movies by ID, each with its name, director, year, rating
+            and poster.
+    """
+    movies = data_manager.get_user_movies(user_id)
+    if isinstance(movies, list):
+        movies = {str(movie["id"]): movie for movie in movies}
+    return {str(movie_id): {field: movie[field]
+                            for field in ("name", "director", "year", "rating", "poster")}
+            for movie_id, movie in movies.items()}
+
+
+def all_movies(data_manager):
+    """
+    Read every user's movies.
+
+    Args:
+        data_manager (DataManagerInterface): The data manager.
+
+    Returns:
+        dict: The movies by user ID, see user_movies.
+    """
+    users = data_manager.get_all_users()
+    user_ids = [str(user["id"]) for user in users] if isinstance(users, list) else list(users)
+    return {user_id: user_movies(data_manager, user_id) for user_id in user_ids}
+
+
+@pytest.fixture
+def users():
+    return generate_users(40, 8, seed=1)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """A test client of the app, working on a users.json in tmp_path."""
+    write_json(generate_users(20, 6, seed=2), str(tmp_path / "users.json"))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("SHARED_SNAPSHOT", raising=False)
+    sys.modules.pop("app", None)
+    app = importlib.import_module("app")
+    yield app.app.test_client()
+    app.enrichment.stop()
+    sys.modules.pop("app", None)
@@ -0,0 +1,88 @@
+import sys
+import pytest
+
+
+def test_rejected_batch_changes_nothing(client, tmp_path):
+    before = (tmp_path / "users.json").read_bytes()
+    response = client.post("/batch", json={"operations": [
+        {"op": "add_movie", "user_id": "1", "movie": {
+            "name": "Heat", "director": "Michael Mann", "year": 1995,
+            "rating": 8.3, "poster": "N/A"}},
+        {"op": "update_movie", "user_id": "1", "movie_id": "1", "movie": {"rating": "abc"}},
+    ]})
+    assert response.status_code == 400
+    assert (tmp_path / "users.json").read_bytes() == before
+    assert client.get("/stats/top_rated").status_code == 200
+    assert client.get("/?sort=rating").status_code == 200
+
+
+def test_batch_results_show_up_on_the_pages(client):
+    response = client.post("/batch", json={"operations": [
+        {"op": "add_user", "name": "Batch Viewer"},
+        {"op": "add_movie", "user_id": "1", "movie": {
+            "name": "Heat", "director": "Michael Mann", "year": "1995",
+            "rating": "8.3", "poster": "N/A"}},
+    ]})
+    assert response.status_code == 200
+    assert response.get_json()["results"][0] == "21"
+    assert b"Batch Viewer" in client.get("/users").data
+    assert b"Heat" in client.get("/users/1?director=Michael+Mann").data
+    assert b"Heat" in client.get("/?director=Michael+Mann").data
+
+
+def test_invalid_page_arguments_are_rejected(client):
+    assert client.get("/?cursor=garbage").status_code == 400
+    assert client.get("/?sort=popularity").status_code == 400
+    assert client.get("/users/1?year_min=soon").status_code == 400
+    # A forged cursor whose first key isn't a number
+    assert client.get("/?sort=rating&cursor=WyJyYXRpbmciLG51bGwsMSwyXQ==").status_code == 400
+    assert client.get("/users/1?cursor=WyJyYXRpbmciLG51bGwsMSwyXQ==").status_code == 400
+
+
+def test_unknown_query_arguments_share_a_cached_page(client):
+    app = sys.modules["app"]
+    client.get("/?director=Greta+Gerwig")
+    pages = len(app.page_cache._memory)
+    response = client.get("/?director=Greta+Gerwig&utm_source=mail&junk=1")
+    assert len(app.page_cache._memory) == pages
+    assert b"junk" not in response.data
+    # The same values spelled differently are the same page
+    client.get("/users/1?year_min=1990")
+    pages = len(app.page_cache._memory)
+    client.get("/users/1?year_min=01990&sort=rating&x=1")
+    assert len(app.page_cache._memory) == pages
+
+
+@pytest.mark.parametrize("path", ["/", "/users", "/users/1", "/?sort=name"])
+def test_unchanged_pages_answer_304(client, path):
+    response = client.get(path)
+    assert response.status_code in (200, 201)
+    etag, last_modified = response.headers["ETag"], response.headers["Last-Modified"]
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    revalidated = client.get(path, headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304 and revalidated.data == b""
+    assert revalidated.headers["ETag"] == etag
+    assert client.get(path, headers={"If-Modified-Since": last_modified}).status_code == 304
+    # If-None-Match wins over a matching If-Modified-Since
+    assert client.get(path, headers={"If-None-Match": '"other"',
+                                     "If-Modified-Since": last_modified}).status_code != 304
+
+
+def test_a_change_gives_new_validators(client):
+    etag = client.get("/users/1").headers["ETag"]
+    other_etag = client.get("/users/2").headers["ETag"]
+    client.post("/batch", json={"operations": [{"op": "add_movie", "user_id": "1", "movie": {
+        "name": "Heat", "director": "Michael Mann", "year": 1995, "rating": 8.3,
+        "poster": "N/A"}}]})
+    response = client.get("/users/1", headers={"If-None-Match": etag})
+    assert response.status_code == 201 and b"Heat" in response.data
+    assert response.headers["ETag"] != etag
+    # Other users' pages keep their version
+    assert client.get("/users/2", headers={"If-None-Match": other_etag}).status_code == 304
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_pages_of_a_list_have_their_own_validators(client):
+    first = client.get("/?sort=year").headers["ETag"]
+    assert client.get("/?sort=name", headers={"If-None-Match": first}).status_code == 200
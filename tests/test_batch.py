@@ -0,0 +1,110 @@
+import os
+import pytest
+from benchmarks.backends import BACKENDS
+from data_manager.batch import check_operations
+from conftest import all_movies, open_backend
+
+ALL_BACKENDS = list(BACKENDS)
+MOVIE = {"name": "Parasite", "director": "Bong Joon Ho", "year": 2019,
+         "rating": 8.6, "poster": "poster"}
+
+
+def file_contents(filename):
+    """
+    Read a fixture, which is a directory for the sharded backend.
+
+    Args:
+        filename (str): The fixture file or directory.
+
+    Returns:
+        dict: The bytes of every file by name.
+    """
+    if not os.path.isdir(filename):
+        filename, names = os.path.dirname(filename), [os.path.basename(filename)]
+        names += [name for name in os.listdir(filename) if name.startswith(names[0] + ".")]
+    else:
+        names = os.listdir(filename)
+    contents = {}
+    for name in sorted(names):
+        path = os.path.join(filename, name)
+        if os.path.isfile(path) and not name.endswith((".lock", "-shm")):
+            with open(path, "rb") as file:
+                contents[name] = file.read()
+    return contents
+
+
+@pytest.mark.parametrize("backend", ALL_BACKENDS)
+def test_apply_runs_every_operation(backend, tmp_path, users):
+    data_manager, filename = open_backend(backend, tmp_path, users)
+    movie_id = next(iter(users["2"]["movies"]))
+    results = data_manager.apply([
+        {"op": "add_user", "name": "Batch User"},
+        {"op": "add_movie", "user_id": "1", "movie": MOVIE},
+        {"op": "add_movie", "user_id": "1", "movie": {**MOVIE, "name": "Mother"}},
+        {"op": "update_movie", "user_id": "2", "movie_id": movie_id,
+         "movie": {"rating": "9.5", "year": "1999"}},
+        {"op": "delete_movie", "user_id": "3", "movie_id": next(iter(users["3"]["movies"]))},
+    ])
+    assert results[0] == str(len(users) + 1)
+    assert results[1] != results[2]
+    movies = all_movies(BACKENDS[backend][2](filename))
+    assert movies[results[0]] == {}
+    assert movies["1"][results[1]] == MOVIE
+    assert movies["1"][results[2]]["name"] == "Mother"
+    assert movies["2"][movie_id]["rating"] == 9.5
+    assert movies["2"][movie_id]["year"] == 1999
+    assert len(movies["3"]) == len(users["3"]["movies"]) - 1
+
+
+@pytest.mark.parametrize("backend", ALL_BACKENDS)
+@pytest.mark.parametrize("bad_operation", [
+    {"op": "update_movie", "user_id": "1", "movie_id": "999", "movie": {"rating": 5}},
+    {"op": "delete_movie", "user_id": "999", "movie_id": "1"},
+    {"op": "add_movie", "user_id": "1", "movie": {**MOVIE, "rating": "abc"}},
+    {"op": "add_movie", "user_id": "1", "movie": {**MOVIE, "year": 2019.5}},
+    {"op": "add_movie", "user_id": "1", "movie": {"name": "Incomplete"}},
+    {"op": "rename_user", "user_id": "1"},
+], ids=["missing-movie", "missing-user", "bad-rating", "bad-year", "incomplete", "unknown-op"])
+def test_apply_is_all_or_nothing(backend, bad_operation, tmp_path, users):
+    data_manager, filename = open_backend(backend, tmp_path, users)
+    data_manager.get_top_rated_movies(5)
+    before = file_contents(filename)
+    with pytest.raises(ValueError):
+        data_manager.apply([
+            {"op": "add_user", "name": "Never Added"},
+            {"op": "add_movie", "user_id": "1", "movie": MOVIE},
+            bad_operation,
+        ])
+    assert file_contents(filename) == before
+    assert all_movies(data_manager) == all_movies(BACKENDS[backend][2](filename))
+    assert not data_manager.get_users_by_name("Never Added")
+    # Nothing half-applied can break the views later
+    data_manager.get_top_rated_movies(5)
+    data_manager.query_movies({"min_rating": 5}, "rating")
+
+
+def test_check_operations_converts_movie_fields():
+    checked = check_operations([
+        {"op": "add_movie", "user_id": 1,
+         "movie": {**MOVIE, "year": " 2019 ", "rating": "8.6"}},
+        {"op": "update_movie", "user_id": "1", "movie_id": 2, "movie": {"year": 2001.0}},
+    ])
+    assert checked[0] == {"op": "add_movie", "user_id": "1", "movie": MOVIE}
+    assert checked[1] == {"op": "update_movie", "user_id": "1", "movie_id": "2",
+                          "movie": {"year": 2001}}
+
+
+@pytest.mark.parametrize("operations", [
+    "not a list",
+    ["not an object"],
+    [{"op": "add_user", "name": "  "}],
+    [{"op": "add_movie", "movie": MOVIE}],
+    [{"op": "update_movie", "user_id": "1", "movie": {"rating": 5}}],
+    [{"op": "update_movie", "user_id": "1", "movie_id": "1", "movie": {"rating": True}}],
+    [{"op": "update_movie", "user_id": "1", "movie_id": "1", "movie": {"rating": "nan"}}],
+    [{"op": "update_movie", "user_id": "1", "movie_id": "1", "movie": {"name": 5}}],
+    [{"op": "update_movie", "user_id": "1", "movie_id": "1", "movie": {"genre": "Drama"}}],
+])
+def test_check_operations_rejects_malformed_batches(operations):
+    with pytest.raises(ValueError):
+        check_operations(operations)
@@ -0,0 +1,100 @@
+import multiprocessing
+import threading
+import pytest
+from benchmarks.backends import BACKENDS
+from conftest import all_movies, open_backend
+
+WRITER_BACKENDS = ["json-cached", "json-journaled", "json-normalized", "snapshot",
+                   "shared-snapshot", "sharded", "csv-cached", "sqlite"]
+PROCESSES = 3
+THREADS = 3
+MOVIES = 10
+
+
+def add_movies(backend, filename, writer):
+    """
+    Add MOVIES movies from each of THREADS threads sharing one data manager.
+
+    Runs in its own process, so several processes write the file at once.
+
+    Args:
+        backend (str): A key of BACKENDS.
+        filename (str): The fixture file.
+        writer (int): The number of the process, to name its movies.
+    """
+    data_manager = BACKENDS[backend][2](filename)
+
+    def add(thread):
+        for number in range(MOVIES):
+            user_id = str(1 + (writer + thread + number) % 4)
+            data_manager.add_user_movie(user_id, f"Movie {writer}-{thread}-{number}",
+                                        "Greta Gerwig", 2000, 7.0, "poster")
+
+    threads = [threading.Thread(target=add, args=(thread,)) for thread in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def read_movies(backend, filename, stop):
+    """
+    Read the data over and over until told to stop.
+
+    Args:
+        backend (str): A key of BACKENDS.
+        filename (str): The fixture file.
+        stop (multiprocessing.Event): Set when the writers are done.
+    """
+    data_manager = BACKENDS[backend][2](filename)
+    while not stop.is_set():
+        data_manager.get_all_users()
+        data_manager.get_user_movies("1")
+
+
+@pytest.mark.parametrize("backend", WRITER_BACKENDS)
+def test_concurrent_writers_lose_no_update(backend, tmp_path, users):
+    _, filename = open_backend(backend, tmp_path, users)
+    before = sum(len(movies) for movies in all_movies(BACKENDS[backend][2](filename)).values())
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    readers = [context.Process(target=read_movies, args=(backend, filename, stop))
+               for _ in range(2)]
+    writers = [context.Process(target=add_movies, args=(backend, filename, writer))
+               for writer in range(PROCESSES)]
+    for process in readers + writers:
+        process.start()
+    for process in writers:
+        process.join(timeout=120)
+    stop.set()
+    for process in readers:
+        process.join(timeout=30)
+    assert all(process.exitcode == 0 for process in readers + writers)
+
+    movies = all_movies(BACKENDS[backend][2](filename))
+    names = [movie["name"] for user in movies.values() for movie in user.values()]
+    assert len(names) == before + PROCESSES * THREADS * MOVIES
+    for writer in range(PROCESSES):
+        for thread in range(THREADS):
+            for number in range(MOVIES):
+                assert f"Movie {writer}-{thread}-{number}" in names
+
+
+@pytest.mark.parametrize("backend", ["json-cached", "json-journaled", "csv-cached"])
+def test_concurrent_threads_get_distinct_movie_ids(backend, tmp_path, users):
+    data_manager, _ = open_backend(backend, tmp_path, users)
+    results = []
+
+    def add(thread):
+        for number in range(MOVIES):
+            results.append(data_manager.add_user_movies(
+                "1", [{"name": f"Movie {thread}-{number}", "director": "Bong Joon Ho",
+                       "year": 2019, "rating": 8.6, "poster": "poster"}])[0])
+
+    threads = [threading.Thread(target=add, args=(thread,)) for thread in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(results)) == THREADS * MOVIES
+    assert set(results) <= set(all_movies(data_manager)["1"])
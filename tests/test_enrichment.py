@@ -0,0 +1,142 @@
+import requests
+from enrichment import PLACEHOLDER_POSTER, EnrichmentQueue
+from conftest import open_backend, user_movies
+
+FOUND = {"Title": "Heat", "Poster": "https://m.media-amazon.com/heat.jpg", "Response": "True"}
+
+
+def make_queue(tmp_path, users, lookup, backend="json-cached", **kwargs):
+    """Open a queue with a fake clock on a data manager holding users."""
+    data_manager, _ = open_backend(backend, tmp_path, users)
+    now = [1000.0]
+    queue = EnrichmentQueue(str(tmp_path / "enrichment.sqlite"), data_manager, lookup,
+                            clock=lambda: now[0], **kwargs)
+    return queue, data_manager, now
+
+
+def add_placeholder_movie(data_manager, user_id, title):
+    """Save a movie like the app does before its lookup, and return its ID."""
+    before = set(user_movies(data_manager, user_id))
+    data_manager.add_user_movie(user_id, title, "Michael Mann", 1995, 8.3, PLACEHOLDER_POSTER)
+    return (set(user_movies(data_manager, user_id)) - before).pop()
+
+
+def test_the_poster_is_patched_in(tmp_path, users):
+    queue, data_manager, _ = make_queue(tmp_path, users, lambda title: FOUND)
+    movie_id = add_placeholder_movie(data_manager, "1", "Heat")
+    queue.enqueue("1", movie_id, "Heat")
+    assert queue.run_once()
+    assert user_movies(data_manager, "1")[movie_id]["poster"] == FOUND["Poster"]
+    assert queue.status()["counts"] == {"done": 1}
+    assert not queue.run_once()
+
+
+def test_one_lookup_per_title_for_every_user(tmp_path, users):
+    titles = []
+    queue, data_manager, _ = make_queue(tmp_path, users,
+                                        lambda title: titles.append(title) or FOUND)
+    movie_ids = {}
+    for user_id, title in (("1", "Heat"), ("2", " heat"), ("3", "HEAT ")):
+        movie_ids[user_id] = add_placeholder_movie(data_manager, user_id, title)
+        queue.enqueue(user_id, movie_ids[user_id], title)
+    assert queue.run_once()
+    assert len(titles) == 1
+    for user_id, movie_id in movie_ids.items():
+        assert user_movies(data_manager, user_id)[movie_id]["poster"] == FOUND["Poster"]
+
+
+def test_movies_changed_meanwhile_are_left_alone(tmp_path, users):
+    queue, data_manager, _ = make_queue(tmp_path, users, lambda title: FOUND)
+    renamed = add_placeholder_movie(data_manager, "1", "Heat")
+    data_manager.update_user_movie("1", renamed, {"name": "Collateral"})
+    deleted = add_placeholder_movie(data_manager, "2", "Heat")
+    data_manager.delete_user_movie("2", deleted)
+    queue.enqueue("1", renamed, "Heat")
+    queue.enqueue("2", deleted, "Heat")
+    queue.run_once()
+    assert user_movies(data_manager, "1")[renamed]["poster"] == PLACEHOLDER_POSTER
+    assert deleted not in user_movies(data_manager, "2")
+    assert queue.status()["counts"] == {"done": 2}
+
+
+def test_not_found_titles_keep_the_placeholder(tmp_path, users):
+    queue, data_manager, _ = make_queue(
+        tmp_path, users, lambda title: {"Response": "False", "Error": "Movie not found!"})
+    movie_id = add_placeholder_movie(data_manager, "1", "Unknown")
+    queue.enqueue("1", movie_id, "Unknown")
+    queue.run_once()
+    assert user_movies(data_manager, "1")[movie_id]["poster"] == PLACEHOLDER_POSTER
+    assert queue.status()["counts"] == {"not_found": 1}
+
+
+def test_failed_lookups_back_off_then_fail(tmp_path, users):
+    def unreachable(title):
+        raise requests.exceptions.ConnectionError("OMDb is down")
+
+    queue, data_manager, now = make_queue(tmp_path, users, unreachable,
+                                          max_attempts=3, backoff=5)
+    movie_id = add_placeholder_movie(data_manager, "1", "Heat")
+    queue.enqueue("1", movie_id, "Heat")
+    assert queue.run_once()
+    # Retried after 5 seconds, then after 10 more
+    assert not queue.run_once()
+    now[0] += 5
+    assert queue.run_once()
+    now[0] += 9
+    assert not queue.run_once()
+    now[0] += 1
+    assert queue.run_once()
+    status = queue.status()
+    assert status["counts"] == {"failed": 1}
+    assert status["failures"] == [{"user_id": "1", "movie_id": movie_id, "title": "Heat",
+                                   "attempts": 3,
+                                   "error": "ConnectionError: OMDb is down"}]
+
+
+def test_an_expired_lease_is_taken_over(tmp_path, users):
+    queue, data_manager, now = make_queue(tmp_path, users, lambda title: FOUND, lease=60)
+    movie_id = add_placeholder_movie(data_manager, "1", "Heat")
+    queue.enqueue("1", movie_id, "Heat")
+    # A worker claims the job and dies
+    assert queue._claim()
+    assert not queue.run_once()
+    now[0] += 60
+    assert queue.run_once()
+    assert user_movies(data_manager, "1")[movie_id]["poster"] == FOUND["Poster"]
+
+
+def test_jobs_survive_a_restart(tmp_path, users):
+    queue, data_manager, _ = make_queue(tmp_path, users, lambda title: FOUND)
+    movie_id = add_placeholder_movie(data_manager, "1", "Heat")
+    queue.enqueue("1", movie_id, "Heat")
+    restarted = EnrichmentQueue(queue.filename, data_manager, lambda title: FOUND,
+                                clock=queue.clock)
+    assert restarted.status()["counts"] == {"pending": 1}
+    assert restarted.run_once()
+    assert user_movies(data_manager, "1")[movie_id]["poster"] == FOUND["Poster"]
+
+
+def test_old_finished_jobs_are_forgotten(tmp_path, users):
+    queue, data_manager, now = make_queue(tmp_path, users, lambda title: FOUND, keep=100)
+    for title in ("Heat", "Ran"):
+        queue.enqueue("1", add_placeholder_movie(data_manager, "1", title), title)
+        queue.run_once()
+        now[0] += 101
+    assert queue.status()["counts"] == {"done": 1}
+
+
+def test_workers_process_the_queue(tmp_path, users):
+    queue, data_manager, _ = make_queue(tmp_path, users, lambda title: FOUND, backend="csv-cached")
+    movie_id = add_placeholder_movie(data_manager, "1", "Heat")
+    queue.start()
+    try:
+        queue.enqueue("1", movie_id, "Heat")
+        for _ in range(200):
+            if queue.status()["counts"] == {"done": 1}:
+                break
+            queue._stopping.wait(0.01)
+        assert queue.status()["workers"] == 2
+    finally:
+        queue.stop()
+    assert queue.status()["counts"] == {"done": 1}
+    assert user_movies(data_manager, "1")[movie_id]["poster"] == FOUND["Poster"]
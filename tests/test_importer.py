@@ -0,0 +1,86 @@
+import sys
+import threading
+import requests
+from movie_importer import MovieImporter, read_rows
+from conftest import open_backend, user_movies
+
+OMDB = {
+    "heat": {"Title": "Heat", "Director": "Michael Mann", "Year": "1995",
+             "Poster": "https://m.media-amazon.com/heat.jpg", "Response": "True"},
+    "ran": {"Title": "Ran", "Director": "Akira Kurosawa", "Year": "1985–",
+            "Poster": "N/A", "Response": "True"},
+}
+
+
+def lookup(title):
+    """Answer like OMDb, failing for titles containing "timeout"."""
+    if "timeout" in title:
+        raise requests.exceptions.Timeout("OMDb took too long")
+    return OMDB.get(title.lower(), {"Response": "False", "Error": "Movie not found!"})
+
+
+def test_rows_are_read_from_csv_and_ndjson(tmp_path):
+    csv_file = tmp_path / "movies.csv"
+    csv_file.write_text("user,title,rating\n1,Heat,8\nAna,Ran,9\n", encoding="utf-8")
+    assert list(read_rows(str(csv_file))) == [
+        (2, {"user": "1", "title": "Heat", "rating": "8"}),
+        (3, {"user": "Ana", "title": "Ran", "rating": "9"})]
+    ndjson_file = tmp_path / "movies.ndjson"
+    ndjson_file.write_text('{"user": 1, "title": "Heat", "rating": 8}\n\n{oops\n',
+                           encoding="utf-8")
+    rows = list(read_rows(str(ndjson_file)))
+    assert rows[0] == (1, {"user": 1, "title": "Heat", "rating": 8})
+    assert rows[1][0] == 3 and isinstance(rows[1][1], ValueError)
+
+
+def test_an_import_adds_movies_and_users_and_reports_failures(tmp_path, users):
+    data_manager, _ = open_backend("json-cached", tmp_path, users)
+    titles = []
+    lock = threading.Lock()
+
+    def counting_lookup(title):
+        with lock:
+            titles.append(title)
+        return lookup(title)
+
+    rows = [
+        (1, {"user": "1", "title": "Heat", "rating": "8.5"}),
+        (2, {"user": "New Viewer", "title": " Ran ", "rating": 9}),
+        (3, {"user": "New Viewer", "title": "Heat", "rating": 7}),
+        (4, {"user": "1", "title": "Unknown Movie", "rating": 5}),
+        (5, {"user": "1", "title": "Heat", "rating": "great"}),
+        (6, {"user": "1", "title": "timeout", "rating": 5}),
+        (7, {"user": "", "title": "Heat", "rating": 5}),
+        (8, ["not", "an", "object"]),
+    ]
+    report = MovieImporter(data_manager, counting_lookup, workers=4, batch_size=3).run(rows)
+    assert report["rows"] == 8 and report["imported"] == 3
+    assert [line for line, _ in sorted(report["failures"])] == [4, 5, 6, 7, 8]
+    assert "Movie not found: Unknown Movie" in dict(report["failures"])[4]
+    # Each title is looked up once, across batches too
+    assert sorted(titles) == ["Heat", "Ran", "Unknown Movie", "timeout"]
+
+    heat = [movie for movie in user_movies(data_manager, "1").values()
+            if movie["name"] == "Heat"]
+    assert heat == [{"name": "Heat", "director": "Michael Mann", "year": 1995,
+                     "rating": 8.5, "poster": OMDB["heat"]["Poster"]}]
+    new_user = data_manager.get_users_by_name("New Viewer")
+    assert len(new_user) == 1
+    new_movies = user_movies(data_manager, str(new_user[0]))
+    assert sorted((movie["name"], movie["year"]) for movie in new_movies.values()) == [
+        ("Heat", 1995), ("Ran", 1985)]
+
+
+def test_the_command_imports_a_file(client, tmp_path, monkeypatch):
+    app = sys.modules["app"]
+    monkeypatch.setattr(app.omdb_client, "find_movie", lookup)
+    movies = tmp_path / "movies.csv"
+    movies.write_text("user,title,rating\n1,Heat,8\n2,Nothing Like It,7\n3,Ran,9\n",
+                      encoding="utf-8")
+    result = app.app.test_cli_runner().invoke(args=["import-movies", str(movies),
+                                                    "--workers", "2", "--batch-size", "2"])
+    assert result.exit_code == 0
+    assert "Line 3: Movie not found: Nothing Like It" in result.stderr
+    assert "Imported 2 of 3 rows" in result.stdout and "1 failed." in result.stdout
+    assert b"Heat" in client.get("/users/1").data
+    assert b"Ran" in client.get("/users/3").data
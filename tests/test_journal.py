@@ -0,0 +1,138 @@
+import json
+import os
+from benchmarks.generate import write_json
+from data_manager.journaled_json_data_manager import JournaledJSONDataManager
+from conftest import all_movies, user_movies
+
+
+def open_journal(tmp_path, users, **kwargs):
+    filename = str(tmp_path / "users.json")
+    write_json(users, filename)
+    return JournaledJSONDataManager(filename, background=False, **kwargs), filename
+
+
+def read_log(filename):
+    with open(filename + ".log", "rb") as file:
+        return file.read()
+
+
+def log_lines(filename):
+    return read_log(filename).split(b"\n")
+
+
+def test_writes_survive_a_restart(tmp_path, users):
+    data_manager, filename = open_journal(tmp_path, users)
+    data_manager.add_user_movie("1", "Heat", "Michael Mann", 1995, 8.3, "poster")
+    data_manager.update_user_movie("2", next(iter(users["2"]["movies"])), {"rating": 1.0})
+    data_manager.add_user("Journal User")
+    assert os.path.getsize(filename + ".log") > 0
+    # A new process replays the log on top of the unchanged snapshot
+    assert all_movies(JournaledJSONDataManager(filename)) == all_movies(data_manager)
+
+
+def test_compaction_folds_the_log_into_the_snapshot(tmp_path, users):
+    data_manager, filename = open_journal(tmp_path, users, compact_threshold=3)
+    for number in range(7):
+        data_manager.add_user_movie("1", f"Movie {number}", "Agnes Varda", 1962, 8.0, "poster")
+    data_manager.compact()
+    with open(filename) as file:
+        snapshot = json.load(file)
+    assert len(snapshot["1"]["movies"]) == len(users["1"]["movies"]) + 7
+    assert not os.path.exists(filename + ".log.compacting")
+    assert all_movies(JournaledJSONDataManager(filename)) == all_movies(data_manager)
+
+
+def test_readers_skip_an_unfinished_line_without_cutting_it(tmp_path, users):
+    data_manager, filename = open_journal(tmp_path, users)
+    data_manager.add_user_movie("1", "Heat", "Michael Mann", 1995, 8.3, "poster")
+    complete = read_log(filename)
+    writer = JournaledJSONDataManager(filename)
+    writer.add_user_movie("1", "Ran", "Akira Kurosawa", 1985, 8.2, "poster")
+    appended = read_log(filename)[len(complete):]
+    # Another process is halfway through appending its line
+    with open(filename + ".log", "wb") as file:
+        file.write(complete + appended[:len(appended) // 2])
+
+    reader = JournaledJSONDataManager(filename)
+    names = [movie["name"] for movie in user_movies(reader, "1").values()]
+    assert "Heat" in names and "Ran" not in names
+    assert read_log(filename) == complete + appended[:len(appended) // 2]
+
+    # The append completes and the next read sees it
+    with open(filename + ".log", "ab") as file:
+        file.write(appended[len(appended) // 2:])
+    names = [movie["name"] for movie in user_movies(reader, "1").values()]
+    assert "Ran" in names
+
+
+def test_the_next_write_cuts_a_line_torn_by_a_crash(tmp_path, users):
+    data_manager, filename = open_journal(tmp_path, users)
+    data_manager.add_user_movie("1", "Heat", "Michael Mann", 1995, 8.3, "poster")
+    with open(filename + ".log", "ab") as file:
+        file.write(b'[{"op": "add_movie", "user_id": "1", "movie_id"')
+
+    restarted = JournaledJSONDataManager(filename)
+    restarted.add_user_movie("1", "Ran", "Akira Kurosawa", 1985, 8.2, "poster")
+    lines = log_lines(filename)
+    assert lines[-1] == b""
+    assert [json.loads(line) for line in lines[:-1]]
+    assert len(lines) == 3
+    names = [movie["name"] for movie in user_movies(JournaledJSONDataManager(filename), "1").values()]
+    assert "Heat" in names and "Ran" in names
+
+
+def test_a_load_racing_a_compaction_reads_again(tmp_path, users):
+    data_manager, filename = open_journal(tmp_path, users)
+    for number in range(3):
+        data_manager.add_user_movie("1", f"Movie {number}", "Agnes Varda", 1962, 8.0, "poster")
+    os.replace(filename + ".log", filename + ".log.compacting")
+    folded = data_manager._latest()
+    reader = JournaledJSONDataManager(filename)
+    replay = reader._replay
+    compactions = []
+
+    def compact_after_the_snapshot(users, path):
+        # The compaction finishes between reading the snapshot and the log
+        if path.endswith(".compacting") and os.path.exists(path):
+            compactions.append(data_manager.compact())
+        return replay(users, path)
+
+    reader._replay = compact_after_the_snapshot
+    reader._users = None
+    assert reader._latest() == folded
+    assert compactions == [True]
+    assert not os.path.exists(filename + ".log.compacting")
+
+
+def test_a_compaction_finished_by_save_db_is_dropped(tmp_path, users):
+    data_manager, filename = open_journal(tmp_path, users)
+    data_manager.add_user_movie("1", "Heat", "Michael Mann", 1995, 8.3, "poster")
+    stale = data_manager._latest()
+    os.replace(filename + ".log", filename + ".log.compacting")
+    rotated = data_manager._inode(filename + ".log.compacting")
+    data_manager.add_user_movie("1", "Ran", "Akira Kurosawa", 1985, 8.2, "poster")
+    data_manager.save_db(data_manager._latest())
+
+    # The background thread gets to move its snapshot into place only now
+    data_manager._finish_compaction(stale, rotated)
+    names = [movie["name"] for movie in user_movies(JournaledJSONDataManager(filename), "1").values()]
+    assert "Heat" in names and "Ran" in names
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_the_snapshot_is_replaced_under_the_file_lock(tmp_path, users, monkeypatch):
+    data_manager, filename = open_journal(tmp_path, users)
+    data_manager.add_user_movie("1", "Heat", "Michael Mann", 1995, 8.3, "poster")
+    held = []
+    replace = os.replace
+
+    def record_replace(source, destination):
+        if destination == filename:
+            held.append(data_manager._coordinator.file_lock._depth > 0)
+        replace(source, destination)
+
+    monkeypatch.setattr(os, "replace", record_replace)
+    data_manager.compact(wait=False)
+    data_manager._compaction.join()
+    assert held == [True]
+    assert not os.path.exists(filename + ".log.compacting")
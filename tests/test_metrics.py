@@ -0,0 +1,65 @@
+from metrics import InstrumentedDataManager, MetricsRegistry
+from conftest import open_backend
+
+
+def samples(text):
+    """Parse the Prometheus text format into {series: value}."""
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+            for line in text.splitlines() if line and not line.startswith("#")}
+
+
+def test_histograms_are_cumulative():
+    registry = MetricsRegistry()
+    registry.describe("latency_seconds", "How long it took.")
+    for value in (0.003, 0.02, 7):
+        registry.observe("latency_seconds", value, route="home")
+    text = registry.render()
+    assert "# HELP latency_seconds How long it took.\n# TYPE latency_seconds histogram" in text
+    values = samples(text)
+    assert values['latency_seconds_bucket{route="home",le="0.0025"}'] == 0
+    assert values['latency_seconds_bucket{route="home",le="0.005"}'] == 1
+    assert values['latency_seconds_bucket{route="home",le="0.025"}'] == 2
+    assert values['latency_seconds_bucket{route="home",le="+Inf"}'] == 3
+    assert values['latency_seconds_count{route="home"}'] == 3
+    assert abs(values['latency_seconds_sum{route="home"}'] - 7.023) < 1e-9
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.observe("latency_seconds", 1, title='say "hi"\\\n')
+    assert 'title="say \\"hi\\"\\\\\\n"' in registry.render()
+
+
+def test_collectors_add_counters_and_gauges():
+    registry = MetricsRegistry()
+    registry.add_collector(lambda: [("jobs", "gauge", "Queued jobs.",
+                                     [({"status": "queued"}, 4), ({"status": "failed"}, 1)])])
+    values = samples(registry.render())
+    assert values == {'jobs{status="queued"}': 4, 'jobs{status="failed"}': 1}
+
+
+def test_data_manager_calls_are_timed(tmp_path, users):
+    registry = MetricsRegistry()
+    data_manager = InstrumentedDataManager(open_backend("json-cached", tmp_path, users)[0],
+                                           registry)
+    data_manager.get_user_movies("1")
+    data_manager.get_user_movies("2")
+    values = samples(registry.render())
+    assert values['moviweb_data_manager_call_duration_seconds_count'
+                  '{method="get_user_movies"}'] == 2
+    assert values["moviweb_data_manager_read_bytes_total"] > 0
+
+
+def test_the_endpoint_reports_requests_by_route(client):
+    client.get("/users")
+    client.get("/users")
+    client.get("/users/1")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    values = samples(response.get_data(as_text=True))
+    assert values['moviweb_http_request_duration_seconds_count'
+                  '{endpoint="list_users",method="GET",status="200"}'] == 2
+    assert values['moviweb_http_request_duration_seconds_count'
+                  '{endpoint="user_movies",method="GET",status="201"}'] == 1
+    assert "moviweb_page_cache_lookups_total{result=\"miss\"}" in values
@@ -0,0 +1,66 @@
+from omdb_cache import OMDbCache
+
+FOUND = {"Title": "Heat", "Response": "True"}
+NOT_FOUND = {"Response": "False", "Error": "Movie not found!"}
+
+
+def make_cache(tmp_path, **kwargs):
+    now = [1000.0]
+    cache = OMDbCache(str(tmp_path / "omdb.sqlite"), clock=lambda: now[0], **kwargs)
+    return cache, now
+
+
+def test_titles_are_normalized(tmp_path):
+    cache, _ = make_cache(tmp_path)
+    cache.set("Heat", FOUND)
+    assert cache.get("  HEAT ") == FOUND
+    assert cache.get("Heat 2") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+def test_found_and_not_found_answers_expire_separately(tmp_path):
+    cache, now = make_cache(tmp_path, ttl=100, negative_ttl=10)
+    cache.set("Heat", FOUND)
+    cache.set("Unknown", NOT_FOUND)
+    now[0] += 10
+    assert cache.get("Unknown") is None
+    assert cache.get("Heat") == FOUND
+    now[0] += 90
+    assert cache.get("Heat") is None
+
+
+def test_entries_survive_a_restart(tmp_path):
+    cache, now = make_cache(tmp_path, ttl=100)
+    cache.set("Heat", FOUND)
+    restarted = OMDbCache(str(tmp_path / "omdb.sqlite"), clock=lambda: now[0])
+    assert restarted.get("Heat") == FOUND
+    assert restarted.stats()["entries"] == 1
+
+
+def test_the_least_recently_used_titles_are_evicted(tmp_path):
+    cache, now = make_cache(tmp_path, max_entries=3, memory_entries=2)
+    for title in ("A", "B", "C"):
+        cache.set(title, {**FOUND, "Title": title})
+        now[0] += 1
+    # A is read from memory or disk, so B is now the least recently used
+    assert cache.get("A")["Title"] == "A"
+    now[0] += 1
+    cache.set("D", {**FOUND, "Title": "D"})
+    assert cache.stats()["entries"] == 3
+    assert cache.get("B") is None
+    assert [cache.get(title)["Title"] for title in ("A", "C", "D")] == ["A", "C", "D"]
+
+
+def test_memory_hits_count_for_eviction(tmp_path):
+    cache, now = make_cache(tmp_path, max_entries=2)
+    cache.set("A", FOUND)
+    now[0] += 1
+    cache.set("B", FOUND)
+    now[0] += 1
+    # Served from memory, written to disk in a batch before the eviction
+    assert cache.get("A") == FOUND
+    now[0] += 1
+    cache.set("C", FOUND)
+    fresh = OMDbCache(str(tmp_path / "omdb.sqlite"), clock=lambda: now[0])
+    assert fresh.get("A") == FOUND
+    assert fresh.get("B") is None
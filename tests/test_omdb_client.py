@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+import requests
+from omdb_cache import OMDbCache
+from omdb_client import CircuitBreaker, CircuitOpenError, OMDbClient
+
+MOVIE = {"Title": "Heat", "Director": "Michael Mann", "Year": "1995",
+         "imdbRating": "8.3", "Response": "True"}
+
+
+class StubOMDb(ThreadingHTTPServer):
+    """A local OMDb answering from a list of (status, body, delay) answers."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.answers = []
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(parse_qs(urlparse(self.path).query))
+        status, body, delay = (self.server.answers.pop(0) if self.server.answers
+                               else (200, MOVIE, 0))
+        time.sleep(delay)
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except OSError:
+            # The client gave up waiting
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def omdb():
+    server = StubOMDb()
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(omdb, **kwargs):
+    outcomes = []
+    client = OMDbClient("key", base_url=omdb.url, backoff=0.01, max_backoff=0.01,
+                        on_attempt=lambda seconds, outcome: outcomes.append(outcome),
+                        **kwargs)
+    return client, outcomes
+
+
+def test_finds_a_movie_by_title(omdb):
+    client, outcomes = make_client(omdb)
+    assert client.find_movie("Heat") == MOVIE
+    assert omdb.requests == [{"apikey": ["key"], "t": ["Heat"]}]
+    assert outcomes == ["ok"]
+
+
+def test_transient_failures_are_retried(omdb):
+    omdb.answers = [(503, {}, 0), (429, {}, 0)]
+    client, outcomes = make_client(omdb)
+    assert client.find_movie("Heat") == MOVIE
+    assert outcomes == [503, 429, "ok"]
+    assert client.breaker.state == "closed"
+
+
+def test_gives_up_after_the_retries(omdb):
+    omdb.answers = [(500, {}, 0)] * 3
+    client, outcomes = make_client(omdb, retries=2)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.find_movie("Heat")
+    assert outcomes == [500, 500, 500]
+    assert client.breaker.failures == 1
+
+
+def test_a_slow_answer_times_out_and_is_retried(omdb):
+    omdb.answers = [(200, MOVIE, 0.5)]
+    client, outcomes = make_client(omdb, read_timeout=0.2)
+    assert client.find_movie("Heat") == MOVIE
+    assert outcomes == ["ReadTimeout", "ok"]
+
+
+def test_other_client_errors_are_not_retried(omdb):
+    omdb.answers = [(401, {"Error": "Invalid API key!"}, 0)]
+    client, outcomes = make_client(omdb)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.find_movie("Heat")
+    assert outcomes == [401]
+
+
+def test_the_circuit_opens_and_a_trial_closes_it(omdb):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+    omdb.answers = [(503, {}, 0)] * 2
+    client, _ = make_client(omdb, retries=0, breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.HTTPError):
+            client.find_movie("Heat")
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        client.find_movie("Heat")
+    assert len(omdb.requests) == 2
+
+    now[0] = 31
+    assert breaker.state == "half-open"
+    assert client.find_movie("Heat") == MOVIE
+    assert breaker.state == "closed"
+
+
+def test_a_failed_trial_opens_the_circuit_again():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 10
+    assert breaker.allow()
+    # Only one trial call at a time
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    now[0] = 19
+    assert not breaker.allow()
+    now[0] = 20
+    assert breaker.allow()
+
+
+def test_cached_titles_are_not_requested_again(omdb, tmp_path):
+    client, _ = make_client(omdb, cache=OMDbCache(str(tmp_path / "omdb.sqlite")))
+    assert client.find_movie("Heat") == MOVIE
+    assert client.find_movie("  heat ") == MOVIE
+    assert len(omdb.requests) == 1
@@ -0,0 +1,60 @@
+import os
+from page_cache import PageCache
+
+
+def test_a_page_is_only_served_for_its_version():
+    cache = PageCache()
+    cache.set("home", 1, "<p>one</p>")
+    assert cache.get("home", 1) == "<p>one</p>"
+    assert cache.get("home", 2) is None
+    cache.set("home", 2, "<p>two</p>")
+    assert cache.get("home", 1) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_memory_evicts_the_least_recently_used_pages():
+    cache = PageCache(max_chars=10)
+    cache.set("a", 1, "aaaa")
+    cache.set("b", 1, "bbbb")
+    cache.get("a", 1)
+    cache.set("c", 1, "cccc")
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == "aaaa" and cache.get("c", 1) == "cccc"
+    assert cache.size == 8
+    cache.set("huge", 1, "x" * 11)
+    assert cache.get("huge", 1) is None
+
+
+def test_processes_share_pages_through_the_directory(tmp_path):
+    writer = PageCache(directory=str(tmp_path))
+    reader = PageCache(directory=str(tmp_path))
+    writer.set("user-1", 3, "<p>three</p>")
+    assert reader.get("user-1", 3) == "<p>three</p>"
+    writer.set("user-1", 4, "<p>four</p>")
+    assert reader.get("user-1", 4) == "<p>four</p>"
+    assert PageCache(directory=str(tmp_path)).get("user-1", 3) is None
+    assert len(os.listdir(tmp_path)) == 1
+    writer.clear()
+    assert os.listdir(tmp_path) == []
+
+
+def test_the_directory_keeps_at_most_max_files(tmp_path):
+    cache = PageCache(directory=str(tmp_path), max_files=3)
+    for number in range(5):
+        cache.set(f"page-{number}", 1, f"<p>{number}</p>")
+        os.utime(cache._path(f"page-{number}", 1), ns=(number * 10**9, number * 10**9))
+    assert len(os.listdir(tmp_path)) == 3
+    assert PageCache(directory=str(tmp_path)).get("page-0", 1) is None
+    assert PageCache(directory=str(tmp_path)).get("page-4", 1) == "<p>4</p>"
+
+
+def test_a_failed_write_leaves_no_temporary_file(tmp_path, monkeypatch):
+    cache = PageCache(directory=str(tmp_path))
+
+    def fail(source, destination):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    cache.set("home", 1, "<p>one</p>")
+    assert os.listdir(tmp_path) == []
+    assert cache.get("home", 1) == "<p>one</p>"
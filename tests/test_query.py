@@ -0,0 +1,142 @@
+import base64
+import json
+import pytest
+from benchmarks.generate import generate_users
+from data_manager.query import SORTS, encode_cursor
+from conftest import all_movies, open_backend
+
+QUERY_BACKENDS = ["json", "json-cached", "shared-snapshot", "sharded", "csv-cached", "sqlite"]
+FILTERS = [
+    {},
+    {"user_id": "3"},
+    {"director": "Greta Gerwig"},
+    {"year_min": 1970, "year_max": 2000},
+    {"min_rating": 7.5},
+    {"distinct": True},
+    {"distinct": True, "min_rating": 5},
+]
+
+
+@pytest.fixture
+def many_users():
+    return generate_users(60, 12, distinct_movies=40, seed=5)
+
+
+def read_pages(data_manager, movie_filter, sort, limit):
+    """
+    Follow the cursors through every page of a query.
+
+    Returns:
+        list: The (user ID, movie ID) of every movie, in order.
+    """
+    refs = []
+    cursor = None
+    while True:
+        page = data_manager.query_movies(movie_filter, sort, limit, cursor)
+        assert len(page["movies"]) <= limit
+        refs += [(movie["user_id"], movie["movie_id"]) for movie in page["movies"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return refs
+        assert len(page["movies"]) == limit
+
+
+def expected_order(movies, movie_filter, sort):
+    """
+    Filter and sort every user movie by brute force, except for distinct.
+
+    Returns:
+        list: The (user ID, movie ID) of the matching movies, in order.
+    """
+    entries = []
+    for user_id, user in movies.items():
+        if "user_id" in movie_filter and user_id != movie_filter["user_id"]:
+            continue
+        for movie_id, movie in user.items():
+            if ("director" in movie_filter and movie["director"] != movie_filter["director"]
+                    or movie["rating"] < movie_filter.get("min_rating", 0)
+                    or movie["year"] < movie_filter.get("year_min", 0)
+                    or movie["year"] > movie_filter.get("year_max", 9999)):
+                continue
+            first = {"rating": -movie["rating"], "year": -movie["year"],
+                     "name": movie["name"]}[sort]
+            entries.append(((first, int(user_id), int(movie_id)), (user_id, movie_id)))
+    return [ref for _, ref in sorted(entries)]
+
+
+@pytest.mark.parametrize("backend", QUERY_BACKENDS)
+@pytest.mark.parametrize("sort", SORTS)
+@pytest.mark.parametrize("movie_filter", FILTERS, ids=str)
+def test_pages_cover_every_movie_once_in_order(backend, sort, movie_filter, tmp_path,
+                                               many_users):
+    data_manager, _ = open_backend(backend, tmp_path, many_users)
+    refs = read_pages(data_manager, movie_filter, sort, 7)
+    assert len(refs) == len(set(refs))
+    if movie_filter.get("distinct"):
+        movies = all_movies(data_manager)
+        keys = [(movies[user_id][movie_id]["name"], movies[user_id][movie_id]["director"],
+                 movies[user_id][movie_id]["year"]) for user_id, movie_id in refs]
+        assert len(keys) == len(set(keys))
+        expected = expected_order(movies, movie_filter, sort)
+        assert set(refs) <= set(expected)
+        assert refs == [ref for ref in expected if ref in set(refs)]
+    else:
+        assert refs == expected_order(all_movies(data_manager), movie_filter, sort)
+
+
+@pytest.mark.parametrize("backend", QUERY_BACKENDS)
+def test_distinct_pages_match_the_movie_list(backend, tmp_path, many_users):
+    data_manager, _ = open_backend(backend, tmp_path, many_users)
+    movies = all_movies(data_manager)
+    refs = read_pages(data_manager, {"distinct": True}, "name", 10)
+    listed = {(movie["name"], movie["director"], movie["year"])
+              for movie in data_manager.create_movie_list()}
+    assert {(movies[user_id][movie_id]["name"], movies[user_id][movie_id]["director"],
+             movies[user_id][movie_id]["year"]) for user_id, movie_id in refs} == listed
+
+
+@pytest.mark.parametrize("backend", QUERY_BACKENDS)
+def test_cursors_hold_their_place_across_writes(backend, tmp_path, many_users):
+    data_manager, _ = open_backend(backend, tmp_path, many_users)
+    before = expected_order(all_movies(data_manager), {}, "rating")
+    first = data_manager.query_movies(None, "rating", 10)
+    # Movies added before and after the cursor don't shift the later pages
+    data_manager.add_user_movie("1", "Top Movie", "Jordan Peele", 2017, 10.0, "poster")
+    data_manager.add_user_movie("1", "Bottom Movie", "Jordan Peele", 2017, 0.5, "poster")
+    rest = []
+    cursor = first["next_cursor"]
+    while cursor:
+        page = data_manager.query_movies(None, "rating", 10, cursor)
+        rest += [(movie["user_id"], movie["movie_id"]) for movie in page["movies"]]
+        cursor = page["next_cursor"]
+    refs = [(movie["user_id"], movie["movie_id"]) for movie in first["movies"]] + rest
+    assert refs[:-1] == before
+    assert all_movies(data_manager)["1"][refs[-1][1]]["name"] == "Bottom Movie"
+
+
+def forged_cursor(*parts):
+    return base64.urlsafe_b64encode(json.dumps(list(parts)).encode()).decode()
+
+
+@pytest.mark.parametrize("backend", ["json-cached", "sqlite"])
+@pytest.mark.parametrize("arguments", [
+    {"sort": "popularity"},
+    {"limit": 0},
+    {"filter": {"genre": "Drama"}},
+    {"filter": {"year_min": "last year"}},
+    {"cursor": "not a cursor"},
+    {"cursor": encode_cursor("year", (-2000, 1, 1))},
+    {"sort": "name", "cursor": encode_cursor("rating", (-9.0, 1, 1))},
+    {"cursor": forged_cursor("rating", None, 1, 2)},
+    {"cursor": forged_cursor("rating", [1], 1, 2)},
+    {"cursor": forged_cursor("rating", True, 1, 2)},
+    {"cursor": "WyJyYXRpbmciLCBJbmZpbml0eSwgMSwgMl0="},
+    {"sort": "year", "cursor": forged_cursor("year", {"a": 1}, 1, 2)},
+    {"sort": "name", "cursor": forged_cursor("name", 5, 1, 2)},
+    {"cursor": forged_cursor("rating", -9.0, True, 2)},
+    {"cursor": forged_cursor("rating", -9.0, 1, "2")},
+], ids=str)
+def test_invalid_queries_are_rejected(backend, arguments, tmp_path, many_users):
+    data_manager, _ = open_backend(backend, tmp_path, many_users)
+    with pytest.raises(ValueError):
+        data_manager.query_movies(**arguments)
@@ -0,0 +1,109 @@
+import sqlite3
+import pytest
+from data_manager.search import SearchIndex, edit_distance
+from conftest import open_backend
+
+SEARCH_BACKENDS = ["json", "json-cached", "csv-cached", "sqlite"]
+USERS = {
+    "1": {"name": "Ana", "movies": {
+        "1": {"name": "The Dark Knight", "director": "Christopher Nolan", "year": 2008,
+              "rating": 9.0, "poster": "poster"},
+        "2": {"name": "Interstellar", "director": "Christopher Nolan", "year": 2014,
+              "rating": 8.6, "poster": "poster"},
+        "3": {"name": "Nolan Street", "director": "Jane Doe", "year": 1999,
+              "rating": 5.0, "poster": "poster"},
+    }},
+    "2": {"name": "Ben", "movies": {
+        "1": {"name": "Interstellar", "director": "Christopher Nolan", "year": 2014,
+              "rating": 8.0, "poster": "poster"},
+        "2": {"name": "Amélie", "director": "Jean-Pierre Jeunet", "year": 2001,
+              "rating": 8.3, "poster": "poster"},
+    }},
+}
+
+
+def names(result):
+    return [movie["name"] for movie in result["results"]]
+
+
+@pytest.mark.parametrize("backend", SEARCH_BACKENDS)
+def test_matches_in_the_name_rank_first_then_by_users(backend, tmp_path):
+    data_manager, _ = open_backend(backend, tmp_path, USERS)
+    result = data_manager.search_movies("nolan")
+    assert result["total"] == 3
+    assert names(result) == ["Nolan Street", "Interstellar", "The Dark Knight"]
+    assert [movie["users"] for movie in result["results"]] == [1, 2, 1]
+
+
+@pytest.mark.parametrize("backend", SEARCH_BACKENDS)
+@pytest.mark.parametrize("query, expected", [
+    ("interstelar", ["Interstellar"]),
+    ("dark knihgt", ["The Dark Knight"]),
+    ("inter", ["Interstellar"]),
+    ("amelie", ["Amélie"]),
+    ("jeunet amel", ["Amélie"]),
+    ("nolan knight", ["The Dark Knight"]),
+    ("xyz", []),
+])
+def test_typos_prefixes_and_accents_match(backend, query, expected, tmp_path):
+    data_manager, _ = open_backend(backend, tmp_path, USERS)
+    assert names(data_manager.search_movies(query)) == expected
+
+
+@pytest.mark.parametrize("backend", SEARCH_BACKENDS)
+def test_results_are_paged(backend, tmp_path):
+    data_manager, _ = open_backend(backend, tmp_path, USERS)
+    pages = [data_manager.search_movies("nolan", page, 2) for page in (1, 2, 3)]
+    assert [names(page) for page in pages] == [
+        ["Nolan Street", "Interstellar"], ["The Dark Knight"], []]
+
+
+def test_edit_distance_counts_swaps_once():
+    assert edit_distance("knihgt", "knight", 2) == 1
+    assert edit_distance("kitten", "sittin", 2) == 2
+    assert edit_distance("abc", "xyzabc", 2) == 3
+
+
+def sqlite_index(data_manager):
+    index = SearchIndex()
+    for user_id, user in data_manager.get_all_users().items():
+        for movie_id, movie in user["movies"].items():
+            index.add_movie(user_id, movie_id, movie)
+    return index.dump()
+
+
+def test_sqlite_updates_its_index_with_the_changed_movies(tmp_path, users):
+    data_manager, filename = open_backend("sqlite", tmp_path, users)
+    data_manager.search_movies("nolan")
+    built = data_manager._search_index
+    writer = type(data_manager)(filename)
+    writer.add_user_movie("1", "Tenet", "Christopher Nolan", 2020, 7.3, "poster")
+    writer.update_user_movie("2", next(iter(users["2"]["movies"])), {"name": "Memento"})
+    writer.delete_user_movie("3", next(iter(users["3"]["movies"])))
+    writer.apply([{"op": "add_movie", "user_id": "4", "movie": {
+        "name": "Tenet", "director": "Christopher Nolan", "year": 2020,
+        "rating": 7.0, "poster": "poster"}}])
+
+    result = data_manager.search_movies("tenet")
+    assert data_manager._search_index is built
+    assert names(result) == ["Tenet"] and result["results"][0]["users"] == 2
+    assert names(data_manager.search_movies("memento")) == ["Memento"]
+    assert data_manager._search_index.dump() == sqlite_index(data_manager)
+
+
+def test_sqlite_builds_its_index_again_when_changes_were_trimmed(tmp_path, users):
+    data_manager, filename = open_backend("sqlite", tmp_path, users)
+    data_manager.search_movies("nolan")
+    built = data_manager._search_index
+    data_manager.add_user_movie("1", "Tenet", "Christopher Nolan", 2020, 7.3, "poster")
+    data_manager.add_user_movie("1", "Memento", "Christopher Nolan", 2000, 8.4, "poster")
+    connection = sqlite3.connect(filename)
+    with connection:
+        # The change that added Tenet is older than the changes kept
+        connection.execute("DELETE FROM movie_changes WHERE seq <= ?",
+                           (data_manager._search_seq + 1,))
+    connection.close()
+
+    assert names(data_manager.search_movies("tenet")) == ["Tenet"]
+    assert data_manager._search_index is not built
+    assert data_manager._search_index.dump() == sqlite_index(data_manager)
@@ -0,0 +1,52 @@
+import os
+import threading
+import pytest
+from data_manager.snapshot import Snapshot, encode_user, write_snapshot
+from conftest import open_backend
+
+
+def records(users):
+    return [(user_id, encode_user(user)) for user_id, user in users.items()]
+
+
+def test_concurrent_writes_each_publish_a_whole_snapshot(tmp_path, users):
+    filename = str(tmp_path / "users.snapshot")
+    errors = []
+
+    def write():
+        try:
+            for _ in range(20):
+                write_snapshot(filename, records(users))
+        except OSError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=write) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert dict(Snapshot(filename)) == users
+    assert os.listdir(tmp_path) == ["users.snapshot"]
+
+
+def test_a_failed_write_keeps_the_old_snapshot(tmp_path, users):
+    filename = str(tmp_path / "users.snapshot")
+    write_snapshot(filename, records(users))
+
+    def broken_records():
+        yield "1", encode_user(users["1"])
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        write_snapshot(filename, broken_records())
+    assert dict(Snapshot(filename)) == users
+    assert os.listdir(tmp_path) == ["users.snapshot"]
+
+
+def test_the_catalog_is_published_without_leftovers(tmp_path, users):
+    data_manager, filename = open_backend("shared-snapshot", tmp_path, users)
+    data_manager.create_movie_list()
+    data_manager.add_user_movie("1", "Heat", "Michael Mann", 1995, 8.3, "poster")
+    assert "Heat" in [movie["name"] for movie in data_manager.create_movie_list()]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
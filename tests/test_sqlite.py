@@ -0,0 +1,66 @@
+import sqlite3
+import subprocess
+import sys
+import pytest
+from benchmarks.backends import BACKENDS
+from benchmarks.generate import write_json
+from data_manager.sqlite_data_manager import SQLiteDataManager
+from conftest import all_movies, open_backend
+
+
+@pytest.mark.parametrize("backend", list(BACKENDS))
+@pytest.mark.parametrize("n", [0, -1, -100])
+def test_no_top_rated_movies_for_a_count_below_one(backend, n, tmp_path, users):
+    data_manager, _ = open_backend(backend, tmp_path, users)
+    assert data_manager.get_top_rated_movies(n) == []
+
+
+def test_top_rated_movies_match_the_json_backend(tmp_path, users):
+    sqlite_manager, _ = open_backend("sqlite", tmp_path, users)
+    json_manager, _ = open_backend("json", tmp_path, users)
+    top = sqlite_manager.get_top_rated_movies(10)
+    assert len(top) == 10
+    assert [movie["rating"] for movie in top] == [
+        movie["rating"] for movie in json_manager.get_top_rated_movies(10)]
+
+
+def test_import_keeps_user_and_movie_ids(tmp_path, users):
+    json_filename = str(tmp_path / "users.json")
+    write_json(users, json_filename)
+    data_manager = SQLiteDataManager(str(tmp_path / "movies.sqlite"))
+    user_count, movie_count = data_manager.import_json(json_filename)
+    assert user_count == len(users)
+    assert movie_count == sum(len(user["movies"]) for user in users.values())
+    assert data_manager.get_all_users() == users
+    assert data_manager.get_data_version() > 0
+    assert data_manager.get_user_version("1") == data_manager.get_data_version()
+
+
+def test_the_import_command_reports_its_counts(tmp_path, users):
+    json_filename = str(tmp_path / "users.json")
+    write_json(users, json_filename)
+    sqlite_filename = str(tmp_path / "movies.sqlite")
+    output = subprocess.run(
+        [sys.executable, "-m", "data_manager.sqlite_data_manager", json_filename,
+         sqlite_filename], capture_output=True, text=True, check=True).stdout
+    movie_count = sum(len(user["movies"]) for user in users.values())
+    assert output.strip() == f"Imported {len(users)} users and {movie_count} movies."
+    assert all_movies(SQLiteDataManager(sqlite_filename)) == {
+        user_id: user["movies"] for user_id, user in users.items()}
+
+
+def test_an_older_database_gets_the_version_column(tmp_path):
+    filename = str(tmp_path / "old.sqlite")
+    connection = sqlite3.connect(filename)
+    with connection:
+        connection.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name VARCHAR)")
+        connection.execute("INSERT INTO users (id, name) VALUES (1, 'Ana')")
+    connection.close()
+
+    data_manager = SQLiteDataManager(filename)
+    assert data_manager.get_user_version("1") == 0
+    data_manager.add_user_movie("1", "Heat", "Michael Mann", 1995, 8.3, "poster")
+    assert data_manager.get_user_version("1") == data_manager.get_data_version() > 0
+    assert [movie["name"] for movie in data_manager.get_user_movies("1").values()] == ["Heat"]
+    # Opening it again doesn't add the column twice
+    assert SQLiteDataManager(filename).get_user_by_id("1")["name"] == "Ana"
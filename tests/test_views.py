@@ -0,0 +1,72 @@
+import random
+import pytest
+from benchmarks.generate import generate_users
+from conftest import CACHED_BACKENDS, all_movies, open_backend, user_movies
+
+
+def use_views(data_manager):
+    """Build every view, so the writes that follow have to maintain them."""
+    data_manager.create_movie_list()
+    data_manager.query_movies({"distinct": True})
+    data_manager.get_top_rated_movies(5)
+    data_manager.get_movie_count_per_year()
+    data_manager.search_movies("Night")
+    data_manager.get_users_by_name("Omar 1")
+    data_manager.get_users_with_movie("1")
+
+
+@pytest.mark.parametrize("backend", CACHED_BACKENDS)
+def test_views_match_a_rebuild_after_mutations(backend, tmp_path, users):
+    data_manager, _ = open_backend(backend, tmp_path, users)
+    use_views(data_manager)
+    rng = random.Random(7)
+    titles = [movie for user in users.values() for movie in user["movies"].values()]
+    for step in range(60):
+        user_id = str(rng.randint(1, len(users)))
+        movies = user_movies(data_manager, user_id)
+        choice = rng.random()
+        if choice < 0.25 and movies:
+            data_manager.delete_user_movie(user_id, rng.choice(list(movies)))
+        elif choice < 0.5 and movies:
+            data_manager.update_user_movie(user_id, rng.choice(list(movies)),
+                                           {"rating": round(rng.uniform(1, 10), 1)})
+        elif choice < 0.6:
+            data_manager.add_user(f"Viewer {step}")
+        elif choice < 0.8:
+            movie = rng.choice(titles)
+            data_manager.add_user_movie(user_id, movie["name"], movie["director"],
+                                        movie["year"], movie["rating"], movie["poster"])
+        else:
+            data_manager.apply([
+                {"op": "add_movie", "user_id": user_id, "movie": dict(rng.choice(titles))},
+                {"op": "add_movie", "user_id": user_id, "movie": dict(rng.choice(titles))}])
+        if step % 10 == 0:
+            use_views(data_manager)
+            assert data_manager.check_views() == []
+    use_views(data_manager)
+    assert data_manager.check_views() == []
+
+
+@pytest.mark.parametrize("backend", CACHED_BACKENDS)
+def test_views_follow_writes_of_another_instance(backend, tmp_path, users):
+    reader, filename = open_backend(backend, tmp_path, users)
+    use_views(reader)
+    counts = dict(reader.get_movie_count_per_year())
+    writer = type(reader)(filename)
+    writer.add_user_movie("1", "Zebra Crossing", "Agnes Varda", 1977, 9.9, "poster")
+    assert {"name": "Zebra Crossing", "director": "Agnes Varda", "year": 1977,
+            "rating": 9.9, "poster": "poster"} in reader.create_movie_list()
+    assert dict(reader.get_movie_count_per_year()).get(1977, 0) == counts.get(1977, 0) + 1
+    assert reader.check_views() == []
+    assert all_movies(reader) == all_movies(writer)
+
+
+@pytest.mark.parametrize("backend", CACHED_BACKENDS)
+def test_movie_list_matches_uncached_json(backend, tmp_path):
+    users = generate_users(60, 6, distinct_movies=20, seed=3)
+    data_manager, _ = open_backend(backend, tmp_path, users)
+    reference, _ = open_backend("json", tmp_path, users)
+    for manager in (data_manager, reference):
+        manager.delete_user_movie("2", "1")
+        manager.update_user_movie("3", "1", {"rating": 1.5})
+    assert data_manager.create_movie_list() == reference.create_movie_list()